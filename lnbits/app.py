@@ -25,7 +25,7 @@ from lnbits.core.crud.extensions import create_installed_extension
 from lnbits.core.helpers import migrate_extension_database
 from lnbits.core.services.extensions import deactivate_extension, get_valid_extensions
 from lnbits.core.tasks import (  # watchdog_task
-    audit_queue,
+    audit_writer,
     killswitch_task,
     purge_audit_data,
     wait_for_audit_data,
@@ -33,6 +33,8 @@ from lnbits.core.tasks import (  # watchdog_task
 )
 from lnbits.exceptions import register_exception_handlers
 from lnbits.helpers import version_parse
+from lnbits.leader import leader_election
+from lnbits.pubsub import pubsub
 from lnbits.settings import settings
 from lnbits.tasks import (
     cancel_all_tasks,
@@ -51,7 +53,12 @@ from .commands import migrate_databases
 from .core import init_core_routers
 from .core.db import core_app_extra
 from .core.models.extensions import Extension, ExtensionMeta, InstallableExtension
-from .core.services import check_admin_settings, check_webpush_settings
+from .core.services import (
+    check_admin_settings,
+    check_webpush_settings,
+    webhook_outbox,
+    webpush_sender,
+)
 from .middleware import (
     AuditMiddleware,
     CustomGZipMiddleware,
@@ -73,12 +80,14 @@ from .tasks import (
 async def startup(app: FastAPI):
     settings.lnbits_running = True
 
-    # wait till migration is done
-    await migrate_databases()
+    # with `--workers` the processes must not migrate at the same time
+    async with leader_election.startup_lock():
+        # wait till migration is done
+        await migrate_databases()
 
-    # setup admin settings
-    await check_admin_settings()
-    await check_webpush_settings()
+        # setup admin settings
+        await check_admin_settings()
+        await check_webpush_settings()
 
     log_server_info()
 
@@ -108,8 +117,13 @@ async def shutdown():
 
     # wait a bit to allow them to finish, so that cleanup can run without problems
     await asyncio.sleep(0.1)
+    await audit_writer.flush()
     funding_source = get_funding_source()
     await funding_source.cleanup()
+    await webhook_outbox.close()
+    await webpush_sender.close()
+    await pubsub.close()
+    await leader_election.close()
 
 
 @asynccontextmanager
@@ -154,7 +168,7 @@ def create_app() -> FastAPI:
         CustomGZipMiddleware, minimum_size=1000, exclude_paths=["/api/v1/payments/sse"]
     )
 
-    app.add_middleware(AuditMiddleware, audit_queue=audit_queue)
+    app.add_middleware(AuditMiddleware, audit_writer=audit_writer)
 
     # required for SSO login
     app.add_middleware(SessionMiddleware, secret_key=settings.auth_secret_key)
@@ -441,8 +455,6 @@ def register_async_tasks(app: FastAPI):
         create_task(check_and_register_extensions(app))
 
     create_permanent_task(wait_for_audit_data)
-    create_permanent_task(check_pending_payments)
-    create_permanent_task(invoice_listener)
     create_permanent_task(internal_invoice_listener)
     create_permanent_task(cache.invalidate_forever)
 
@@ -451,10 +463,18 @@ def register_async_tasks(app: FastAPI):
     register_invoice_listener(invoice_queue, "core")
     create_permanent_task(lambda: wait_for_paid_invoices(invoice_queue))
 
+    # every process delivers, the deliveries are claimed atomically
+    create_permanent_task(webhook_outbox.run_forever)
+    create_permanent_task(pubsub.run_forever)
+
+    # tasks which must run in only one process with `--workers`
+    leader_election.register(check_pending_payments)
+    leader_election.register(invoice_listener)
     # TODO: implement watchdog properly
-    # create_permanent_task(watchdog_task)
-    create_permanent_task(killswitch_task)
-    create_permanent_task(purge_audit_data)
+    # leader_election.register(watchdog_task)
+    leader_election.register(killswitch_task)
+    leader_election.register(purge_audit_data)
+    create_permanent_task(leader_election.run_forever)
 
     # server logs for websocket
     if settings.lnbits_admin_ui:
@@ -22,6 +22,8 @@ from lnbits.core.crud import (
     get_installed_extensions,
     get_payment,
     get_payments,
+    get_wallet_balance_mismatches,
+    rebuild_wallet_balances,
     remove_deleted_wallets,
     update_payment,
 )
@@ -190,6 +192,23 @@ async def database_cleanup_accounts(days: Optional[int] = None):
         await delete_accounts_no_wallets(delta, conn)
 
 
+@db.command("check-balances")
+@click.option(
+    "-r", "--rebuild", is_flag=True, help="Rebuild the ledger from the payments."
+)
+@coro
+async def database_check_balances(rebuild: bool = False):
+    """Check the wallet balances ledger against the payments"""
+    async with core_db.connect() as conn:
+        mismatches = await get_wallet_balance_mismatches(conn)
+        for wallet_id, (ledger, payments) in mismatches.items():
+            click.echo(f"Wallet '{wallet_id}': ledger {ledger}, payments {payments}")
+        click.echo(f"Mismatched wallet balances: {len(mismatches)}")
+        if rebuild and mismatches:
+            await rebuild_wallet_balances(conn)
+            click.echo("Wallet balances rebuilt.")
+
+
 @db.command("check-payments")
 @click.option("-d", "--days", help="Maximum age of payments in days.")
 @click.option("-l", "--limit", help="Maximum number of payments to be checked.")
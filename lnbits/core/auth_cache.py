@@ -0,0 +1,144 @@
+import json
+from collections import OrderedDict
+from functools import partial
+from time import time
+from typing import NamedTuple, Optional
+
+from loguru import logger
+
+from lnbits.core.models import Wallet
+from lnbits.db import Connection
+from lnbits.pubsub import pubsub
+from lnbits.settings import settings
+
+
+class CachedWallet(NamedTuple):
+    wallet: Wallet
+    expiry: float
+
+
+class CachedExtensions(NamedTuple):
+    extension_ids: list[str]
+    expiry: float
+
+
+class AuthCache:
+    """
+    Keeps the wallets of the recently used api keys and the active extensions
+    of their users in memory, so most requests are authenticated without a
+    database query. The wallets are kept without their balance. Entries expire
+    after `auth_cache_ttl` seconds and are removed from every LNbits process
+    as soon as a change of the wallet or of the user extensions is committed.
+    """
+
+    def __init__(
+        self, max_size: Optional[int] = None, ttl: Optional[float] = None
+    ) -> None:
+        self.max_size = max_size or settings.auth_cache_size
+        self.ttl = ttl if ttl is not None else settings.auth_cache_ttl
+        self._wallets: OrderedDict[str, CachedWallet] = OrderedDict()
+        self._extensions: OrderedDict[str, CachedExtensions] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_wallet(self, key: str) -> Optional[Wallet]:
+        cached = self._wallets.get(key)
+        if not cached or cached.expiry < time():
+            self._wallets.pop(key, None)
+            self.misses += 1
+            return None
+        self._wallets.move_to_end(key)
+        self.hits += 1
+        return cached.wallet
+
+    def set_wallet(self, key: str, wallet: Wallet) -> None:
+        if self.ttl <= 0:
+            return
+        self._wallets[key] = CachedWallet(wallet, time() + self.ttl)
+        self._wallets.move_to_end(key)
+        if len(self._wallets) > self.max_size:
+            self._wallets.popitem(last=False)
+
+    def get_extensions(self, user_id: str) -> Optional[list[str]]:
+        cached = self._extensions.get(user_id)
+        if not cached or cached.expiry < time():
+            self._extensions.pop(user_id, None)
+            return None
+        self._extensions.move_to_end(user_id)
+        return cached.extension_ids
+
+    def set_extensions(self, user_id: str, extension_ids: list[str]) -> None:
+        if self.ttl <= 0:
+            return
+        self._extensions[user_id] = CachedExtensions(extension_ids, time() + self.ttl)
+        self._extensions.move_to_end(user_id)
+        if len(self._extensions) > self.max_size:
+            self._extensions.popitem(last=False)
+
+    async def invalidate_wallet(
+        self, wallet_id: str, conn: Optional[Connection] = None
+    ) -> None:
+        """Removes the keys of `wallet_id` in all processes, once `conn` commits."""
+        await self._invalidate({"wallet": wallet_id}, conn)
+
+    async def invalidate_user(
+        self, user_id: str, conn: Optional[Connection] = None
+    ) -> None:
+        """Removes the extensions of `user_id` in all processes, once `conn` commits."""
+        await self._invalidate({"user": user_id}, conn)
+
+    async def invalidate_all(self, conn: Optional[Connection] = None) -> None:
+        await self._invalidate({}, conn)
+
+    def forget(self, message: dict) -> None:
+        if "wallet" in message:
+            self.forget_wallet(message["wallet"])
+        elif "user" in message:
+            self.forget_user(message["user"])
+        else:
+            self.clear()
+
+    def forget_wallet(self, wallet_id: str) -> None:
+        self.invalidations += 1
+        keys = [k for k, v in self._wallets.items() if v.wallet.id == wallet_id]
+        for key in keys:
+            self._wallets.pop(key, None)
+
+    def forget_user(self, user_id: str) -> None:
+        self.invalidations += 1
+        self._extensions.pop(user_id, None)
+
+    def clear(self) -> None:
+        self.invalidations += 1
+        self._wallets.clear()
+        self._extensions.clear()
+
+    async def _invalidate(self, message: dict, conn: Optional[Connection]) -> None:
+        if conn:
+            # until the commit the old row can be read and cached again
+            await conn.after_commit(partial(self._invalidate, message, None))
+            return
+        self.forget(message)
+        await pubsub.publish("auth_cache", json.dumps(message))
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._wallets),
+            "users": len(self._extensions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+auth_cache = AuthCache()
+
+
+async def _on_auth_cache_message(data: str):
+    message = json.loads(data)
+    auth_cache.forget(message)
+    logger.trace(f"auth cache invalidated: {message}")
+
+
+pubsub.subscribe("auth_cache", _on_auth_cache_message)
@@ -1,4 +1,4 @@
-from .audit import create_audit_entry
+from .audit import create_audit_entries, create_audit_entry
 from .db_versions import (
     delete_dbversion,
     get_db_version,
@@ -8,6 +8,7 @@ from .db_versions import (
 from .extensions import (
     create_installed_extension,
     create_user_extension,
+    create_user_extensions,
     delete_installed_extension,
     drop_extension_db,
     get_installed_extension,
@@ -18,11 +19,13 @@ from .extensions import (
     update_installed_extension,
     update_installed_extension_state,
     update_user_extension,
+    update_user_extensions_state,
 )
 from .payments import (
     DateTrunc,
     check_internal,
     create_payment,
+    create_payments,
     delete_expired_invoices,
     delete_wallet_payment,
     get_latest_payments_by_extension,
@@ -33,6 +36,8 @@ from .payments import (
     get_standalone_payment,
     get_wallet_payment,
     is_internal_status_success,
+    lock_incoming_payment,
+    lock_payment_hash,
     mark_webhook_sent,
     update_payment,
     update_payment_checking_id,
@@ -67,23 +72,38 @@ from .wallets import (
     delete_wallet,
     delete_wallet_by_id,
     force_delete_wallet,
+    get_cached_wallet_for_key,
     get_total_balance,
     get_wallet,
+    get_wallet_balance,
+    get_wallet_balance_mismatches,
     get_wallet_for_key,
     get_wallets,
+    increment_wallet_balance,
+    lock_wallet_balance,
+    lock_wallet_balances,
+    rebuild_wallet_balances,
     remove_deleted_wallets,
     update_wallet,
 )
+from .webhooks import (
+    claim_due_webhook_deliveries,
+    create_webhook_delivery,
+    get_stuck_webhook_deliveries,
+    update_webhook_deliveries,
+)
 from .webpush import (
     create_webpush_subscription,
     delete_webpush_subscription,
     delete_webpush_subscriptions,
+    delete_webpush_subscriptions_by_endpoints,
     get_webpush_subscription,
     get_webpush_subscriptions_for_user,
 )
 
 __all__ = [
     # audit
+    "create_audit_entries",
     "create_audit_entry",
     # db_versions
     "get_db_version",
@@ -93,6 +113,7 @@ __all__ = [
     # extensions
     "create_installed_extension",
     "create_user_extension",
+    "create_user_extensions",
     "delete_installed_extension",
     "drop_extension_db",
     "get_installed_extension",
@@ -102,11 +123,13 @@ __all__ = [
     "update_installed_extension",
     "update_installed_extension_state",
     "update_user_extension",
+    "update_user_extensions_state",
     "get_user_extensions",
     # payments
     "DateTrunc",
     "check_internal",
     "create_payment",
+    "create_payments",
     "delete_expired_invoices",
     "delete_wallet_payment",
     "get_latest_payments_by_extension",
@@ -117,6 +140,8 @@ __all__ = [
     "get_standalone_payment",
     "get_wallet_payment",
     "is_internal_status_success",
+    "lock_incoming_payment",
+    "lock_payment_hash",
     "mark_webhook_sent",
     "update_payment",
     "update_payment_checking_id",
@@ -152,16 +177,29 @@ __all__ = [
     "delete_wallet",
     "delete_wallet_by_id",
     "force_delete_wallet",
+    "get_cached_wallet_for_key",
     "get_total_balance",
     "get_wallet",
+    "get_wallet_balance",
+    "get_wallet_balance_mismatches",
     "get_wallet_for_key",
     "get_wallets",
+    "increment_wallet_balance",
+    "lock_wallet_balance",
+    "lock_wallet_balances",
+    "rebuild_wallet_balances",
     "remove_deleted_wallets",
     "update_wallet",
+    # webhooks
+    "claim_due_webhook_deliveries",
+    "create_webhook_delivery",
+    "get_stuck_webhook_deliveries",
+    "update_webhook_deliveries",
     # webpush
     "create_webpush_subscription",
     "delete_webpush_subscription",
     "delete_webpush_subscriptions",
+    "delete_webpush_subscriptions_by_endpoints",
     "get_webpush_subscription",
     "get_webpush_subscriptions_for_user",
 ]
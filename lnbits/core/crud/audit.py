@@ -13,6 +13,13 @@ async def create_audit_entry(
     await (conn or db).insert("audit", entry)
 
 
+async def create_audit_entries(
+    entries: list[AuditEntry],
+    conn: Optional[Connection] = None,
+) -> None:
+    await (conn or db).insert_many("audit", entries)
+
+
 async def get_audit_entries(
     filters: Optional[Filters[AuditFilters]] = None,
     conn: Optional[Connection] = None,
@@ -1,5 +1,6 @@
 from typing import Optional
 
+from lnbits.core.auth_cache import auth_cache
 from lnbits.core.db import db
 from lnbits.core.models.extensions import (
     InstallableExtension,
@@ -115,6 +116,15 @@ async def create_user_extension(
     user_extension: UserExtension, conn: Optional[Connection] = None
 ) -> None:
     await (conn or db).insert("extensions", user_extension)
+    await auth_cache.invalidate_user(user_extension.user, conn)
+
+
+async def create_user_extensions(
+    user_extensions: list[UserExtension], conn: Optional[Connection] = None
+) -> None:
+    await (conn or db).insert_many("extensions", user_extensions)
+    for user_id in {ext.user for ext in user_extensions}:
+        await auth_cache.invalidate_user(user_id, conn)
 
 
 async def update_user_extension(
@@ -122,6 +132,16 @@ async def update_user_extension(
 ) -> None:
     where = """WHERE extension = :extension AND "user" = :user"""
     await (conn or db).update("extensions", user_extension, where)
+    await auth_cache.invalidate_user(user_extension.user, conn)
+
+
+async def update_user_extensions_state(
+    user_extensions: list[UserExtension], conn: Optional[Connection] = None
+) -> None:
+    where = """WHERE extension = :extension AND "user" = :user"""
+    await (conn or db).update_many("extensions", user_extensions, where)
+    for user_id in {ext.user for ext in user_extensions}:
+        await auth_cache.invalidate_user(user_id, conn)
 
 
 async def get_user_active_extensions_ids(
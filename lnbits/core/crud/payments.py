@@ -1,10 +1,14 @@
 from time import time
 from typing import Literal, Optional
 
-from lnbits.core.crud.wallets import get_total_balance, get_wallet
+from lnbits.core.crud.wallets import (
+    get_total_balance,
+    get_wallet,
+    increment_wallet_balance,
+)
 from lnbits.core.db import db
 from lnbits.core.models import PaymentState
-from lnbits.db import DB_TYPE, SQLITE, Connection, Filters, Page
+from lnbits.db import DB_TYPE, POSTGRES, SQLITE, Connection, Filters, Page
 
 from ..models import (
     CreatePayment,
@@ -25,6 +29,38 @@ def update_payment_extra():
     pass
 
 
+def _balance_amount(status: str, amount: int, fee: int) -> int:
+    """
+    How much a payment in the given state adds to the wallet balance. Must match
+    the `balances` view: settled incoming and settled or pending outgoing payments.
+    """
+    if status == PaymentState.SUCCESS.value and amount > 0:
+        return amount - abs(fee)
+    if (
+        status in (PaymentState.SUCCESS.value, PaymentState.PENDING.value)
+        and amount < 0
+    ):
+        return amount - abs(fee)
+    return 0
+
+
+async def _lock_payment_balance(checking_id: str, conn: Connection) -> Optional[dict]:
+    """
+    Reads the balance relevant fields of a payment before it is changed. On
+    Postgres the row stays locked until the change is committed, so concurrent
+    status updates can not apply the same balance change twice. SQLite writers
+    are already serialized by the database lock.
+    """
+    for_update = "" if conn.type == SQLITE else "FOR UPDATE"
+    return await conn.fetchone(
+        f"""
+        SELECT status, amount, fee FROM apipayments
+        WHERE checking_id = :checking_id {for_update}
+        """,
+        {"checking_id": checking_id},
+    )
+
+
 async def get_payment(checking_id: str, conn: Optional[Connection] = None) -> Payment:
     return await (conn or db).fetchone(
         "SELECT * FROM apipayments WHERE checking_id = :checking_id",
@@ -152,6 +188,7 @@ async def get_payments_paginated(
         values,
         filters=filters,
         model=Payment,
+        cursor_key="checking_id",
     )
 
 
@@ -245,11 +282,27 @@ async def create_payment(
         extra=data.extra or {},
     )
 
-    await (conn or db).insert("apipayments", payment)
+    async with db.transaction(conn) as new_conn:
+        await new_conn.insert("apipayments", payment)
+        amount = _balance_amount(payment.status, payment.amount, payment.fee)
+        if amount:
+            await increment_wallet_balance(payment.wallet_id, amount, new_conn)
 
     return payment
 
 
+async def create_payments(
+    payments: list[Payment], conn: Optional[Connection] = None
+) -> None:
+    """Inserts many new payments with one statement, e.g. a batch of invoices."""
+    async with db.transaction(conn) as new_conn:
+        await new_conn.insert_many("apipayments", payments)
+        for payment in payments:
+            amount = _balance_amount(payment.status, payment.amount, payment.fee)
+            if amount:
+                await increment_wallet_balance(payment.wallet_id, amount, new_conn)
+
+
 async def update_payment_checking_id(
     checking_id: str, new_checking_id: str, conn: Optional[Connection] = None
 ) -> None:
@@ -264,11 +317,20 @@ async def update_payment(
     new_checking_id: Optional[str] = None,
     conn: Optional[Connection] = None,
 ) -> None:
-    await (conn or db).update(
-        "apipayments", payment, "WHERE checking_id = :checking_id"
-    )
-    if new_checking_id and new_checking_id != payment.checking_id:
-        await update_payment_checking_id(payment.checking_id, new_checking_id, conn)
+    async with db.transaction(conn) as new_conn:
+        previous = await _lock_payment_balance(payment.checking_id, new_conn)
+        await new_conn.update(
+            "apipayments", payment, "WHERE checking_id = :checking_id"
+        )
+        if previous:
+            amount = _balance_amount(payment.status, payment.amount, payment.fee)
+            amount -= _balance_amount(**previous)
+            if amount:
+                await increment_wallet_balance(payment.wallet_id, amount, new_conn)
+        if new_checking_id and new_checking_id != payment.checking_id:
+            await update_payment_checking_id(
+                payment.checking_id, new_checking_id, new_conn
+            )
 
 
 async def get_payments_history(
@@ -333,10 +395,19 @@ async def get_payments_history(
 async def delete_wallet_payment(
     checking_id: str, wallet_id: str, conn: Optional[Connection] = None
 ) -> None:
-    await (conn or db).execute(
-        "DELETE FROM apipayments WHERE checking_id = :checking_id AND wallet = :wallet",
-        {"checking_id": checking_id, "wallet": wallet_id},
-    )
+    async with db.transaction(conn) as new_conn:
+        previous = await _lock_payment_balance(checking_id, new_conn)
+        result = await new_conn.execute(
+            """
+            DELETE FROM apipayments
+            WHERE checking_id = :checking_id AND wallet_id = :wallet
+            """,
+            {"checking_id": checking_id, "wallet": wallet_id},
+        )
+        if previous and result.rowcount:
+            amount = _balance_amount(**previous)
+            if amount:
+                await increment_wallet_balance(wallet_id, -amount, new_conn)
 
 
 async def check_internal(
@@ -356,6 +427,38 @@ async def check_internal(
     )
 
 
+async def lock_incoming_payment(
+    checking_id: str, conn: Connection
+) -> Optional[Payment]:
+    """
+    Reads an incoming payment inside of a transaction. On Postgres the row stays
+    locked until the transaction ends, so an invoice is only paid by one payer.
+    SQLite writers are already serialized by the database lock.
+    """
+    for_update = "" if conn.type == SQLITE else "FOR UPDATE"
+    return await conn.fetchone(
+        f"""
+        SELECT * FROM apipayments
+        WHERE checking_id = :checking_id AND amount > 0 {for_update}
+        """,
+        {"checking_id": checking_id},
+        Payment,
+    )
+
+
+async def lock_payment_hash(payment_hash: str, conn: Connection) -> None:
+    """
+    Serializes the transactions which create payments for `payment_hash` until
+    they end, the payments do not exist yet so there is no row to lock. On
+    Postgres with an advisory lock, SQLite writers are already serialized by the
+    database lock and CockroachDB aborts one of two conflicting transactions.
+    """
+    if conn.type == POSTGRES:
+        await conn.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(:hash))", {"hash": payment_hash}
+        )
+
+
 async def is_internal_status_success(
     payment_hash: str, conn: Optional[Connection] = None
 ) -> bool:
@@ -375,8 +478,10 @@ async def is_internal_status_success(
     return payment.status == PaymentState.SUCCESS.value
 
 
-async def mark_webhook_sent(payment_hash: str, status: int) -> None:
-    await db.execute(
+async def mark_webhook_sent(
+    payment_hash: str, status: int, conn: Optional[Connection] = None
+) -> None:
+    await (conn or db).execute(
         """
         UPDATE apipayments SET webhook_status = :status
         WHERE payment_hash = :hash
@@ -4,7 +4,7 @@ from typing import Optional
 from uuid import uuid4
 
 from lnbits.core.crud.extensions import get_user_active_extensions_ids
-from lnbits.core.crud.wallets import get_wallets
+from lnbits.core.crud.wallets import get_wallets, wallet_balance_column
 from lnbits.core.db import db
 from lnbits.db import Connection, Filters, Page
 
@@ -47,16 +47,14 @@ async def get_accounts(
     conn: Optional[Connection] = None,
 ) -> Page[AccountOverview]:
     return await (conn or db).fetch_page(
-        """
+        f"""
         SELECT
             accounts.id,
             accounts.username,
             accounts.email,
             accounts.pubkey,
             wallets.id as wallet_id,
-            SUM(COALESCE((
-                SELECT balance FROM balances WHERE wallet_id = wallets.id
-            ), 0)) as balance_msat,
+            SUM({wallet_balance_column}) as balance_msat,
             SUM((
                 SELECT COUNT(*) FROM apipayments WHERE wallet_id = wallets.id
             )) as transaction_count,
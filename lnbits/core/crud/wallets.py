@@ -3,12 +3,22 @@ from time import time
 from typing import Optional
 from uuid import uuid4
 
+from lnbits.core.auth_cache import auth_cache
 from lnbits.core.db import db
-from lnbits.db import Connection
+from lnbits.db import SQLITE, Connection
 from lnbits.settings import settings
 
 from ..models import Wallet
 
+# balances are read from the `wallet_balances` ledger which is kept up to date
+# by the payment crud functions, deleted wallets always have a zero balance
+wallet_balance_column = """
+    COALESCE((
+        SELECT balance FROM wallet_balances
+        WHERE wallet_id = wallets.id AND wallets.deleted = false
+    ), 0)
+"""
+
 
 async def create_wallet(
     *,
@@ -34,6 +44,7 @@ async def update_wallet(
 ) -> Optional[Wallet]:
     wallet.updated_at = datetime.now(timezone.utc)
     await (conn or db).update("wallets", wallet)
+    await auth_cache.invalidate_wallet(wallet.id, conn)
     return wallet
 
 
@@ -53,6 +64,7 @@ async def delete_wallet(
         """,
         {"wallet": wallet_id, "user": user_id, "deleted": deleted, "now": now},
     )
+    await auth_cache.invalidate_wallet(wallet_id, conn)
 
 
 async def force_delete_wallet(
@@ -62,6 +74,7 @@ async def force_delete_wallet(
         "DELETE FROM wallets WHERE id = :wallet",
         {"wallet": wallet_id},
     )
+    await auth_cache.invalidate_wallet(wallet_id, conn)
 
 
 async def delete_wallet_by_id(
@@ -76,11 +89,13 @@ async def delete_wallet_by_id(
         """,
         {"wallet": wallet_id, "now": now},
     )
+    await auth_cache.invalidate_wallet(wallet_id, conn)
     return result.rowcount
 
 
 async def remove_deleted_wallets(conn: Optional[Connection] = None) -> None:
     await (conn or db).execute("DELETE FROM wallets WHERE deleted = true")
+    await auth_cache.invalidate_all(conn)
 
 
 async def delete_unused_wallets(
@@ -100,6 +115,7 @@ async def delete_unused_wallets(
         """,
         {"delta": delta},
     )
+    await auth_cache.invalidate_all(conn)
 
 
 async def get_wallet(
@@ -108,9 +124,7 @@ async def get_wallet(
     where = "AND deleted = :deleted" if deleted is not None else ""
     return await (conn or db).fetchone(
         f"""
-        SELECT *, COALESCE((
-            SELECT balance FROM balances WHERE wallet_id = wallets.id
-        ), 0) AS balance_msat FROM wallets
+        SELECT *, {wallet_balance_column} AS balance_msat FROM wallets
         WHERE id = :wallet {where}
         """,
         {"wallet": wallet_id, "deleted": deleted},
@@ -124,9 +138,7 @@ async def get_wallets(
     where = "AND deleted = :deleted" if deleted is not None else ""
     return await (conn or db).fetchall(
         f"""
-        SELECT *, COALESCE((
-            SELECT balance FROM balances WHERE wallet_id = wallets.id
-        ), 0) AS balance_msat FROM wallets
+        SELECT *, {wallet_balance_column} AS balance_msat FROM wallets
         WHERE "user" = :user {where}
         """,
         {"user": user_id, "deleted": deleted},
@@ -136,22 +148,155 @@ async def get_wallets(
 
 async def get_wallet_for_key(
     key: str,
+    deleted: Optional[bool] = False,
     conn: Optional[Connection] = None,
 ) -> Optional[Wallet]:
+    where = "AND deleted = :deleted" if deleted is not None else ""
     return await (conn or db).fetchone(
-        """
-        SELECT *, COALESCE((
-            SELECT balance FROM balances WHERE wallet_id = wallets.id
-        ), 0)
-        AS balance_msat FROM wallets
-        WHERE (adminkey = :key OR inkey = :key) AND deleted = false
+        f"""
+        SELECT *, {wallet_balance_column} AS balance_msat FROM wallets
+        WHERE (adminkey = :key OR inkey = :key) {where}
         """,
-        {"key": key},
+        {"key": key, "deleted": deleted},
         Wallet,
     )
 
 
+async def get_cached_wallet_for_key(key: str) -> Optional[Wallet]:
+    """
+    Like `get_wallet_for_key` but served from the `auth_cache`, so the
+    `balance_msat` of the wallet is not set, `KeyChecker` reads it. Keys of
+    deleted wallets are cached as well and return `None`.
+    """
+    wallet = auth_cache.get_wallet(key)
+    if not wallet:
+        wallet = await db.fetchone(
+            "SELECT * FROM wallets WHERE adminkey = :key OR inkey = :key",
+            {"key": key},
+            Wallet,
+        )
+        if not wallet:
+            return None
+        auth_cache.set_wallet(key, wallet)
+    return None if wallet.deleted else wallet.copy()
+
+
+async def get_wallet_balance(wallet_id: str, conn: Optional[Connection] = None) -> int:
+    """Balance of a wallet in msat from the `wallet_balances` ledger."""
+    row: dict = await (conn or db).fetchone(
+        "SELECT balance FROM wallet_balances WHERE wallet_id = :wallet",
+        {"wallet": wallet_id},
+    )
+    return int(row["balance"]) if row else 0
+
+
 async def get_total_balance(conn: Optional[Connection] = None):
-    result = await (conn or db).execute("SELECT SUM(balance) FROM balances")
-    row = result.mappings().first()
-    return row.get("balance", 0)
+    row: dict = await (conn or db).fetchone(
+        """
+        SELECT SUM(wallet_balances.balance) AS balance FROM wallet_balances
+        JOIN wallets ON wallets.id = wallet_balances.wallet_id
+        WHERE wallets.deleted = false
+        """
+    )
+    return row.get("balance") or 0
+
+
+async def increment_wallet_balance(
+    wallet_id: str, amount_msat: int, conn: Optional[Connection] = None
+) -> None:
+    """Adds `amount_msat` (can be negative) to the `wallet_balances` ledger."""
+    await (conn or db).execute(
+        """
+        INSERT INTO wallet_balances (wallet_id, balance) VALUES (:wallet, :amount)
+        ON CONFLICT (wallet_id) DO UPDATE
+        SET balance = wallet_balances.balance + excluded.balance
+        """,
+        {"wallet": wallet_id, "amount": amount_msat},
+    )
+
+
+async def lock_wallet_balance(wallet_id: str, conn: Connection) -> int:
+    """
+    Reads the `wallet_balances` ledger of a wallet inside of a transaction. On
+    Postgres the row stays locked until the transaction ends, so concurrent
+    payments from the same wallet are checked one after the other. SQLite
+    writers are already serialized by the database lock.
+    """
+    for_update = "" if conn.type == SQLITE else "FOR UPDATE"
+    row: dict = await conn.fetchone(
+        f"""
+        SELECT balance FROM wallet_balances
+        WHERE wallet_id = :wallet {for_update}
+        """,
+        {"wallet": wallet_id},
+    )
+    return int(row["balance"]) if row else 0
+
+
+async def lock_wallet_balances(wallet_ids: list[str], conn: Connection) -> None:
+    """
+    Locks the ledger rows of several wallets with `lock_wallet_balance`, always
+    in the same order, so transactions locking the same wallets can not deadlock.
+    """
+    for wallet_id in sorted(set(wallet_ids)):
+        await lock_wallet_balance(wallet_id, conn)
+
+
+# the balance of a wallet as computed from all of its payments, this is the
+# same sum as the `balances` view minus the filter on deleted wallets
+payments_balance_query = """
+    SELECT wallet_id, SUM(amount - ABS(fee)) AS balance
+    FROM apipayments
+    WHERE (status = 'success' AND amount > 0)
+    OR (status IN ('success', 'pending') AND amount < 0)
+    GROUP BY wallet_id
+"""
+
+
+async def get_wallet_balance_mismatches(
+    conn: Optional[Connection] = None,
+) -> dict[str, tuple[int, int]]:
+    """
+    Compares the `wallet_balances` ledger with the balances computed from the
+    payments. Returns `{wallet_id: (ledger_balance, payments_balance)}` for every
+    wallet where the two differ.
+    """
+    ledger_rows: list[dict] = await (conn or db).fetchall(
+        "SELECT wallet_id, balance FROM wallet_balances"
+    )
+    payments_rows: list[dict] = await (conn or db).fetchall(payments_balance_query)
+    ledger = {row["wallet_id"]: int(row["balance"]) for row in ledger_rows}
+    payments = {row["wallet_id"]: int(row["balance"]) for row in payments_rows}
+
+    mismatches = {}
+    for wallet_id in ledger.keys() | payments.keys():
+        ledger_balance = ledger.get(wallet_id, 0)
+        payments_balance = payments.get(wallet_id, 0)
+        if ledger_balance != payments_balance:
+            mismatches[wallet_id] = (ledger_balance, payments_balance)
+    return mismatches
+
+
+async def rebuild_wallet_balances(conn: Optional[Connection] = None) -> None:
+    """Recomputes the `wallet_balances` ledger from the payments table."""
+    await (conn or db).execute(
+        f"""
+        INSERT INTO wallet_balances (wallet_id, balance)
+        SELECT wallet_id, balance FROM ({payments_balance_query}) AS computed
+        WHERE true
+        ON CONFLICT (wallet_id) DO UPDATE SET balance = excluded.balance
+        """
+    )
+    await (conn or db).execute(
+        """
+        UPDATE wallet_balances SET balance = 0
+        WHERE NOT EXISTS (
+            SELECT 1 FROM apipayments
+            WHERE apipayments.wallet_id = wallet_balances.wallet_id
+            AND (
+                (status = 'success' AND amount > 0)
+                OR (status IN ('success', 'pending') AND amount < 0)
+            )
+        )
+        """
+    )
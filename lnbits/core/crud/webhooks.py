@@ -0,0 +1,87 @@
+from datetime import datetime
+from time import time
+from typing import Optional
+
+from lnbits.core.db import db
+from lnbits.db import DB_TYPE, POSTGRES, Connection
+
+from ..models import WebhookDelivery, WebhookStatus
+from .payments import mark_webhook_sent
+
+
+async def create_webhook_delivery(
+    delivery: WebhookDelivery, conn: Optional[Connection] = None
+) -> None:
+    await (conn or db).insert("webhook_outbox", delivery)
+
+
+async def claim_due_webhook_deliveries(
+    limit: int, lease_until: datetime, conn: Optional[Connection] = None
+) -> list[WebhookDelivery]:
+    """
+    Claims the due deliveries by moving their `next_attempt_at` to `lease_until`
+    and returns them. It is one statement, so a delivery is only claimed by one
+    consumer even if several LNbits processes share the outbox.
+    """
+    # rows locked by another consumer are skipped instead of waited for
+    skip_locked = "FOR UPDATE SKIP LOCKED" if DB_TYPE == POSTGRES else ""
+    async with db.transaction(conn) as new_conn:
+        return await new_conn.fetchall(
+            f"""
+            UPDATE webhook_outbox
+            SET next_attempt_at = {db.timestamp_placeholder("lease_until")}
+            WHERE id IN (
+                SELECT id FROM webhook_outbox
+                WHERE status = :status
+                AND next_attempt_at <= {db.timestamp_placeholder("now")}
+                ORDER BY next_attempt_at LIMIT :limit
+                {skip_locked}
+            )
+            AND status = :status
+            AND next_attempt_at <= {db.timestamp_placeholder("now")}
+            RETURNING *
+            """,
+            {
+                "status": WebhookStatus.PENDING.value,
+                "now": time(),
+                "lease_until": lease_until,
+                "limit": limit,
+            },
+            WebhookDelivery,
+        )
+
+
+async def get_stuck_webhook_deliveries(
+    limit: int = 100, conn: Optional[Connection] = None
+) -> list[WebhookDelivery]:
+    """Deliveries which failed for good or failed at least once and are retried."""
+    return await (conn or db).fetchall(
+        """
+        SELECT * FROM webhook_outbox
+        WHERE status = :failed OR (status = :pending AND attempts > 0)
+        ORDER BY created_at LIMIT :limit
+        """,
+        {
+            "failed": WebhookStatus.FAILED.value,
+            "pending": WebhookStatus.PENDING.value,
+            "limit": limit,
+        },
+        WebhookDelivery,
+    )
+
+
+async def update_webhook_deliveries(
+    deliveries: list[WebhookDelivery], conn: Optional[Connection] = None
+) -> None:
+    """
+    Saves many deliveries with one statement and marks the webhook status of the
+    payments whose deliveries are finished, in one transaction.
+    """
+    async with db.transaction(conn) as new_conn:
+        await new_conn.update_many("webhook_outbox", deliveries)
+        for delivery in deliveries:
+            if delivery.pending:
+                continue
+            await mark_webhook_sent(
+                delivery.payment_hash, delivery.response_code or -1, new_conn
+            )
@@ -57,3 +57,15 @@ async def delete_webpush_subscriptions(endpoint: str) -> int:
         {"endpoint": endpoint},
     )
     return resp.rowcount
+
+
+async def delete_webpush_subscriptions_by_endpoints(endpoints: list[str]) -> int:
+    if not endpoints:
+        return 0
+    values = {f"endpoint_{i}": endpoint for i, endpoint in enumerate(endpoints)}
+    placeholders = ", ".join(f":{key}" for key in values)
+    resp = await db.execute(
+        f"DELETE FROM webpush_subscriptions WHERE endpoint IN ({placeholders})",
+        values,
+    )
+    return resp.rowcount
@@ -684,3 +684,80 @@ async def m029_create_audit_table(db: Connection):
         );
         """
     )
+
+
+async def m030_create_wallet_balances_table(db: Connection):
+    """
+    Wallet balances are kept in a ledger table updated together with the payments,
+    instead of summing all payments of a wallet on every lookup.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS wallet_balances (
+            wallet_id TEXT PRIMARY KEY,
+            balance {db.big_int} NOT NULL DEFAULT 0
+        );
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO wallet_balances (wallet_id, balance)
+        SELECT wallet_id, SUM(amount - ABS(fee)) FROM apipayments
+        WHERE (status = 'success' AND amount > 0)
+        OR (status IN ('success', 'pending') AND amount < 0)
+        GROUP BY wallet_id
+        """
+    )
+
+
+async def m031_add_indexes(db: Connection):
+    """
+    Indexes for the lookups done on every request and by the background tasks.
+    """
+    indexes = [
+        "apipayments_checking_id ON apipayments (checking_id)",
+        "apipayments_wallet_id_time ON apipayments (wallet_id, time)",
+        "apipayments_status_time ON apipayments (status, time)",
+        # only pending incoming invoices are deleted when they expire
+        """apipayments_pending_expiry ON apipayments (expiry)
+        WHERE status = 'pending' AND amount > 0""",
+        'wallets_user ON wallets ("user")',
+        "wallets_adminkey ON wallets (adminkey)",
+        "wallets_inkey ON wallets (inkey)",
+        "accounts_username ON accounts (username)",
+        "accounts_email ON accounts (email)",
+        "accounts_pubkey ON accounts (pubkey)",
+        "audit_delete_at ON audit (delete_at)",
+    ]
+    for index in indexes:
+        await db.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+
+
+async def m032_create_webhook_outbox(db: Connection):
+    """
+    Webhooks are delivered from an outbox table, so they are retried and survive
+    a restart.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS webhook_outbox (
+            id TEXT PRIMARY KEY,
+            payment_hash TEXT NOT NULL,
+            url TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            response_code INTEGER,
+            error TEXT,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now},
+            created_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now},
+            updated_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    await db.execute(
+        """
+        CREATE INDEX IF NOT EXISTS webhook_outbox_status_next_attempt
+        ON webhook_outbox (status, next_attempt_at)
+        """
+    )
@@ -10,9 +10,13 @@ from .misc import (
 )
 from .payments import (
     CreateInvoice,
+    CreateInvoices,
+    CreateInvoicesResult,
     CreatePayment,
     DecodePayment,
     PayInvoice,
+    PayInvoiceResult,
+    PayInvoices,
     Payment,
     PaymentExtra,
     PaymentFilters,
@@ -39,6 +43,7 @@ from .users import (
     UserExtra,
 )
 from .wallets import BaseWallet, CreateWallet, KeyType, Wallet, WalletTypeInfo
+from .webhooks import WebhookDelivery, WebhookStatus
 from .webpush import CreateWebPushSubscription, WebPushSubscription
 
 __all__ = [
@@ -58,9 +63,13 @@ __all__ = [
     "SimpleStatus",
     # payments
     "CreateInvoice",
+    "CreateInvoices",
+    "CreateInvoicesResult",
     "CreatePayment",
     "DecodePayment",
     "PayInvoice",
+    "PayInvoiceResult",
+    "PayInvoices",
     "Payment",
     "PaymentExtra",
     "PaymentFilters",
@@ -91,6 +100,9 @@ __all__ = [
     "KeyType",
     "Wallet",
     "WalletTypeInfo",
+    # webhooks
+    "WebhookDelivery",
+    "WebhookStatus",
     # webpush
     "CreateWebPushSubscription",
     "WebPushSubscription",
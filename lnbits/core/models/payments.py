@@ -40,6 +40,22 @@ class PayInvoice(BaseModel):
     extra: Optional[dict] = {}
 
 
+class PayInvoices(BaseModel):
+    payment_requests: list[str] = Field(..., min_items=1)
+    max_sat: Optional[int] = None
+    extra: Optional[dict] = {}
+
+
+class PayInvoiceResult(BaseModel):
+    payment_request: str
+    payment_hash: Optional[str] = None
+    checking_id: Optional[str] = None
+    status: PaymentState = PaymentState.FAILED
+    fee_msat: Optional[int] = None
+    preimage: Optional[str] = None
+    error: Optional[str] = None
+
+
 class CreatePayment(BaseModel):
     wallet_id: str
     payment_hash: str
@@ -61,7 +77,7 @@ class Payment(BaseModel):
     fee: int
     bolt11: str
     status: str = PaymentState.PENDING
-    memo: Optional[str] = None
+    memo: Optional[str] = Field(default=None, sanitize=True)
     expiry: Optional[datetime] = None
     webhook: Optional[str] = None
     webhook_status: Optional[int] = None
@@ -174,3 +190,26 @@ class CreateInvoice(BaseModel):
         if v != "sat" and v not in allowed_currencies():
             raise ValueError("The provided unit is not supported")
         return v
+
+
+class CreateInvoices(BaseModel):
+    amounts: list[float] = Field(..., min_items=1)
+    unit: str = "sat"
+    internal: bool = False
+    memo: Optional[str] = None
+    expiry: Optional[int] = None
+    extra: Optional[dict] = None
+    webhook: Optional[str] = None
+
+    @validator("unit")
+    @classmethod
+    def unit_is_from_allowed_currencies(cls, v):
+        if v != "sat" and v not in allowed_currencies():
+            raise ValueError("The provided unit is not supported")
+        return v
+
+
+class CreateInvoicesResult(BaseModel):
+    invoices: list[Payment] = []
+    # why the remaining invoices were not created, the `invoices` are saved
+    error: Optional[str] = None
@@ -26,7 +26,7 @@ class BaseWallet(BaseModel):
 class Wallet(BaseModel):
     id: str
     user: str
-    name: str
+    name: str = Field(..., sanitize=True)
     adminkey: str
     inkey: str
     deleted: bool = False
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional
+from urllib.parse import urlparse
+
+from pydantic import BaseModel, Field
+
+
+class WebhookStatus(str, Enum):
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class WebhookDelivery(BaseModel):
+    id: str
+    payment_hash: str
+    url: str
+    payload: dict = {}
+    status: str = WebhookStatus.PENDING
+    attempts: int = 0
+    response_code: Optional[int] = None
+    error: Optional[str] = None
+    next_attempt_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc)
+    )
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.url).netloc
+
+    @property
+    def pending(self) -> bool:
+        return self.status == WebhookStatus.PENDING.value
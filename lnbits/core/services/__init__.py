@@ -8,16 +8,20 @@ from .payments import (
     check_transaction_status,
     check_wallet_limits,
     create_invoice,
+    create_invoices,
     fee_reserve,
     fee_reserve_total,
     pay_invoice,
+    pay_invoices,
     send_payment_notification,
     service_fee,
     update_pending_payments,
+    update_pending_payments_in_background,
     update_wallet_balance,
 )
 from .settings import (
     check_webpush_settings,
+    publish_settings_update,
     update_cached_settings,
 )
 from .users import (
@@ -28,6 +32,8 @@ from .users import (
     update_user_account,
     update_user_extensions,
 )
+from .webhooks import webhook_outbox
+from .webpush import PushNotification, webpush_sender
 from .websockets import websocket_manager, websocket_updater
 
 __all__ = [
@@ -42,15 +48,19 @@ __all__ = [
     "check_transaction_status",
     "check_wallet_limits",
     "create_invoice",
+    "create_invoices",
     "fee_reserve",
     "fee_reserve_total",
     "pay_invoice",
+    "pay_invoices",
     "send_payment_notification",
     "service_fee",
     "update_pending_payments",
+    "update_pending_payments_in_background",
     "update_wallet_balance",
     # settings
     "check_webpush_settings",
+    "publish_settings_update",
     "update_cached_settings",
     # users
     "check_admin_settings",
@@ -59,6 +69,11 @@ __all__ = [
     "init_admin_settings",
     "update_user_account",
     "update_user_extensions",
+    # webhooks
+    "webhook_outbox",
+    # webpush
+    "PushNotification",
+    "webpush_sender",
     # websockets
     "websocket_manager",
     "websocket_updater",
@@ -1,5 +1,7 @@
 import asyncio
 import importlib
+import json
+import os
 from typing import Optional
 
 from loguru import logger
@@ -17,6 +19,7 @@ from lnbits.core.crud.extensions import (
     update_installed_extension,
 )
 from lnbits.core.helpers import migrate_extension_database
+from lnbits.pubsub import pubsub
 from lnbits.settings import settings
 
 from ..models.extensions import Extension, ExtensionMeta, InstallableExtension
@@ -60,16 +63,19 @@ async def uninstall_extension(ext_id: str):
     if extension:
         extension.clean_extension_files()
     await delete_installed_extension(ext_id=ext_id)
+    await _publish_extension_change("uninstall", ext_id)
 
 
 async def activate_extension(ext: Extension):
     core_app_extra.register_new_ext_routes(ext)
     await update_installed_extension_state(ext_id=ext.code, active=True)
+    await _publish_extension_change("activate", ext.code, ext)
 
 
 async def deactivate_extension(ext_id: str):
     settings.deactivate_extension_paths(ext_id)
     await update_installed_extension_state(ext_id=ext_id, active=False)
+    await _publish_extension_change("deactivate", ext_id)
 
 
 async def stop_extension_background_work(ext_id: str) -> bool:
@@ -139,3 +145,40 @@ async def get_valid_extension(
         return None
 
     return Extension.from_installable_ext(ext)
+
+
+async def _publish_extension_change(
+    action: str, ext_id: str, ext: Optional[Extension] = None
+) -> None:
+    """The other LNbits processes apply the change to their routes as well."""
+    message = {
+        "pid": os.getpid(),
+        "action": action,
+        "ext_id": ext_id,
+        "extension": ext.dict() if ext else None,
+    }
+    await pubsub.publish("extensions", json.dumps(message))
+
+
+async def _on_extensions_message(data: str):
+    message = json.loads(data)
+    if message["pid"] == os.getpid():
+        return
+    ext_id = message["ext_id"]
+    logger.info(f"Extension '{ext_id}' changed by another LNbits process.")
+    if message["action"] == "activate":
+        ext = Extension(**message["extension"])
+        if (
+            ext_id in settings.lnbits_all_extensions_ids
+            and settings.extension_upgrade_hash(ext_id) != ext.upgrade_hash
+        ):
+            # a new version replaces the one running in this process
+            await stop_extension_background_work(ext_id)
+        core_app_extra.register_new_ext_routes(ext)
+        return
+    if message["action"] == "uninstall":
+        await stop_extension_background_work(ext_id)
+    settings.deactivate_extension_paths(ext_id)
+
+
+pubsub.subscribe("extensions", _on_extensions_message)
@@ -1,3 +1,9 @@
+import json
+import os
+
+from loguru import logger
+
+from lnbits.pubsub import pubsub
 from lnbits.settings import settings
 from lnbits.wallets import get_funding_source, set_funding_source
 
@@ -6,11 +12,20 @@ from ..models import BalanceDelta
 
 
 async def switch_to_voidwallet() -> None:
+    """Switches all LNbits processes to the `VoidWallet`."""
+    if not _use_voidwallet():
+        return
+    message = {"pid": os.getpid(), "class_name": "VoidWallet"}
+    await pubsub.publish("funding_source", json.dumps(message))
+
+
+def _use_voidwallet() -> bool:
     funding_source = get_funding_source()
     if funding_source.__class__.__name__ == "VoidWallet":
-        return
+        return False
     set_funding_source("VoidWallet")
     settings.lnbits_backend_wallet_class = "VoidWallet"
+    return True
 
 
 async def get_balance_delta() -> BalanceDelta:
@@ -21,3 +36,14 @@ async def get_balance_delta() -> BalanceDelta:
         lnbits_balance_msats=lnbits_balance,
         node_balance_msats=status.balance_msat,
     )
+
+
+async def _on_funding_source_message(data: str):
+    message = json.loads(data)
+    if message["pid"] == os.getpid():
+        return
+    if message["class_name"] == "VoidWallet" and _use_voidwallet():
+        logger.warning("Switched to VoidWallet by another LNbits process.")
+
+
+pubsub.subscribe("funding_source", _on_funding_source_message)
@@ -1,6 +1,7 @@
+import asyncio
 import json
 import time
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from bolt11 import decode as bolt11_decode
 from bolt11.types import Bolt11
@@ -11,7 +12,11 @@ from lnbits.db import Connection
 from lnbits.decorators import check_user_extension_access
 from lnbits.exceptions import InvoiceError, PaymentError
 from lnbits.settings import settings
-from lnbits.utils.exchange_rates import fiat_amount_as_satoshis, satoshis_amount_as_fiat
+from lnbits.utils.exchange_rates import (
+    fiat_amount_as_satoshis,
+    get_fiat_rate_satoshis,
+    satoshis_amount_as_fiat,
+)
 from lnbits.wallets import fake_wallet, get_funding_source
 from lnbits.wallets.base import (
     PaymentPendingStatus,
@@ -23,15 +28,22 @@ from lnbits.wallets.base import (
 from ..crud import (
     check_internal,
     create_payment,
+    create_payments,
     get_payments,
     get_standalone_payment,
     get_wallet,
     get_wallet_payment,
     is_internal_status_success,
+    lock_incoming_payment,
+    lock_payment_hash,
+    lock_wallet_balance,
+    lock_wallet_balances,
     update_payment,
 )
 from ..models import (
+    CreateInvoicesResult,
     CreatePayment,
+    PayInvoiceResult,
     Payment,
     PaymentState,
     Wallet,
@@ -52,29 +64,185 @@ async def pay_invoice(
     invoice = _validate_payment_request(payment_request, max_sat)
     assert invoice.amount_msat
 
-    async with db.reuse_conn(conn) if conn else db.connect() as conn:
-        amount_msat = invoice.amount_msat
-        wallet = await _check_wallet_for_payment(wallet_id, tag, amount_msat, conn)
+    amount_msat = invoice.amount_msat
+    wallet = await _check_wallet_for_payment(wallet_id, tag, amount_msat, conn)
 
-        if await is_internal_status_success(invoice.payment_hash, conn):
-            raise PaymentError("Internal invoice already paid.", status="failed")
+    if await is_internal_status_success(invoice.payment_hash, conn):
+        raise PaymentError("Internal invoice already paid.", status="failed")
 
-        _, extra = await calculate_fiat_amounts(amount_msat / 1000, wallet, extra=extra)
+    _, extra = await calculate_fiat_amounts(amount_msat / 1000, wallet, extra=extra)
 
-        create_payment_model = CreatePayment(
-            wallet_id=wallet_id,
-            bolt11=payment_request,
-            payment_hash=invoice.payment_hash,
-            amount_msat=-amount_msat,
-            expiry=invoice.expiry_date,
-            memo=description or invoice.description or "",
-            extra=extra,
+    create_payment_model = CreatePayment(
+        wallet_id=wallet_id,
+        bolt11=payment_request,
+        payment_hash=invoice.payment_hash,
+        amount_msat=-amount_msat,
+        expiry=invoice.expiry_date,
+        memo=description or invoice.description or "",
+        extra=extra,
+    )
+
+    # an internal payment is written in one transaction, an external one is
+    # committed as pending before the funding source is called so it can
+    # not get lost, `conn` must therefore not be inside of a transaction.
+    # without `conn` no connection is held while the funding source pays, so
+    # payments from other wallets are not blocked by it
+    return await _pay_invoice(wallet, create_payment_model, conn)
+
+
+# running tasks of `pay_invoices`, asyncio only keeps weak references to them
+_batch_tasks: set[asyncio.Task] = set()
+
+
+async def pay_invoices(
+    *,
+    wallet_id: str,
+    payment_requests: list[str],
+    max_sat: Optional[int] = None,
+    extra: Optional[dict] = None,
+    tag: str = "",
+) -> AsyncIterator[PayInvoiceResult]:
+    """
+    Pays many invoices from one wallet. The invoices are validated, the wallet
+    limits are checked for the total amount and the external payments are
+    reserved in one transaction before anything is sent. They are then sent to
+    the funding source with at most `lnbits_batch_payments_concurrency` at a time.
+
+    Raises a `PaymentError` if the batch as a whole is rejected, otherwise
+    returns an iterator of one result per invoice, in the order they complete.
+    """
+    rejected: list[PayInvoiceResult] = []
+    invoices: dict[str, tuple[str, Bolt11]] = {}
+    for payment_request in payment_requests:
+        try:
+            invoice = _validate_payment_request(payment_request, max_sat)
+            if invoice.payment_hash in invoices:
+                raise PaymentError("Duplicate invoice in batch.", status="failed")
+            if await is_internal_status_success(invoice.payment_hash):
+                raise PaymentError("Internal invoice already paid.", status="failed")
+        except PaymentError as exc:
+            rejected.append(
+                PayInvoiceResult(payment_request=payment_request, error=exc.message)
+            )
+            continue
+        invoices[invoice.payment_hash] = (payment_request, invoice)
+
+    total_msat = sum(invoice.amount_msat or 0 for _, invoice in invoices.values())
+    wallet = await _check_wallet_for_payment(wallet_id, tag, total_msat)
+
+    create_payment_models: list[CreatePayment] = []
+    # new external payments, they are reserved together
+    external: list[CreatePayment] = []
+    reserve_msat = 0
+    for payment_hash, (payment_request, invoice) in invoices.items():
+        amount_msat = invoice.amount_msat or 0
+        _, payment_extra = await calculate_fiat_amounts(
+            amount_msat / 1000, wallet, extra=dict(extra or {})
         )
+        create_payment_models.append(
+            CreatePayment(
+                wallet_id=wallet_id,
+                bolt11=payment_request,
+                payment_hash=payment_hash,
+                amount_msat=-amount_msat,
+                expiry=invoice.expiry_date,
+                memo=invoice.description or "",
+                extra=payment_extra,
+            )
+        )
+        internal = await check_internal(payment_hash) is not None
+        # same reserve as `_pay_internal_invoice` and `_pay_external_invoice`
+        reserve_msat += amount_msat + fee_reserve_total(-amount_msat, internal)
+        if not internal and not await get_standalone_payment(payment_hash):
+            external.append(create_payment_models[-1])
 
-        payment = await _pay_invoice(wallet, create_payment_model, conn)
-        await _credit_service_fee_wallet(payment, conn)
+    if wallet.balance_msat < reserve_msat:
+        raise PaymentError("Insufficient balance.", status="failed")
 
-        return payment
+    # internal payments and retries of existing payments are paid one by one
+    # through the same path as `pay_invoice`
+    reserved: dict[str, Payment] = {}
+    if external:
+        async with db.transaction() as conn:
+            # in the same order in every batch, so batches can not deadlock
+            for payment_hash in sorted(data.payment_hash for data in external):
+                await lock_payment_hash(payment_hash, conn)
+            # invoices paid by someone else in the meantime go through
+            # `_pay_invoice`, which checks the existing payment
+            external = [
+                data
+                for data in external
+                if not await get_standalone_payment(data.payment_hash, conn=conn)
+            ]
+            await _reserve_wallet_balance(
+                wallet.id,
+                sum(
+                    abs(data.amount_msat) + fee_reserve_total(data.amount_msat)
+                    for data in external
+                ),
+                conn,
+            )
+            for data in external:
+                data.fee = -abs(fee_reserve_total(data.amount_msat))
+                reserved[data.payment_hash] = await create_payment(
+                    checking_id=data.payment_hash, data=data, conn=conn
+                )
+
+    semaphore = asyncio.Semaphore(max(1, settings.lnbits_batch_payments_concurrency))
+
+    async def _pay(data: CreatePayment) -> PayInvoiceResult:
+        async with semaphore:
+            return await _pay_batch_invoice(
+                wallet, data, reserved.get(data.payment_hash)
+            )
+
+    # the payments run as tasks, so they are finished even if the caller stops
+    # reading the results (e.g. a client disconnects from the stream)
+    tasks = [asyncio.create_task(_pay(data)) for data in create_payment_models]
+    for task in tasks:
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
+
+    async def _results() -> AsyncIterator[PayInvoiceResult]:
+        for result in rejected:
+            yield result
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+    return _results()
+
+
+async def _pay_batch_invoice(
+    wallet: Wallet, data: CreatePayment, reserved: Optional[Payment]
+) -> PayInvoiceResult:
+    """Sends one payment of `pay_invoices`, errors become a failed result."""
+    try:
+        if reserved:
+            payment = await _send_external_payment(wallet, reserved)
+            await _credit_service_fee_wallet(payment)
+        else:
+            payment = await _pay_invoice(wallet, data, None)
+    except PaymentError as exc:
+        return PayInvoiceResult(
+            payment_request=data.bolt11,
+            payment_hash=data.payment_hash,
+            error=exc.message,
+        )
+    except Exception as exc:
+        logger.warning(f"batch payment {data.payment_hash} failed: {exc}")
+        return PayInvoiceResult(
+            payment_request=data.bolt11,
+            payment_hash=data.payment_hash,
+            error="Unexpected error.",
+        )
+    return PayInvoiceResult(
+        payment_request=data.bolt11,
+        payment_hash=payment.payment_hash,
+        checking_id=payment.checking_id,
+        status=PaymentState(payment.status),
+        fee_msat=payment.fee,
+        preimage=payment.preimage,
+    )
 
 
 async def create_invoice(
@@ -155,7 +323,132 @@ async def create_invoice(
     return payment
 
 
+async def create_invoices(
+    *,
+    wallet_id: str,
+    amounts: list[float],
+    currency: Optional[str] = "sat",
+    memo: str,
+    expiry: Optional[int] = None,
+    extra: Optional[dict] = None,
+    webhook: Optional[str] = None,
+    internal: Optional[bool] = False,
+) -> CreateInvoicesResult:
+    """
+    Creates one invoice per amount. The fiat rates are fetched once for the
+    batch, the funding source is called concurrently (at most
+    `lnbits_batch_payments_concurrency` at a time), the invoices are decoded in
+    worker threads and all payments are inserted with one statement.
+    If an invoice can not be created, the invoices which are not requested yet
+    are skipped and the error is returned along with the invoices which were
+    created by the funding source already. Those are saved, so they are tracked
+    if they get paid.
+    """
+    if not amounts:
+        return CreateInvoicesResult()
+    if not all(amount > 0 for amount in amounts):
+        raise InvoiceError("Amountless invoices not supported.", status="failed")
+
+    wallet = await get_wallet(wallet_id)
+    if not wallet:
+        raise InvoiceError(f"Could not fetch wallet '{wallet_id}'.", status="failed")
+
+    # use the fake wallet if the invoices are for internal use only
+    funding_source = fake_wallet if internal else get_funding_source()
+
+    wallet_currency = wallet.currency or settings.lnbits_default_accounting_currency
+    rates = {
+        fiat: await get_fiat_rate_satoshis(fiat)
+        for fiat in {currency, wallet_currency}
+        if fiat and fiat != "sat"
+    }
+    fiat_amounts = [
+        await calculate_fiat_amounts(amount, wallet, currency, dict(extra or {}), rates)
+        for amount in amounts
+    ]
+
+    total_sat = sum(amount_sat for amount_sat, _ in fiat_amounts)
+    if settings.is_wallet_max_balance_exceeded(wallet.balance_msat / 1000 + total_sat):
+        raise InvoiceError(
+            f"Wallet balance cannot exceed "
+            f"{settings.lnbits_wallet_limit_max_balance} sats.",
+            status="failed",
+        )
+
+    semaphore = asyncio.Semaphore(max(1, settings.lnbits_batch_payments_concurrency))
+    failed = asyncio.Event()
+
+    async def _create(amount_sat: int, payment_extra: dict) -> Optional[Payment]:
+        try:
+            return await _create_one(amount_sat, payment_extra)
+        except BaseException:
+            failed.set()
+            raise
+
+    async def _create_one(amount_sat: int, payment_extra: dict) -> Optional[Payment]:
+        async with semaphore:
+            if failed.is_set():
+                return None
+            (
+                ok,
+                checking_id,
+                payment_request,
+                error_message,
+            ) = await funding_source.create_invoice(
+                amount=amount_sat,
+                memo=memo,
+                expiry=expiry or settings.lightning_invoice_expiry,
+            )
+        if not ok or not payment_request or not checking_id:
+            raise InvoiceError(
+                error_message or "unexpected backend error.", status="pending"
+            )
+        # decoding verifies the signature, it is kept off the event loop
+        invoice = await asyncio.to_thread(bolt11_decode, payment_request)
+        return Payment(
+            checking_id=checking_id,
+            payment_hash=invoice.payment_hash,
+            wallet_id=wallet_id,
+            amount=amount_sat * 1000,
+            fee=0,
+            bolt11=payment_request,
+            memo=memo,
+            expiry=invoice.expiry_date,
+            webhook=webhook,
+            extra=payment_extra,
+        )
+
+    # requests which are running when another one fails are not cancelled, the
+    # funding source might have created the invoice already
+    results = await asyncio.gather(
+        *[
+            _create(amount_sat, payment_extra)
+            for amount_sat, payment_extra in fiat_amounts
+        ],
+        return_exceptions=True,
+    )
+    payments = [result for result in results if isinstance(result, Payment)]
+    if payments:
+        await create_payments(payments)
+    error: Optional[str] = None
+    for result in results:
+        if isinstance(result, InvoiceError):
+            error = error or result.message
+        elif isinstance(result, Exception):
+            logger.warning(f"batch invoice failed: {result}")
+            error = error or "Unexpected error."
+        elif isinstance(result, BaseException):
+            raise result
+    return CreateInvoicesResult(invoices=payments, error=error)
+
+
+# last update of the pending payments and running updates, by wallet id
+_pending_updated: dict[str, float] = {}
+_pending_update_tasks: dict[str, asyncio.Task] = {}
+
+
 async def update_pending_payments(wallet_id: str):
+    _pending_updated[wallet_id] = time.time()
     pending_payments = await get_payments(
         wallet_id=wallet_id,
         pending=True,
@@ -165,10 +458,50 @@ async def update_pending_payments(wallet_id: str):
         status = await payment.check_status()
         if status.failed:
             payment.status = PaymentState.FAILED
-            await update_payment(payment)
         elif status.success:
             payment.status = PaymentState.SUCCESS
-            await update_payment(payment)
+        else:
+            continue
+        await update_payment(payment)
+        wallet = await get_wallet(wallet_id)
+        if wallet:
+            await send_payment_notification(wallet, payment)
+
+
+def update_pending_payments_in_background(wallet_id: str) -> Optional[asyncio.Task]:
+    """
+    Starts `update_pending_payments` for the wallet unless it ran in the last
+    `lnbits_pending_refresh_interval` seconds or is still running, so callers
+    can answer with the stored status right away. Changes are sent over the
+    wallet websocket.
+    """
+    if wallet_id in _pending_update_tasks:
+        return None
+    now = time.time()
+    updated = _pending_updated.get(wallet_id, 0)
+    if now - updated < settings.lnbits_pending_refresh_interval:
+        return None
+    # older entries do not hold back an update anymore, so they are removed
+    expired = [
+        key
+        for key, value in _pending_updated.items()
+        if now - value >= settings.lnbits_pending_refresh_interval
+    ]
+    for key in expired:
+        _pending_updated.pop(key, None)
+
+    def _done(task: asyncio.Task) -> None:
+        _pending_update_tasks.pop(wallet_id, None)
+        if not task.cancelled() and task.exception():
+            logger.warning(
+                f"updating pending payments of wallet {wallet_id} failed: "
+                f"{task.exception()!s}"
+            )
+
+    task = asyncio.create_task(update_pending_payments(wallet_id))
+    _pending_update_tasks[wallet_id] = task
+    task.add_done_callback(_done)
+    return task
 
 
 def fee_reserve_total(amount_msat: int, internal: bool = False) -> int:
@@ -196,7 +529,7 @@ def service_fee(amount_msat: int, internal: bool = False) -> int:
 
 
 async def update_wallet_balance(wallet_id: str, amount: int):
-    async with db.connect() as conn:
+    async with db.transaction() as conn:
         payment = await create_invoice(
             wallet_id=wallet_id,
             amount=amount,
@@ -206,10 +539,11 @@ async def update_wallet_balance(wallet_id: str, amount: int):
         )
         payment.status = PaymentState.SUCCESS
         await update_payment(payment, conn=conn)
-        # notify receiver asynchronously
-        from lnbits.tasks import internal_invoice_queue
 
-        await internal_invoice_queue.put(payment.checking_id)
+    # notify receiver asynchronously, once the top up is committed
+    from lnbits.tasks import internal_invoice_queue
+
+    await internal_invoice_queue.put(payment.checking_id)
 
 
 async def send_payment_notification(wallet: Wallet, payment: Payment):
@@ -218,16 +552,23 @@ async def send_payment_notification(wallet: Wallet, payment: Payment):
     # TODO: figure out why we send the balance with the payment here.
     # cleaner would be to have a separate message for the balance
     # and send it with the id of the wallet so wallets can subscribe to it
-    await websocket_manager.send_data(
-        json.dumps(
+    message = json.dumps(
+        {
+            "wallet_balance": wallet.balance,
+            # use pydantic json serialization to get the correct datetime format
+            "payment": json.loads(payment.json()),
+        },
+    )
+    if not websocket_manager.fits(message, wallet.inkey):
+        # the `extra` of extensions and the bolt11 have no size limit, without
+        # them the message fits the pubsub of all LNbits processes
+        message = json.dumps(
             {
                 "wallet_balance": wallet.balance,
-                # use pydantic json serialization to get the correct datetime format
-                "payment": json.loads(payment.json()),
+                "payment": json.loads(payment.json(exclude={"extra", "bolt11"})),
             },
-        ),
-        wallet.inkey,
-    )
+        )
+    await websocket_manager.send_data(message, wallet.inkey)
     await websocket_manager.send_data(
         json.dumps({"pending": payment.pending}), payment.payment_hash
     )
@@ -296,11 +637,19 @@ async def calculate_fiat_amounts(
     wallet: Wallet,
     currency: Optional[str] = None,
     extra: Optional[dict] = None,
+    rates: Optional[dict[str, float]] = None,
 ) -> tuple[int, dict]:
+    """
+    `rates` (satoshis per fiat unit by currency) can be fetched once by callers
+    which convert many amounts, otherwise the current rates are used.
+    """
     wallet_currency = wallet.currency or settings.lnbits_default_accounting_currency
     fiat_amounts: dict = extra or {}
     if currency and currency != "sat":
-        amount_sat = await fiat_amount_as_satoshis(amount, currency)
+        if rates and currency in rates:
+            amount_sat = int(amount * rates[currency])
+        else:
+            amount_sat = await fiat_amount_as_satoshis(amount, currency)
         if currency != wallet_currency:
             fiat_amounts["fiat_currency"] = currency
             fiat_amounts["fiat_amount"] = round(amount, ndigits=3)
@@ -311,6 +660,8 @@ async def calculate_fiat_amounts(
     if wallet_currency:
         if wallet_currency == currency:
             fiat_amount = amount
+        elif rates and wallet_currency in rates:
+            fiat_amount = float(amount_sat / rates[wallet_currency])
         else:
             fiat_amount = await satoshis_amount_as_fiat(amount_sat, wallet_currency)
         fiat_amounts["wallet_fiat_currency"] = wallet_currency
@@ -343,6 +694,7 @@ async def _pay_invoice(wallet, create_payment_model, conn):
     payment = await _pay_internal_invoice(wallet, create_payment_model, conn)
     if not payment:
         payment = await _pay_external_invoice(wallet, create_payment_model, conn)
+        await _credit_service_fee_wallet(payment, conn)
     return payment
 
 
@@ -386,18 +738,42 @@ async def _pay_internal_invoice(
 
     internal_id = f"internal_{create_payment_model.payment_hash}"
     logger.debug(f"creating temporary internal payment with id {internal_id}")
-    payment = await create_payment(
-        checking_id=internal_id,
-        data=create_payment_model,
-        status=PaymentState.SUCCESS,
-        conn=conn,
-    )
+    # both sides of the payment and the service fee are committed together
+    async with db.transaction(conn) as new_conn:
+        # another payer can have paid the invoice since `check_internal`
+        internal_payment = await lock_incoming_payment(
+            internal_payment.checking_id, new_conn
+        )
+        if (
+            not internal_payment
+            or internal_payment.status != PaymentState.PENDING.value
+            or await get_standalone_payment(internal_id, conn=new_conn)
+        ):
+            raise PaymentError("Internal invoice already paid.", status="failed")
+        await lock_wallet_balances(
+            [
+                wallet.id,
+                internal_payment.wallet_id,
+                settings.lnbits_service_fee_wallet or wallet.id,
+            ],
+            new_conn,
+        )
+        await _reserve_wallet_balance(
+            wallet.id, abs(amount_msat) + fee_reserve_total_msat, new_conn
+        )
+        payment = await create_payment(
+            checking_id=internal_id,
+            data=create_payment_model,
+            status=PaymentState.SUCCESS,
+            conn=new_conn,
+        )
 
-    # mark the invoice from the other side as not pending anymore
-    # so the other side only has access to his new money when we are sure
-    # the payer has enough to deduct from
-    internal_payment.status = PaymentState.SUCCESS
-    await update_payment(internal_payment, conn=conn)
+        # mark the invoice from the other side as not pending anymore
+        # so the other side only has access to his new money when we are sure
+        # the payer has enough to deduct from
+        internal_payment.status = PaymentState.SUCCESS
+        await update_payment(internal_payment, conn=new_conn)
+        await _credit_service_fee_wallet(payment, new_conn)
     logger.success(f"internal payment successful {internal_payment.checking_id}")
 
     await send_payment_notification(wallet, payment)
@@ -427,26 +803,42 @@ async def _pay_external_invoice(
             "  sat) to cover potential routing fees.",
             status="failed",
         )
-    # check if there is already a payment with the same checking_id
-    old_payment = await get_standalone_payment(checking_id, conn=conn)
+    create_payment_model.fee = -abs(fee_reserve_total_msat)
+    async with db.transaction(conn) as new_conn:
+        # check if there is already a payment with the same checking_id, under
+        # a lock so concurrent payers of the invoice see each other
+        await lock_payment_hash(checking_id, new_conn)
+        old_payment = await get_standalone_payment(checking_id, conn=new_conn)
+        if not old_payment:
+            await _reserve_wallet_balance(
+                wallet.id, abs(amount_msat) + fee_reserve_total_msat, new_conn
+            )
+            payment = await create_payment(
+                checking_id=checking_id,
+                data=create_payment_model,
+                conn=new_conn,
+            )
     if old_payment:
         return await _verify_external_payment(old_payment, conn)
 
-    create_payment_model.fee = -abs(fee_reserve_total_msat)
-    payment = await create_payment(
-        checking_id=checking_id,
-        data=create_payment_model,
-        conn=conn,
-    )
+    return await _send_external_payment(wallet, payment, conn)
+
 
-    fee_reserve_msat = fee_reserve(amount_msat, internal=False)
-    service_fee_msat = service_fee(amount_msat, internal=False)
+async def _send_external_payment(
+    wallet: Wallet,
+    payment: Payment,
+    conn: Optional[Connection] = None,
+) -> Payment:
+    """Sends a reserved (pending) payment to the funding source."""
+    checking_id = payment.checking_id
+    fee_reserve_msat = fee_reserve(payment.amount, internal=False)
+    service_fee_msat = service_fee(payment.amount, internal=False)
 
     funding_source = get_funding_source()
 
     logger.debug(f"fundingsource: sending payment {checking_id}")
     payment_response: PaymentResponse = await funding_source.pay_invoice(
-        create_payment_model.bolt11, fee_reserve_msat
+        payment.bolt11, fee_reserve_msat
     )
     logger.debug(f"backend: pay_invoice finished {checking_id}, {payment_response}")
     if payment_response.checking_id and payment_response.checking_id != checking_id:
@@ -535,6 +927,19 @@ async def _check_wallet_for_payment(
     return wallet
 
 
+async def _reserve_wallet_balance(
+    wallet_id: str, amount_msat: int, conn: Connection
+) -> None:
+    """
+    Checks the balance again right before the payment is written, in the same
+    transaction. The wallet stays locked until it is committed, so concurrent
+    payments can not overdraw it.
+    """
+    balance_msat = await lock_wallet_balance(wallet_id, conn)
+    if balance_msat < amount_msat:
+        raise PaymentError("Insufficient balance.", status="failed")
+
+
 def _validate_payment_request(
     payment_request: str, max_sat: Optional[int] = None
 ) -> Bolt11:
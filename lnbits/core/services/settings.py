@@ -1,15 +1,20 @@
+import json
+import os
+
 from cryptography.hazmat.primitives import serialization
 from loguru import logger
 from py_vapid import Vapid
 from py_vapid.utils import b64urlencode
 
+from lnbits.pubsub import pubsub
 from lnbits.settings import (
     EditableSettings,
     readonly_variables,
     settings,
 )
 
-from ..crud import update_admin_settings
+from ..crud import get_super_settings, update_admin_settings
+from ..db import core_app_extra
 
 
 async def check_webpush_settings():
@@ -48,3 +53,28 @@ def update_cached_settings(sets_dict: dict):
             logger.warning(f"Failed overriding setting: {key}, value: {value}")
     if "super_user" in sets_dict:
         settings.super_user = sets_dict["super_user"]
+
+
+async def publish_settings_update(**values) -> None:
+    """
+    The other LNbits processes load the admin settings from the database again
+    and set the `values` which are not stored there, e.g. `first_install`.
+    """
+    message = {"pid": os.getpid(), "values": values}
+    await pubsub.publish("settings", json.dumps(message))
+
+
+async def _on_settings_message(data: str):
+    message = json.loads(data)
+    if message["pid"] == os.getpid():
+        return
+    settings_db = await get_super_settings()
+    if settings_db:
+        update_cached_settings(settings_db.dict())
+    for key, value in message["values"].items():
+        setattr(settings, key, value)
+    core_app_extra.register_new_ratelimiter()
+    logger.debug("settings updated by another LNbits process")
+
+
+pubsub.subscribe("settings", _on_settings_message)
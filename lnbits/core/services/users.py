@@ -15,7 +15,7 @@ from lnbits.settings import (
 from ..crud import (
     create_account,
     create_admin_settings,
-    create_user_extension,
+    create_user_extensions,
     create_wallet,
     get_account,
     get_account_by_email,
@@ -27,6 +27,7 @@ from ..crud import (
     update_account,
     update_super_user,
     update_user_extension,
+    update_user_extensions_state,
 )
 from ..helpers import to_valid_user_id
 from ..models import (
@@ -114,22 +115,21 @@ async def update_user_account(account: Account) -> Account:
 
 async def update_user_extensions(user_id: str, extensions: list[str]):
     user_extensions = await get_user_extensions(user_id)
+    changed_extensions = []
     for user_ext in user_extensions:
-        if user_ext.active:
-            if user_ext.extension not in extensions:
-                user_ext.active = False
-                await update_user_extension(user_ext)
-        else:
-            if user_ext.extension in extensions:
-                user_ext.active = True
-                await update_user_extension(user_ext)
+        active = user_ext.extension in extensions
+        if user_ext.active != active:
+            user_ext.active = active
+            changed_extensions.append(user_ext)
+    await update_user_extensions_state(changed_extensions)
 
     user_extension_ids = [ue.extension for ue in user_extensions]
-    for ext in extensions:
-        if ext in user_extension_ids:
-            continue
-        user_extension = UserExtension(user=user_id, extension=ext, active=True)
-        await create_user_extension(user_extension)
+    new_extensions = [
+        UserExtension(user=user_id, extension=ext, active=True)
+        for ext in extensions
+        if ext not in user_extension_ids
+    ]
+    await create_user_extensions(new_extensions)
 
 
 async def check_admin_settings():
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import uuid4
+
+import httpx
+from loguru import logger
+
+from lnbits.settings import settings
+
+from ..crud import (
+    claim_due_webhook_deliveries,
+    create_webhook_delivery,
+    update_webhook_deliveries,
+)
+from ..models import Payment, WebhookDelivery, WebhookStatus
+
+
+class WebhookOutbox:
+    """
+    Delivers the webhooks saved in the `webhook_outbox` table. All deliveries
+    share one http client (and its keep-alive connections), every host gets at
+    most `webhook_host_concurrency` deliveries at the same time and hosts which
+    keep failing are skipped for a while (circuit breaker). Failed deliveries
+    are retried with an exponential backoff, the results are saved in batches.
+    """
+
+    poll_interval = 1
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None) -> None:
+        self._client = client
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+        self._host_failures: dict[str, int] = {}
+        self._host_open_until: dict[str, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._finished: list[WebhookDelivery] = []
+        self._wakeup = asyncio.Event()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if not self._client or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": settings.user_agent},
+                timeout=settings.webhook_timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.webhook_batch_size,
+                    max_keepalive_connections=settings.webhook_host_concurrency * 10,
+                ),
+            )
+        return self._client
+
+    async def enqueue(self, payment: Payment) -> Optional[WebhookDelivery]:
+        if not payment.webhook:
+            return None
+        delivery = WebhookDelivery(
+            id=uuid4().hex,
+            payment_hash=payment.payment_hash,
+            url=payment.webhook,
+            # use pydantic json serialization to get the correct datetime format
+            payload=json.loads(payment.json()),
+        )
+        await create_webhook_delivery(delivery)
+        self._wakeup.set()
+        return delivery
+
+    async def run_forever(self) -> None:
+        while settings.lnbits_running:
+            try:
+                await self.process()
+            except Exception as exc:
+                logger.warning(f"webhook outbox: {exc!s}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def process(self) -> int:
+        """Saves the finished deliveries and starts the due ones."""
+        await self.flush()
+        limit = settings.webhook_batch_size - len(self._tasks)
+        if limit <= 0:
+            return 0
+        # claim the deliveries until they are done, or the timeout is long gone
+        lease = timedelta(seconds=settings.webhook_timeout * 2 + 60)
+        deliveries = await claim_due_webhook_deliveries(
+            limit, datetime.now(timezone.utc) + lease
+        )
+        if not deliveries:
+            return 0
+        for delivery in deliveries:
+            task = asyncio.create_task(self._deliver(delivery))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(deliveries)
+
+    async def flush(self) -> None:
+        finished, self._finished = self._finished, []
+        if finished:
+            await update_webhook_deliveries(finished)
+
+    async def wait_idle(self) -> None:
+        """Waits for the running deliveries and saves them, e.g. on shutdown."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+    async def close(self) -> None:
+        if self._client:
+            await self._client.aclose()
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "in_flight": len(self._tasks),
+            "open_circuits": {
+                host: round(open_until - now)
+                for host, open_until in self._host_open_until.items()
+                if open_until > now
+            },
+        }
+
+    async def _deliver(self, delivery: WebhookDelivery) -> None:
+        host = delivery.host
+        open_until = self._host_open_until.get(host, 0)
+        if open_until > time.time():
+            delivery.next_attempt_at = datetime.fromtimestamp(open_until, timezone.utc)
+            self._finish(delivery)
+            return
+
+        semaphore = self._host_limits.get(host)
+        if not semaphore:
+            semaphore = asyncio.Semaphore(max(1, settings.webhook_host_concurrency))
+            self._host_limits[host] = semaphore
+
+        retry = False
+        async with semaphore:
+            delivery.attempts += 1
+            try:
+                r = await self.client.post(delivery.url, json=delivery.payload)
+                delivery.response_code = r.status_code
+                r.raise_for_status()
+                delivery.status = WebhookStatus.DELIVERED
+                delivery.error = None
+                self._host_failures.pop(host, None)
+            except httpx.HTTPStatusError as exc:
+                delivery.error = f"bad status_code: {exc.response.status_code}"
+                code = exc.response.status_code
+                retry = code in (408, 429) or code >= 500
+            except httpx.RequestError as exc:
+                delivery.error = str(exc) or exc.__class__.__name__
+                retry = True
+
+        if delivery.status != WebhookStatus.DELIVERED:
+            logger.warning(
+                f"webhook to {delivery.url} failed (attempt {delivery.attempts}): "
+                f"{delivery.error}"
+            )
+            if retry:
+                self._record_host_failure(host)
+            if retry and delivery.attempts < settings.webhook_max_attempts:
+                delay = settings.webhook_retry_delay * 2 ** (delivery.attempts - 1)
+                delivery.next_attempt_at = datetime.now(timezone.utc) + timedelta(
+                    seconds=delay
+                )
+            else:
+                delivery.status = WebhookStatus.FAILED
+        self._finish(delivery)
+
+    def _finish(self, delivery: WebhookDelivery) -> None:
+        delivery.updated_at = datetime.now(timezone.utc)
+        self._finished.append(delivery)
+
+    def _record_host_failure(self, host: str) -> None:
+        failures = self._host_failures.get(host, 0) + 1
+        self._host_failures[host] = failures
+        if failures >= settings.webhook_circuit_failures:
+            logger.warning(f"webhook host {host} keeps failing, pausing deliveries")
+            self._host_open_until[host] = (
+                time.time() + settings.webhook_circuit_cooldown
+            )
+
+
+webhook_outbox = WebhookOutbox()
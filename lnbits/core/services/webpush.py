@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+from http import HTTPStatus
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+
+import httpx
+from loguru import logger
+from py_vapid import Vapid
+from pywebpush import WebPusher
+
+from lnbits.settings import settings
+
+from ..crud import delete_webpush_subscriptions_by_endpoints
+from ..models import WebPushSubscription
+
+
+class PushNotification(NamedTuple):
+    subscription: WebPushSubscription
+    title: str
+    body: str
+    url: str = ""
+
+
+class WebPushSender:
+    """
+    Sends web push notifications without blocking the event loop. The VAPID key
+    is parsed once, the payloads are encrypted and signed in worker threads and
+    sent with a shared http client, at most `webpush_concurrency` at a time.
+    Subscriptions which are gone are deleted together after each batch.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None) -> None:
+        self._client = client
+        self._vapid: Optional[Vapid] = None
+        self._vapid_pem: Optional[str] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._gone: set[str] = set()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if not self._client or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=10)
+        return self._client
+
+    @property
+    def vapid(self) -> Optional[Vapid]:
+        privkey = settings.lnbits_webpush_privkey
+        if privkey != self._vapid_pem:
+            self._vapid = Vapid.from_pem(bytes(privkey, "utf-8")) if privkey else None
+            self._vapid_pem = privkey
+        return self._vapid
+
+    async def send_all(self, notifications: list[PushNotification]) -> None:
+        await asyncio.gather(
+            *[self.send(notification) for notification in notifications]
+        )
+        await self.flush()
+
+    async def send(self, notification: PushNotification) -> None:
+        vapid = self.vapid
+        if not vapid:
+            logger.warning("web push: no VAPID key, not sending push notification")
+            return
+        if not self._semaphore:
+            self._semaphore = asyncio.Semaphore(max(1, settings.webpush_concurrency))
+        subscription = notification.subscription
+        data = json.dumps(
+            {
+                "title": notification.title,
+                "body": notification.body,
+                "url": notification.url,
+            }
+        )
+        async with self._semaphore:
+            try:
+                logger.debug("sending push notification")
+                subscription_info = json.loads(subscription.data)
+                payload, headers = await asyncio.to_thread(
+                    _encode, subscription_info, data, vapid
+                )
+                r = await self.client.post(
+                    subscription_info["endpoint"], content=payload, headers=headers
+                )
+            except Exception as exc:
+                logger.error(f"failed sending push notification: {exc!s}")
+                return
+        if r.status_code in (HTTPStatus.GONE, HTTPStatus.NOT_FOUND):
+            # unsubscribed or expired push subscription
+            self._gone.add(subscription.endpoint)
+        elif r.is_error:
+            logger.error(f"failed sending push notification: {r.text}")
+
+    async def flush(self) -> None:
+        gone, self._gone = self._gone, set()
+        if gone:
+            await delete_webpush_subscriptions_by_endpoints(list(gone))
+
+    async def close(self) -> None:
+        if self._client:
+            await self._client.aclose()
+
+
+def _encode(subscription_info: dict, data: str, vapid: Vapid) -> tuple[bytes, dict]:
+    """Encrypts the payload and signs the VAPID claims, runs in a worker thread."""
+    encoded = WebPusher(subscription_info).encode(data, "aes128gcm")
+    endpoint = urlparse(subscription_info["endpoint"])
+    claims = {
+        "sub": "mailto:alan@lnbits.com",
+        "aud": f"{endpoint.scheme}://{endpoint.netloc}",
+        # same expiry as pywebpush
+        "exp": int(time.time()) + 12 * 60 * 60,
+    }
+    headers = {"content-encoding": "aes128gcm", "ttl": "0"}
+    headers.update(vapid.sign(claims))
+    return encoded["body"], headers
+
+
+webpush_sender = WebPushSender()
@@ -1,27 +1,105 @@
-from fastapi import WebSocket
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import WebSocket, status
 from loguru import logger
 
+from lnbits.pubsub import pubsub
+from lnbits.settings import settings
+
 
 class WebsocketConnectionManager:
+    """
+    Websockets indexed by the `item_id` they subscribed to. Messages are sent
+    to all sockets of an item at the same time, a socket which does not take
+    a message within `websocket_send_timeout` is closed and removed, so one
+    slow client does not hold up the others. The messages are published to
+    all LNbits processes, every process sends them to its own sockets.
+    """
+
     def __init__(self) -> None:
-        self.active_connections: list[WebSocket] = []
+        self.active_connections: dict[str, set[WebSocket]] = {}
+        self._item_ids: dict[WebSocket, str] = {}
+        self.messages_sent = 0
+        self.evicted = 0
 
     async def connect(self, websocket: WebSocket, item_id: str):
         logger.debug(f"Websocket connected to {item_id}")
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.setdefault(item_id, set()).add(websocket)
+        self._item_ids[websocket] = item_id
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        item_id = self._item_ids.pop(websocket, None)
+        if item_id is None:
+            return
+        connections = self.active_connections.get(item_id, set())
+        connections.discard(websocket)
+        if not connections:
+            self.active_connections.pop(item_id, None)
 
     async def send_data(self, message: str, item_id: str):
-        for connection in self.active_connections:
-            if connection.path_params["item_id"] == item_id:
-                await connection.send_text(message)
+        await pubsub.publish("websocket", self._envelope(message, item_id))
+
+    def fits(self, message: str, item_id: str) -> bool:
+        """Whether the message reaches the sockets of the other processes."""
+        return pubsub.fits("websocket", self._envelope(message, item_id))
+
+    async def send_local(self, message: str, item_id: str):
+        connections = self.active_connections.get(item_id)
+        if not connections:
+            return
+        await asyncio.gather(
+            *[self._send(connection, message) for connection in list(connections)]
+        )
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._item_ids),
+            "items": len(self.active_connections),
+            "messages_sent": self.messages_sent,
+            "evicted": self.evicted,
+        }
+
+    def _envelope(self, message: str, item_id: str) -> str:
+        return json.dumps({"item_id": item_id, "message": message})
+
+    async def _send(self, websocket: WebSocket, message: str) -> None:
+        error: Optional[str] = None
+        try:
+            await asyncio.wait_for(
+                websocket.send_text(message), settings.websocket_send_timeout
+            )
+            self.messages_sent += 1
+            return
+        except asyncio.TimeoutError:
+            error = "send timed out"
+        except Exception as exc:
+            error = str(exc) or exc.__class__.__name__
+        item_id = self._item_ids.get(websocket)
+        logger.debug(f"Websocket of {item_id} removed: {error}")
+        self.evicted += 1
+        self.disconnect(websocket)
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=status.WS_1011_INTERNAL_ERROR),
+                settings.websocket_send_timeout,
+            )
+        except Exception as exc:
+            logger.trace(f"Websocket close failed: {exc}")
 
 
 websocket_manager = WebsocketConnectionManager()
 
 
+async def _on_websocket_message(data: str):
+    message = json.loads(data)
+    await websocket_manager.send_local(message["message"], message["item_id"])
+
+
+pubsub.subscribe("websocket", _on_websocket_message)
+
+
 async def websocket_updater(item_id: str, data: str):
     return await websocket_manager.send_data(data, item_id)
@@ -1,11 +1,14 @@
 import asyncio
-from typing import Dict
+import time
+import uuid
+from typing import Callable, Coroutine, Dict, List, Tuple
 
 import httpx
 from loguru import logger
 
 from lnbits.core.crud import (
-    create_audit_entry,
+    create_audit_entries,
+    get_standalone_payment,
     get_wallet,
     get_webpush_subscriptions_for_user,
     mark_webhook_sent,
@@ -13,15 +16,74 @@ from lnbits.core.crud import (
 from lnbits.core.crud.audit import delete_expired_audit_entries
 from lnbits.core.models import AuditEntry, Payment
 from lnbits.core.services import (
+    PushNotification,
     get_balance_delta,
     send_payment_notification,
     switch_to_voidwallet,
+    webhook_outbox,
+    webpush_sender,
 )
+from lnbits.pubsub import pubsub
 from lnbits.settings import get_funding_source, settings
-from lnbits.tasks import send_push_notification
+from lnbits.tasks import create_task
 
 api_invoice_listeners: Dict[str, asyncio.Queue] = {}
-audit_queue: asyncio.Queue = asyncio.Queue()
+
+
+class WalletInvoiceListeners:
+    """
+    Queues of the payments SSE connections, indexed by wallet id so a paid
+    invoice only wakes up the connections of its wallet. The queues are
+    bounded, a connection which does not keep up is removed.
+    """
+
+    def __init__(self) -> None:
+        self.listeners: Dict[str, Dict[str, asyncio.Queue[Payment]]] = {}
+        self.connections = 0
+        self.dropped = 0
+
+    @property
+    def full(self) -> bool:
+        return self.connections >= settings.sse_max_connections
+
+    def add(self, wallet_id: str) -> Tuple[str, asyncio.Queue[Payment]]:
+        uid = f"{wallet_id}_{str(uuid.uuid4())[:8]}"
+        queue: asyncio.Queue[Payment] = asyncio.Queue(max(1, settings.sse_queue_size))
+        self.listeners.setdefault(wallet_id, {})[uid] = queue
+        self.connections += 1
+        return uid, queue
+
+    def has(self, wallet_id: str, uid: str) -> bool:
+        return uid in self.listeners.get(wallet_id, {})
+
+    def remove(self, wallet_id: str, uid: str) -> None:
+        wallet_listeners = self.listeners.get(wallet_id, {})
+        if wallet_listeners.pop(uid, None) is None:
+            return
+        self.connections -= 1
+        if not wallet_listeners:
+            self.listeners.pop(wallet_id, None)
+
+    def send(self, payment: Payment) -> None:
+        wallet_listeners = self.listeners.get(payment.wallet_id, {})
+        for uid, queue in list(wallet_listeners.items()):
+            try:
+                logger.debug(f"sse listener: sending paid event to {uid}")
+                queue.put_nowait(payment)
+            except asyncio.QueueFull:
+                logger.error(f"sse listener: QueueFull, removing {uid}")
+                self.dropped += 1
+                self.remove(payment.wallet_id, uid)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "wallets": len(self.listeners),
+            "dropped": self.dropped,
+        }
+
+
+wallet_invoice_listeners = WalletInvoiceListeners()
 
 
 async def killswitch_task():
@@ -77,31 +139,102 @@ async def watchdog_task():
         await asyncio.sleep(settings.lnbits_watchdog_interval * 60)
 
 
+class PaidInvoiceStage:
+    """
+    One side effect of paid invoices. Every stage has its own queue and
+    workers, so a slow stage (e.g. webhooks) does not hold up the others.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Payment], Coroutine]) -> None:
+        self.name = name
+        self.handler = handler
+        self.queue: asyncio.Queue[Tuple[float, Payment]] = asyncio.Queue()
+        self.workers: List[asyncio.Task] = []
+        self.processed = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self, workers: int) -> None:
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < max(1, workers):
+            self.workers.append(create_task(self._work()))
+
+    def put(self, payment: Payment) -> None:
+        self.queue.put_nowait((time.monotonic(), payment))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "workers": len([worker for worker in self.workers if not worker.done()]),
+            "queued": self.queue.qsize(),
+            "processed": self.processed,
+            "errors": self.errors,
+            # seconds from the paid event until the stage finished with it
+            "latency_avg": (
+                round(self.latency_total / self.processed, 3) if self.processed else 0
+            ),
+            "latency_max": round(self.latency_max, 3),
+        }
+
+    async def _work(self) -> None:
+        while settings.lnbits_running:
+            queued_at, payment = await self.queue.get()
+            try:
+                await self.handler(payment)
+            except Exception as exc:
+                self.errors += 1
+                logger.warning(
+                    f"paid invoice {self.name} failed for {payment.checking_id}: "
+                    f"{exc!s}"
+                )
+            latency = time.monotonic() - queued_at
+            self.processed += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+
 async def wait_for_paid_invoices(invoice_paid_queue: asyncio.Queue):
     """
-    This worker dispatches events to all extensions and dispatches webhooks.
+    This worker hands the paid invoices to the stages which dispatch them to
+    the api listeners, the websockets, the webhooks and web push.
     """
+    for stage in paid_invoice_stages.values():
+        stage.start(settings.paid_invoice_workers)
     while settings.lnbits_running:
         payment = await invoice_paid_queue.get()
         logger.trace("received invoice paid event")
-        # dispatch api_invoice_listeners
-        await dispatch_api_invoice_listeners(payment)
-        # payment notification
-        wallet = await get_wallet(payment.wallet_id)
-        if wallet:
-            await send_payment_notification(wallet, payment)
-        # dispatch webhook
-        if payment.webhook and not payment.webhook_status:
-            await dispatch_webhook(payment)
-        # dispatch push notification
-        await send_payment_push_notification(payment)
+        for stage in paid_invoice_stages.values():
+            stage.put(payment)
+
+
+async def send_paid_invoice_notification(payment: Payment):
+    wallet = await get_wallet(payment.wallet_id)
+    if wallet:
+        await send_payment_notification(wallet, payment)
+
+
+async def dispatch_paid_invoice_webhook(payment: Payment):
+    if payment.webhook and not payment.webhook_status:
+        await dispatch_webhook(payment)
 
 
 async def dispatch_api_invoice_listeners(payment: Payment):
     """
-    Emits events to invoice listener subscribed from the API.
+    Emits events to invoice listener subscribed from the API,
+    in all LNbits processes.
     """
-    for chan_name, send_channel in api_invoice_listeners.items():
+    # only the id, a payment can be larger than the payload limit of the pubsub
+    await pubsub.publish("paid_invoice", payment.checking_id)
+
+
+async def _on_paid_invoice(checking_id: str):
+    payment = await get_standalone_payment(checking_id, incoming=True)
+    if not payment:
+        logger.warning(f"paid invoice {checking_id} not found")
+        return
+    wallet_invoice_listeners.send(payment)
+    for chan_name, send_channel in list(api_invoice_listeners.items()):
         try:
             logger.debug(f"api invoice listener: sending paid event to {chan_name}")
             send_channel.put_nowait(payment)
@@ -112,31 +245,19 @@ async def dispatch_api_invoice_listeners(payment: Payment):
             api_invoice_listeners.pop(chan_name)
 
 
+pubsub.subscribe("paid_invoice", _on_paid_invoice)
+
+
 async def dispatch_webhook(payment: Payment):
     """
-    Dispatches the webhook to the webhook url.
+    Adds the webhook to the outbox, `webhook_outbox` delivers and retries it.
     """
-    logger.debug("sending webhook", payment.webhook)
+    logger.debug("queueing webhook", payment.webhook)
 
     if not payment.webhook:
         return await mark_webhook_sent(payment.payment_hash, -1)
 
-    headers = {"User-Agent": settings.user_agent}
-    async with httpx.AsyncClient(headers=headers) as client:
-        data = payment.dict()
-        try:
-            r = await client.post(payment.webhook, json=data, timeout=40)
-            r.raise_for_status()
-            await mark_webhook_sent(payment.payment_hash, r.status_code)
-        except httpx.HTTPStatusError as exc:
-            await mark_webhook_sent(payment.payment_hash, exc.response.status_code)
-            logger.warning(
-                f"webhook returned a bad status_code: {exc.response.status_code} "
-                f"while requesting {exc.request.url!r}."
-            )
-        except httpx.RequestError:
-            await mark_webhook_sent(payment.payment_hash, -1)
-            logger.warning(f"Could not send webhook to {payment.webhook}")
+    await webhook_outbox.enqueue(payment)
 
 
 async def send_payment_push_notification(payment: Payment):
@@ -153,27 +274,139 @@ async def send_payment_push_notification(payment: Payment):
         if payment.memo:
             body += f"\r\n{payment.memo}"
 
+        notifications = []
         for subscription in subscriptions:
             # todo: review permissions when user-id-only not allowed
             # todo: replace all this logic with websockets?
             url = (
                 f"https://{subscription.host}/wallet?usr={wallet.user}&wal={wallet.id}"
             )
-            await send_push_notification(subscription, title, body, url)
+            notifications.append(PushNotification(subscription, title, body, url))
+        await webpush_sender.send_all(notifications)
 
 
-async def wait_for_audit_data():
+paid_invoice_stages: Dict[str, PaidInvoiceStage] = {
+    stage.name: stage
+    for stage in [
+        PaidInvoiceStage("api_listeners", dispatch_api_invoice_listeners),
+        PaidInvoiceStage("notification", send_paid_invoice_notification),
+        PaidInvoiceStage("webhook", dispatch_paid_invoice_webhook),
+        PaidInvoiceStage("push", send_payment_push_notification),
+    ]
+}
+
+
+class AuditWriter:
     """
-    Waits for audit entries to be pushed to the queue.
-    Then it inserts the entries into the DB.
+    Saves the audit entries of the `AuditMiddleware` in batches, with one
+    multi-row insert every `audit_batch_size` entries or
+    `audit_batch_interval_ms`. The queue is bounded, entries which do not fit
+    are dropped (and counted) instead of slowing down the requests.
+    A batch which still fails after `max_attempts` is saved entry by entry,
+    the entries which fail on their own are dropped.
     """
-    while settings.lnbits_running:
-        data: AuditEntry = await audit_queue.get()
+
+    max_attempts = 3
+    retry_delay = 3
+
+    def __init__(self, max_size: int) -> None:
+        self.queue: asyncio.Queue[AuditEntry] = asyncio.Queue(max(1, max_size))
+        self.batch: List[AuditEntry] = []
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.attempts = 0
+
+    def put(self, entry: AuditEntry) -> None:
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            if not self.dropped:
+                logger.warning("audit queue is full, dropping audit entries")
+            self.dropped += 1
+
+    async def run_forever(self) -> None:
+        while settings.lnbits_running:
+            await self._collect()
+            await self.write()
+
+    async def flush(self) -> None:
+        """Saves all the waiting entries, e.g. on shutdown."""
+        while True:
+            self._drain(max(1, settings.audit_batch_size))
+            if not self.batch:
+                return
+            if not await self.write():
+                return
+
+    async def write(self) -> bool:
+        if not self.batch:
+            return True
         try:
-            await create_audit_entry(data)
+            await create_audit_entries(self.batch)
         except Exception as ex:
-            logger.warning(ex)
-            await asyncio.sleep(3)
+            self.errors += 1
+            self.attempts += 1
+            logger.warning(f"could not save {len(self.batch)} audit entries: {ex}")
+            if self.attempts < self.max_attempts:
+                await asyncio.sleep(self.retry_delay)
+                return False
+            # one entry the database refuses must not block all the others
+            await self._write_one_by_one()
+            return True
+        self.written += len(self.batch)
+        self.batch = []
+        self.attempts = 0
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize() + len(self.batch),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    async def _collect(self) -> None:
+        batch_size = max(1, settings.audit_batch_size)
+        if not self.batch:
+            self.batch.append(await self.queue.get())
+        deadline = time.monotonic() + settings.audit_batch_interval_ms / 1000
+        while len(self.batch) < batch_size:
+            self._drain(batch_size)
+            timeout = deadline - time.monotonic()
+            if len(self.batch) >= batch_size or timeout <= 0:
+                return
+            try:
+                self.batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return
+
+    async def _write_one_by_one(self) -> None:
+        for entry in self.batch:
+            try:
+                await create_audit_entries([entry])
+                self.written += 1
+            except Exception as ex:
+                self.dropped += 1
+                logger.warning(f"dropping audit entry for `{entry.path}`: {ex}")
+        self.batch = []
+        self.attempts = 0
+
+    def _drain(self, batch_size: int) -> None:
+        while len(self.batch) < batch_size and not self.queue.empty():
+            self.batch.append(self.queue.get_nowait())
+
+
+audit_writer = AuditWriter(settings.audit_queue_size)
+
+
+async def wait_for_audit_data():
+    """
+    Waits for audit entries to be pushed to the queue.
+    Then it inserts the entries into the DB in batches.
+    """
+    await audit_writer.run_forever()
 
 
 async def purge_audit_data():
@@ -9,19 +9,36 @@ from urllib.parse import urlparse
 from fastapi import APIRouter, Depends
 from fastapi.responses import FileResponse
 
-from lnbits.core.models import User
+from lnbits.core.auth_cache import auth_cache
+from lnbits.core.models import User, WebhookDelivery
 from lnbits.core.services import (
     get_balance_delta,
+    publish_settings_update,
     update_cached_settings,
+    webhook_outbox,
+    websocket_manager,
 )
-from lnbits.core.tasks import api_invoice_listeners
+from lnbits.core.tasks import (
+    api_invoice_listeners,
+    audit_writer,
+    paid_invoice_stages,
+    wallet_invoice_listeners,
+)
+from lnbits.db import Database
 from lnbits.decorators import check_admin, check_super_user
-from lnbits.server import server_restart
+from lnbits.leader import leader_election
+from lnbits.pubsub import pubsub
+from lnbits.server import restart_server
 from lnbits.settings import AdminSettings, UpdateSettings, settings
-from lnbits.tasks import invoice_listeners
+from lnbits.tasks import invoice_listeners, pending_payments_reconciler
 
 from .. import core_app_extra
-from ..crud import delete_admin_settings, get_admin_settings, update_admin_settings
+from ..crud import (
+    delete_admin_settings,
+    get_admin_settings,
+    get_stuck_webhook_deliveries,
+    update_admin_settings,
+)
 
 admin_router = APIRouter(tags=["Admin UI"], prefix="/admin")
 
@@ -44,11 +61,47 @@ async def api_auditor():
 )
 async def api_monitor():
     return {
-        "invoice_listeners": list(invoice_listeners.keys()),
+        "invoice_listeners": [
+            listener.stats() for listener in invoice_listeners.values()
+        ],
         "api_invoice_listeners": list(api_invoice_listeners.keys()),
+        "sse_listeners": wallet_invoice_listeners.stats(),
+        "paid_invoice_stages": [
+            stage.stats() for stage in paid_invoice_stages.values()
+        ],
+        "databases": Database.all_pool_stats(),
+        "pending_payments": pending_payments_reconciler.stats(),
+        "webhooks": webhook_outbox.stats(),
+        "audit": audit_writer.stats(),
+        "websockets": websocket_manager.stats(),
+        "pubsub": pubsub.stats(),
+        "leader": leader_election.stats(),
+        "auth_cache": auth_cache.stats(),
     }
 
 
+@admin_router.post(
+    "/api/v1/pending-payments/check",
+    name="Check pending payments",
+    description="check all pending payments with the funding source now",
+    status_code=HTTPStatus.ACCEPTED,
+    dependencies=[Depends(check_admin)],
+)
+async def api_check_pending_payments() -> dict:
+    pending_payments_reconciler.trigger()
+    return pending_payments_reconciler.stats()
+
+
+@admin_router.get(
+    "/api/v1/webhooks/stuck",
+    name="Stuck webhooks",
+    description="list the webhook deliveries which failed or are being retried",
+    dependencies=[Depends(check_admin)],
+)
+async def api_stuck_webhooks(limit: int = 100) -> list[WebhookDelivery]:
+    return await get_stuck_webhook_deliveries(limit)
+
+
 @admin_router.get("/api/v1/settings", response_model=Optional[AdminSettings])
 async def api_get_settings(
     user: User = Depends(check_admin),
@@ -67,6 +120,7 @@ async def api_update_settings(data: UpdateSettings, user: User = Depends(check_a
     assert admin_settings, "Updated admin settings not found."
     update_cached_settings(admin_settings.dict())
     core_app_extra.register_new_ratelimiter()
+    await publish_settings_update()
     return {"status": "Success"}
 
 
@@ -77,7 +131,7 @@ async def api_update_settings(data: UpdateSettings, user: User = Depends(check_a
 )
 async def api_delete_settings() -> None:
     await delete_admin_settings()
-    server_restart.set()
+    restart_server()
 
 
 @admin_router.get(
@@ -86,7 +140,7 @@ async def api_delete_settings() -> None:
     dependencies=[Depends(check_super_user)],
 )
 async def api_restart_server() -> dict[str, str]:
-    server_restart.set()
+    restart_server()
     return {"status": "Success"}
 
 
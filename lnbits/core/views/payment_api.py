@@ -1,6 +1,5 @@
 import asyncio
 import json
-import uuid
 from http import HTTPStatus
 from math import ceil
 from typing import List, Optional
@@ -14,17 +13,21 @@ from fastapi import (
     HTTPException,
     Query,
     Request,
+    Response,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
 from sse_starlette.sse import EventSourceResponse
 
 from lnbits import bolt11
 from lnbits.core.models import (
     CreateInvoice,
+    CreateInvoices,
+    CreateInvoicesResult,
     CreateLnurl,
     DecodePayment,
     KeyType,
+    PayInvoices,
     PayLnurlWData,
     Payment,
     PaymentFilters,
@@ -45,22 +48,26 @@ from lnbits.utils.exchange_rates import fiat_amount_as_satoshis
 
 from ..crud import (
     DateTrunc,
+    get_cached_wallet_for_key,
     get_payments,
     get_payments_history,
     get_payments_paginated,
     get_standalone_payment,
-    get_wallet_for_key,
 )
 from ..services import (
     create_invoice,
+    create_invoices,
     fee_reserve_total,
     pay_invoice,
-    update_pending_payments,
+    pay_invoices,
+    update_pending_payments_in_background,
 )
-from ..tasks import api_invoice_listeners
+from ..tasks import wallet_invoice_listeners
 
 payment_router = APIRouter(prefix="/api/v1/payments", tags=["Payments"])
 
+SSE_DISCONNECT_CHECK_INTERVAL = 10
+
 
 @payment_router.get(
     "",
@@ -74,7 +81,7 @@ async def api_payments(
     key_info: WalletTypeInfo = Depends(require_invoice_key),
     filters: Filters = Depends(parse_filters(PaymentFilters)),
 ):
-    await update_pending_payments(key_info.wallet.id)
+    update_pending_payments_in_background(key_info.wallet.id)
     return await get_payments(
         wallet_id=key_info.wallet.id,
         pending=True,
@@ -94,7 +101,7 @@ async def api_payments_history(
     group: DateTrunc = Query("day"),
     filters: Filters[PaymentFilters] = Depends(parse_filters(PaymentFilters)),
 ):
-    await update_pending_payments(key_info.wallet.id)
+    update_pending_payments_in_background(key_info.wallet.id)
     return await get_payments_history(key_info.wallet.id, group, filters)
 
 
@@ -110,7 +117,7 @@ async def api_payments_paginated(
     key_info: WalletTypeInfo = Depends(require_invoice_key),
     filters: Filters = Depends(parse_filters(PaymentFilters)),
 ):
-    await update_pending_payments(key_info.wallet.id)
+    update_pending_payments_in_background(key_info.wallet.id)
     page = await get_payments_paginated(
         wallet_id=key_info.wallet.id,
         pending=True,
@@ -227,6 +234,89 @@ async def api_payments_create(
         )
 
 
+@payment_router.post(
+    "/batch",
+    summary="Pay many invoices",
+    description="""
+        Pays a list of BOLT11 invoices from the authorized wallet. The wallet
+        limits and the balance are checked for the whole batch before any
+        invoice is paid. Returns one JSON result per line (`application/x-ndjson`)
+        as soon as each payment is settled, pending or failed.
+    """,
+    responses={
+        400: {"description": "Too many invoices in the batch."},
+        401: {"description": "Admin key required."},
+        520: {"description": "The batch was rejected."},
+    },
+)
+async def api_payments_pay_batch(
+    data: PayInvoices,
+    wallet: WalletTypeInfo = Depends(require_admin_key),
+) -> StreamingResponse:
+    if len(data.payment_requests) > settings.lnbits_batch_payments_max:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=(
+                "Too many invoices, the maximum is "
+                f"{settings.lnbits_batch_payments_max}."
+            ),
+        )
+    results = await pay_invoices(
+        wallet_id=wallet.wallet.id,
+        payment_requests=data.payment_requests,
+        max_sat=data.max_sat,
+        extra=data.extra,
+    )
+
+    async def _stream():
+        async for result in results:
+            yield result.json() + "\n"
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
+@payment_router.post(
+    "/invoices/batch",
+    summary="Create many invoices",
+    description="""
+        Creates one incoming invoice per amount for the authorized wallet.
+        If the funding source fails, the remaining invoices are not created and
+        the response has the `error` and the invoices created before it.
+    """,
+    status_code=HTTPStatus.CREATED,
+    responses={
+        400: {"description": "Too many invoices in the batch."},
+        520: {"description": "Not all invoices could be created."},
+    },
+)
+async def api_payments_create_invoices(
+    data: CreateInvoices,
+    response: Response,
+    wallet: WalletTypeInfo = Depends(require_invoice_key),
+) -> CreateInvoicesResult:
+    if len(data.amounts) > settings.lnbits_batch_payments_max:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=(
+                "Too many invoices, the maximum is "
+                f"{settings.lnbits_batch_payments_max}."
+            ),
+        )
+    result = await create_invoices(
+        wallet_id=wallet.wallet.id,
+        amounts=data.amounts,
+        currency=data.unit,
+        memo=data.memo or settings.lnbits_site_title,
+        expiry=data.expiry,
+        extra=data.extra,
+        webhook=data.webhook,
+        internal=data.internal,
+    )
+    if result.error:
+        response.status_code = 520
+    return result
+
+
 @payment_router.get("/fee-reserve")
 async def api_payments_fee_reserve(invoice: str = Query("invoice")) -> JSONResponse:
     invoice_obj = bolt11.decode(invoice)
@@ -318,35 +408,42 @@ async def subscribe_wallet_invoices(request: Request, wallet: Wallet):
     Subscribe to new invoices for a wallet. Can be wrapped in EventSourceResponse.
     Listenes invoming payments for a wallet and yields jsons with payment details.
     """
-    this_wallet_id = wallet.id
-
-    payment_queue: asyncio.Queue[Payment] = asyncio.Queue(0)
-
-    uid = f"{this_wallet_id}_{str(uuid.uuid4())[:8]}"
+    uid, payment_queue = wallet_invoice_listeners.add(wallet.id)
     logger.debug(f"adding sse listener for wallet: {uid}")
-    api_invoice_listeners[uid] = payment_queue
 
     try:
-        while settings.lnbits_running:
-            if await request.is_disconnected():
-                await request.close()
-                break
-            payment: Payment = await payment_queue.get()
-            if payment.wallet_id == this_wallet_id:
-                logger.debug("sse listener: payment received", payment)
-                yield {"data": payment.json(), "event": "payment-received"}
+        # the listener is removed when its queue overflows, send what is left
+        while settings.lnbits_running and (
+            wallet_invoice_listeners.has(wallet.id, uid) or not payment_queue.empty()
+        ):
+            try:
+                payment: Payment = await asyncio.wait_for(
+                    payment_queue.get(), SSE_DISCONNECT_CHECK_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                # do not wait for the next payment to notice a disconnect
+                if await request.is_disconnected():
+                    break
+                continue
+            logger.debug("sse listener: payment received", payment)
+            yield {"data": payment.json(), "event": "payment-received"}
     except asyncio.CancelledError:
         logger.debug(f"removing listener for wallet {uid}")
     except Exception as exc:
         logger.error(f"Error in sse: {exc}")
     finally:
-        api_invoice_listeners.pop(uid)
+        wallet_invoice_listeners.remove(wallet.id, uid)
 
 
 @payment_router.get("/sse")
 async def api_payments_sse(
     request: Request, key_info: WalletTypeInfo = Depends(require_invoice_key)
 ):
+    if wallet_invoice_listeners.full:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Too many open SSE connections.",
+        )
     return EventSourceResponse(
         subscribe_wallet_invoices(request, key_info.wallet),
         ping=20,
@@ -359,7 +456,11 @@ async def api_payments_sse(
 async def api_payment(payment_hash, x_api_key: Optional[str] = Header(None)):
     # We use X_Api_Key here because we want this call to work with and without keys
     # If a valid key is given, we also return the field "details", otherwise not
-    wallet = await get_wallet_for_key(x_api_key) if isinstance(x_api_key, str) else None
+    wallet = (
+        await get_cached_wallet_for_key(x_api_key)
+        if isinstance(x_api_key, str)
+        else None
+    )
 
     payment = await get_standalone_payment(
         payment_hash, wallet_id=wallet.id if wallet else None
@@ -21,6 +21,8 @@ async def websocket_connect(websocket: WebSocket, item_id: str):
         while settings.lnbits_running:
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         websocket_manager.disconnect(websocket)
 
 
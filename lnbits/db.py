@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import base64
 import json
 import os
 import re
@@ -8,12 +9,26 @@ import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Generic, Literal, Optional, TypeVar, Union, get_origin
+from functools import lru_cache
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Generic,
+    Literal,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+    get_origin,
+)
 
 from loguru import logger
-from pydantic import BaseModel, ValidationError, root_validator
+from pydantic import BaseModel, Extra, ValidationError, root_validator
+from pydantic.fields import SHAPE_SINGLETON, ModelField
 from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.sql import text
 
 from lnbits.settings import settings
@@ -121,6 +136,47 @@ class Connection(Compat):
         self.type = typ
         self.name = name
         self.schema = schema
+        # set inside of `transaction()`, statements are committed at its end
+        self.in_transaction = False
+        self._after_commit: list[Callable[[], Awaitable[None]]] = []
+
+    async def commit(self):
+        """Commits the current statements, unless inside of a `transaction()`."""
+        if not self.in_transaction:
+            await self.conn.commit()
+
+    async def after_commit(self, func: Callable[[], Awaitable[None]]) -> None:
+        """
+        Runs `func` once the current `transaction()` is committed, or right away
+        outside of one. It is not run if the transaction is rolled back.
+        """
+        if not self.in_transaction:
+            await func()
+            return
+        self._after_commit.append(func)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Commits all statements of the block at once at its end and rolls them back
+        if the block raises. Nested blocks are part of the outermost transaction.
+        """
+        if self.in_transaction:
+            yield self
+            return
+        self.in_transaction = True
+        try:
+            yield self
+            await self.conn.commit()
+        except BaseException:
+            self._after_commit.clear()
+            await self.conn.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+        committed, self._after_commit = self._after_commit, []
+        for func in committed:
+            await func()
 
     def rewrite_query(self, query) -> str:
         if self.type in {POSTGRES, COCKROACH}:
@@ -128,13 +184,15 @@ class Connection(Compat):
             query = query.replace("?", "%s")
         return query
 
-    def rewrite_values(self, values: dict) -> dict:
-        # strip html
-        clean_regex = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
+    def rewrite_values(self, values: dict, sanitize: bool = False) -> dict:
+        """
+        Converts the values to database types, with `sanitize` html is stripped
+        from strings (only for writes, reads bind their parameters untouched).
+        """
         clean_values: dict = {}
         for key, raw_value in values.items():
-            if isinstance(raw_value, str):
-                clean_values[key] = re.sub(clean_regex, "", raw_value)
+            if sanitize and isinstance(raw_value, str):
+                clean_values[key] = strip_html(raw_value)
             elif isinstance(raw_value, datetime):
                 ts = raw_value.timestamp()
                 if self.type == SQLITE:
@@ -181,13 +239,38 @@ class Connection(Compat):
         await self.conn.execute(
             text(update_query(table_name, model, where)), model_to_dict(model)
         )
-        await self.conn.commit()
+        await self.commit()
 
     async def insert(self, table_name: str, model: BaseModel):
         await self.conn.execute(
             text(insert_query(table_name, model)), model_to_dict(model)
         )
-        await self.conn.commit()
+        await self.commit()
+
+    async def insert_many(self, table_name: str, models: Sequence[BaseModel]):
+        """Inserts models of the same class with one statement and one commit."""
+        if not models:
+            return
+        await self.conn.execute(
+            text(insert_query(table_name, models[0])),
+            [model_to_dict(model) for model in models],
+        )
+        await self.commit()
+
+    async def update_many(
+        self,
+        table_name: str,
+        models: Sequence[BaseModel],
+        where: str = "WHERE id = :id",
+    ):
+        """Updates models of the same class with one statement and one commit."""
+        if not models:
+            return
+        await self.conn.execute(
+            text(update_query(table_name, models[0], where)),
+            [model_to_dict(model) for model in models],
+        )
+        await self.commit()
 
     async def fetch_page(
         self,
@@ -197,12 +280,32 @@ class Connection(Compat):
         filters: Optional[Filters] = None,
         model: Optional[type[TModel]] = None,
         group_by: Optional[list[str]] = None,
+        cursor_key: Optional[str] = None,
     ) -> Page[TModel]:
+        """
+        Fetch a page of rows, paginated by `limit/offset` or, if the caller passes
+        a unique `cursor_key` column, by the `after` cursor of the filters.
+        """
         if not filters:
             filters = Filters()
-        clause = filters.where(where)
+        where = where or []
+        clause = filters.where([*where])
         parsed_values = filters.values(values)
 
+        page_clause = clause
+        page_values = parsed_values
+        if filters.after:
+            if not cursor_key:
+                raise ValueError("Cursor pagination is not supported for this query.")
+            if filters.sort_field_nullable(model):
+                raise ValueError(
+                    "Cursor pagination is not supported when sorting by "
+                    f"`{filters.sortby}`, it can be null."
+                )
+            keyset, keyset_values = filters.keyset(cursor_key, model)
+            page_clause = filters.where([*where, keyset])
+            page_values = {**parsed_values, **keyset_values}
+
         group_by_string = ""
         if group_by:
             for field in group_by:
@@ -215,18 +318,29 @@ class Connection(Compat):
         rows = await self.fetchall(
             f"""
             {query}
-            {clause}
+            {page_clause}
             {group_by_string}
-            {filters.order_by()}
+            {filters.order_by(cursor_key)}
             {filters.pagination()}
             """,
-            self.rewrite_values(parsed_values),
+            self.rewrite_values(page_values),
             model,
         )
-        if rows:
+
+        next_cursor = None
+        if (
+            cursor_key
+            and filters.limit
+            and len(rows) == filters.limit
+            and not filters.sort_field_nullable(model)
+        ):
+            next_cursor = filters.next_cursor(rows[-1], cursor_key)
+
+        count: Optional[int] = None
+        if filters.include_total and (rows or filters.after):
             # no need for extra query if no pagination is specified
-            if filters.offset or filters.limit:
-                result = await self.execute(
+            if filters.offset or filters.limit or filters.after:
+                row: dict = await self.fetchone(
                     f"""
                     SELECT COUNT(*) as count FROM (
                         {query}
@@ -236,27 +350,29 @@ class Connection(Compat):
                     """,
                     parsed_values,
                 )
-                row = result.mappings().first()
-                result.close()
                 count = int(row.get("count", 0))
             else:
                 count = len(rows)
-        else:
+        elif filters.include_total:
             count = 0
 
         return Page(
             data=rows,
             total=count,
+            next_cursor=next_cursor,
         )
 
     async def execute(self, query: str, values: Optional[dict] = None):
-        params = self.rewrite_values(values) if values else {}
+        params = self.rewrite_values(values, sanitize=True) if values else {}
         result = await self.conn.execute(text(self.rewrite_query(query)), params)
-        await self.conn.commit()
+        await self.commit()
         return result
 
 
 class Database(Compat):
+    # every database by name, used for the pool statistics
+    instances: dict[str, Database] = {}
+
     def __init__(self, db_name: str):
         self.name = db_name
         self.schema = self.name
@@ -277,56 +393,163 @@ class Database(Compat):
         else:
             self.schema = None
 
-        self.engine: AsyncEngine = create_async_engine(
-            database_uri, echo=settings.debug_database
-        )
+        # read only connections, only used for SQLite in WAL mode
+        self.reader_engine: Optional[AsyncEngine] = None
+        # the extension schema is created on the first connection
+        self.schema_created = False
 
         if self.type in {POSTGRES, COCKROACH}:
+            self.engine: AsyncEngine = _shared_engine(database_uri)
+        elif self.sqlite_wal:
+            # a single long lived connection serves all writes
+            self.engine = create_async_engine(
+                database_uri,
+                echo=settings.debug_database,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=1,
+                max_overflow=0,
+            )
+            self.reader_engine = create_async_engine(
+                database_uri,
+                echo=settings.debug_database,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=settings.lnbits_database_sqlite_readers,
+                max_overflow=0,
+                pool_timeout=settings.lnbits_database_pool_timeout,
+            )
 
             @event.listens_for(self.engine.sync_engine, "connect")
-            def register_custom_types(dbapi_connection, *_):
-                def _parse_date(value) -> datetime:
-                    if value is None:
-                        value = "1970-01-01 00:00:00"
-                    f = "%Y-%m-%d %H:%M:%S.%f"
-                    if "." not in value:
-                        f = "%Y-%m-%d %H:%M:%S"
-                    return datetime.strptime(value, f)
-
-                dbapi_connection.run_async(
-                    lambda connection: connection.set_type_codec(
-                        "TIMESTAMP",
-                        encoder=datetime,
-                        decoder=_parse_date,
-                        schema="pg_catalog",
-                    )
-                )
+            def set_writer_pragmas(dbapi_connection, *_):
+                self._set_sqlite_pragmas(dbapi_connection, query_only=False)
+
+            @event.listens_for(self.reader_engine.sync_engine, "connect")
+            def set_reader_pragmas(dbapi_connection, *_):
+                self._set_sqlite_pragmas(dbapi_connection, query_only=True)
+
+        else:
+            self.engine = create_async_engine(
+                database_uri, echo=settings.debug_database
+            )
 
+        # SQLite allows a single writer only, so connections are serialized.
+        # PostgreSQL and CockroachDB rely on the connection pool instead.
         self.lock = asyncio.Lock()
 
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+        Database.instances[self.name] = self
         logger.trace(f"database {self.type} added for {self.name}")
 
+    @property
+    def sqlite_wal(self) -> bool:
+        return self.type == SQLITE and settings.lnbits_database_sqlite_wal
+
+    def _set_sqlite_pragmas(self, dbapi_connection, query_only: bool) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={settings.lnbits_database_sqlite_mmap_size}")
+        cursor.execute(
+            f"PRAGMA cache_size={settings.lnbits_database_sqlite_cache_size}"
+        )
+        # pooled connections are reused, so the schema is attached only once
+        if self.schema:
+            cursor.execute(f"ATTACH '{self.path}' AS {self.schema}")
+        if query_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
     @asynccontextmanager
-    async def connect(self):
-        await self.lock.acquire()
+    async def _checkout(self, engine: AsyncEngine, serialize: bool):
+        self.waiting += 1
+        start = time.monotonic()
         try:
-            async with self.engine.connect() as conn:
-                if not conn:
-                    raise Exception("Could not connect to the database")
+            if serialize:
+                await self.lock.acquire()
+            try:
+                conn = await engine.connect()
+            except BaseException:
+                if serialize:
+                    self.lock.release()
+                raise
+        finally:
+            self.waiting -= 1
 
-                wconn = Connection(conn, self.type, self.name, self.schema)
+        wait_time = time.monotonic() - start
+        self.checkouts += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        self.in_use += 1
+        try:
+            yield conn
+        finally:
+            self.in_use -= 1
+            try:
+                await conn.close()
+            finally:
+                if serialize:
+                    self.lock.release()
 
-                if self.schema:
-                    if self.type in {POSTGRES, COCKROACH}:
+    @asynccontextmanager
+    async def connect(self):
+        async with self._checkout(self.engine, self.type == SQLITE) as conn:
+            if not conn:
+                raise Exception("Could not connect to the database")
+
+            wconn = Connection(conn, self.type, self.name, self.schema)
+
+            if self.schema:
+                if self.type in {POSTGRES, COCKROACH}:
+                    if not self.schema_created:
                         await wconn.execute(
                             f"CREATE SCHEMA IF NOT EXISTS {self.schema}"
                         )
-                    elif self.type == SQLITE:
-                        await wconn.execute(f"ATTACH '{self.path}' AS {self.schema}")
+                        self.schema_created = True
+                elif self.type == SQLITE and not self.sqlite_wal:
+                    await wconn.execute(f"ATTACH '{self.path}' AS {self.schema}")
 
-                yield wconn
-        finally:
-            self.lock.release()
+            yield wconn
+
+    @asynccontextmanager
+    async def reader(self):
+        """
+        Connection for read only queries. For SQLite in WAL mode it is taken from
+        a pool of `query_only` connections which do not wait for the writer.
+        Otherwise it is the same as `connect()`.
+        """
+        if not self.reader_engine:
+            async with self.connect() as conn:
+                yield conn
+            return
+
+        async with self._checkout(self.reader_engine, False) as conn:
+            yield Connection(conn, self.type, self.name, self.schema)
+
+    def pool_stats(self) -> PoolStats:
+        pool = self.engine.pool
+        return PoolStats(
+            name=self.name,
+            type=self.type,
+            pool_size=pool.size() if isinstance(pool, QueuePool) else None,
+            overflow=pool.overflow() if isinstance(pool, QueuePool) else None,
+            in_use=self.in_use,
+            waiting=self.waiting,
+            checkouts=self.checkouts,
+            wait_time_total=round(self.wait_time_total, 6),
+            wait_time_max=round(self.wait_time_max, 6),
+        )
+
+    @classmethod
+    def all_pool_stats(cls) -> list[PoolStats]:
+        """
+        Statistics of the core and every extension database. On PostgreSQL they
+        share one pool, the usage counters are kept per database.
+        """
+        return [database.pool_stats() for database in cls.instances.values()]
 
     async def fetchall(
         self,
@@ -334,7 +557,7 @@ class Database(Compat):
         values: Optional[dict] = None,
         model: Optional[type[TModel]] = None,
     ) -> list[TModel]:
-        async with self.connect() as conn:
+        async with self.reader() as conn:
             return await conn.fetchall(query, values, model)
 
     async def fetchone(
@@ -343,7 +566,7 @@ class Database(Compat):
         values: Optional[dict] = None,
         model: Optional[type[TModel]] = None,
     ) -> TModel:
-        async with self.connect() as conn:
+        async with self.reader() as conn:
             return await conn.fetchone(query, values, model)
 
     async def insert(self, table_name: str, model: BaseModel) -> None:
@@ -356,6 +579,19 @@ class Database(Compat):
         async with self.connect() as conn:
             await conn.update(table_name, model, where)
 
+    async def insert_many(self, table_name: str, models: Sequence[BaseModel]) -> None:
+        async with self.connect() as conn:
+            await conn.insert_many(table_name, models)
+
+    async def update_many(
+        self,
+        table_name: str,
+        models: Sequence[BaseModel],
+        where: str = "WHERE id = :id",
+    ) -> None:
+        async with self.connect() as conn:
+            await conn.update_many(table_name, models, where)
+
     async def fetch_page(
         self,
         query: str,
@@ -364,9 +600,12 @@ class Database(Compat):
         filters: Optional[Filters] = None,
         model: Optional[type[TModel]] = None,
         group_by: Optional[list[str]] = None,
+        cursor_key: Optional[str] = None,
     ) -> Page[TModel]:
-        async with self.connect() as conn:
-            return await conn.fetch_page(query, where, values, filters, model, group_by)
+        async with self.reader() as conn:
+            return await conn.fetch_page(
+                query, where, values, filters, model, group_by, cursor_key
+            )
 
     async def execute(self, query: str, values: Optional[dict] = None):
         async with self.connect() as conn:
@@ -376,6 +615,16 @@ class Database(Compat):
     async def reuse_conn(self, conn: Connection):
         yield conn
 
+    @asynccontextmanager
+    async def transaction(self, conn: Optional[Connection] = None):
+        """
+        Runs the block in one transaction, on `conn` if given or on a new
+        connection. See `Connection.transaction()`.
+        """
+        async with self.reuse_conn(conn) if conn else self.connect() as new_conn:
+            async with new_conn.transaction():
+                yield new_conn
+
     @classmethod
     async def clean_ext_db_files(cls, ext_id: str) -> bool:
         """
@@ -383,15 +632,83 @@ class Database(Compat):
         delete the files and return True. Otherwise do nothing and return False.
         """
 
+        database = cls.instances.get(f"ext_{ext_id}")
+        if database:
+            # the schema is created again on the next connection
+            database.schema_created = False
+
         if DB_TYPE == SQLITE:
+            if database:
+                # pooled connections keep the deleted files open, reads would
+                # still return the old rows and writes would go to the old file
+                await database.engine.dispose()
+                if database.reader_engine:
+                    await database.reader_engine.dispose()
             db_file = os.path.join(settings.lnbits_data_folder, f"ext_{ext_id}.sqlite3")
-            if os.path.isfile(db_file):
-                os.remove(db_file)
+            # WAL mode keeps the write-ahead log and shared memory next to the file
+            for path in (db_file, f"{db_file}-wal", f"{db_file}-shm"):
+                if os.path.isfile(path):
+                    os.remove(path)
             return True
 
         return False
 
 
+# one engine and connection pool per PostgreSQL url, shared by all databases
+_shared_engines: dict[str, AsyncEngine] = {}
+
+
+def _shared_engine(database_uri: str) -> AsyncEngine:
+    engine = _shared_engines.get(database_uri)
+    if engine:
+        return engine
+
+    engine = create_async_engine(
+        database_uri,
+        echo=settings.debug_database,
+        pool_size=settings.lnbits_database_pool_size,
+        max_overflow=settings.lnbits_database_max_overflow,
+        pool_timeout=settings.lnbits_database_pool_timeout,
+        pool_pre_ping=True,
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def register_custom_types(dbapi_connection, *_):
+        def _parse_date(value) -> datetime:
+            if value is None:
+                value = "1970-01-01 00:00:00"
+            f = "%Y-%m-%d %H:%M:%S.%f"
+            if "." not in value:
+                f = "%Y-%m-%d %H:%M:%S"
+            return datetime.strptime(value, f)
+
+        dbapi_connection.run_async(
+            lambda connection: connection.set_type_codec(
+                "TIMESTAMP",
+                encoder=datetime,
+                decoder=_parse_date,
+                schema="pg_catalog",
+            )
+        )
+
+    _shared_engines[database_uri] = engine
+    return engine
+
+
+class PoolStats(BaseModel):
+    name: str
+    type: Optional[str]
+    # size and overflow of the engine pool, not available for SQLite
+    pool_size: Optional[int] = None
+    overflow: Optional[int] = None
+    in_use: int
+    waiting: int
+    checkouts: int
+    # seconds spent waiting for a connection
+    wait_time_total: float
+    wait_time_max: float
+
+
 class Operator(Enum):
     GT = "gt"
     LT = "lt"
@@ -436,7 +753,10 @@ TFilterModel = TypeVar("TFilterModel", bound=FilterModel)
 
 class Page(BaseModel, Generic[T]):
     data: list[T]
-    total: int
+    # `None` if the total was not requested (`include_total=false`)
+    total: Optional[int]
+    # pass as `after` to get the next page, only set for cursor paginated queries
+    next_cursor: Optional[str] = None
 
 
 class Filter(BaseModel, Generic[TFilterModel]):
@@ -506,6 +826,10 @@ class Filters(BaseModel, Generic[TFilterModel]):
     sortby: Optional[str] = None
     direction: Optional[Literal["asc", "desc"]] = None
 
+    # opaque cursor returned as `next_cursor` of the previous page
+    after: Optional[str] = None
+    include_total: bool = True
+
     model: Optional[type[TFilterModel]] = None
 
     @root_validator(pre=True)
@@ -524,7 +848,8 @@ class Filters(BaseModel, Generic[TFilterModel]):
         stmt = ""
         if self.limit:
             stmt += f"LIMIT {self.limit} "
-        if self.offset:
+        # the cursor already skips the previous pages
+        if self.offset and not self.after:
             stmt += f"OFFSET {self.offset}"
         return stmt
 
@@ -544,11 +869,78 @@ class Filters(BaseModel, Generic[TFilterModel]):
             return "WHERE " + " AND ".join(where_stmts)
         return ""
 
-    def order_by(self) -> str:
+    def order_by(self, cursor_key: Optional[str] = None) -> str:
+        order = []
         if self.sortby:
-            return f"ORDER BY {self.sortby} {self.direction or 'asc'}"
+            order.append(f"{self.sortby} {self.direction or 'asc'}")
+        # a unique key makes the order stable, which cursors depend on
+        if cursor_key and cursor_key != self.sortby:
+            order.append(f"{cursor_key} {self.direction or 'asc'}")
+        if order:
+            return f"ORDER BY {', '.join(order)}"
         return ""
 
+    def sort_field(
+        self, model: Optional[type[BaseModel]] = None
+    ) -> Optional[ModelField]:
+        if not self.sortby:
+            return None
+        field = self.sortby.split(".")[-1]
+        for field_model in (self.model, model):
+            if field_model and field in field_model.__fields__:
+                return field_model.__fields__[field]
+        return None
+
+    def sort_field_nullable(self, model: Optional[type[BaseModel]] = None) -> bool:
+        """
+        Whether the sort field can be null. Null values can not be compared, so
+        such a sort field does not work with cursors.
+        """
+        sort_field = self.sort_field(model)
+        return bool(sort_field and sort_field.allow_none)
+
+    def next_cursor(self, row: Any, cursor_key: str) -> Optional[str]:
+        """
+        Encodes the position of `row` as a cursor. Returns `None` if the sort
+        value is null, rows can not be compared to it.
+        """
+        key_value = _row_value(row, cursor_key)
+        sort_value = _row_value(row, self.sortby) if self.sortby else None
+        if key_value is None or (self.sortby and sort_value is None):
+            return None
+        if isinstance(sort_value, datetime):
+            # keep the sub second precision, `rewrite_values` would drop it on SQLite
+            sort_value = sort_value.timestamp()
+        cursor = json.dumps([sort_value, key_value])
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def keyset(
+        self, cursor_key: str, model: Optional[type[BaseModel]] = None
+    ) -> tuple[str, dict]:
+        """
+        WHERE statement and values selecting the rows after the `after` cursor.
+        """
+        try:
+            sort_value, key_value = json.loads(
+                base64.urlsafe_b64decode(self.after or "")
+            )
+        except Exception as exc:
+            raise ValueError("Invalid pagination cursor.") from exc
+
+        op = "<" if self.direction == "desc" else ">"
+        if not self.sortby or self.sortby == cursor_key:
+            return f"{cursor_key} {op} :cursor_key", {"cursor_key": key_value}
+
+        placeholder = ":cursor_sort"
+        sort_field = self.sort_field(model)
+        if sort_field and sort_field.type_ == datetime:
+            placeholder = compat_timestamp_placeholder("cursor_sort")
+        stmt = (
+            f"({self.sortby} {op} {placeholder} OR "
+            f"({self.sortby} = {placeholder} AND {cursor_key} {op} :cursor_key))"
+        )
+        return stmt, {"cursor_sort": sort_value, "cursor_key": key_value}
+
     def values(self, values: Optional[dict] = None) -> dict:
         if not values:
             values = {}
@@ -562,20 +954,23 @@ class Filters(BaseModel, Generic[TFilterModel]):
         return values
 
 
+def _row_value(row: Any, field: str) -> Any:
+    field = field.split(".")[-1]
+    if isinstance(row, BaseModel):
+        return getattr(row, field, None)
+    return row.get(field)
+
+
 def insert_query(table_name: str, model: BaseModel) -> str:
     """
     Generate an insert query with placeholders for a given table and model
     :param table_name: Name of the table
     :param model: Pydantic model
     """
-    placeholders = []
-    keys = model_to_dict(model).keys()
-    for field in keys:
-        placeholders.append(get_placeholder(model, field))
-    # add quotes to keys to avoid SQL conflicts (e.g. `user` is a reserved keyword)
-    fields = ", ".join([f'"{key}"' for key in keys])
-    values = ", ".join(placeholders)
-    return f"INSERT INTO {table_name} ({fields}) VALUES ({values})"
+    if model.__config__.extra == Extra.allow:
+        # extra fields are part of the model dict, the statement differs per model
+        return _insert_query(table_name, model, tuple(model_to_dict(model).keys()))
+    return _cached_insert_query(table_name, model.__class__)
 
 
 def update_query(
@@ -587,8 +982,32 @@ def update_query(
     :param model: Pydantic model
     :param where: Where string, default to `WHERE id = :id`
     """
+    if model.__config__.extra == Extra.allow:
+        keys = tuple(model_to_dict(model).keys())
+        return _update_query(table_name, model, keys, where)
+    return _cached_update_query(table_name, model.__class__, where)
+
+
+def _insert_query(
+    table_name: str, model: Union[BaseModel, type[BaseModel]], keys: tuple[str, ...]
+) -> str:
+    placeholders = []
+    for field in keys:
+        placeholders.append(get_placeholder(model, field))
+    # add quotes to keys to avoid SQL conflicts (e.g. `user` is a reserved keyword)
+    fields = ", ".join([f'"{key}"' for key in keys])
+    values = ", ".join(placeholders)
+    return f"INSERT INTO {table_name} ({fields}) VALUES ({values})"
+
+
+def _update_query(
+    table_name: str,
+    model: Union[BaseModel, type[BaseModel]],
+    keys: tuple[str, ...],
+    where: str,
+) -> str:
     fields = []
-    for field in model_to_dict(model).keys():
+    for field in keys:
         placeholder = get_placeholder(model, field)
         # add quotes to keys to avoid SQL conflicts (e.g. `user` is a reserved keyword)
         fields.append(f'"{field}" = {placeholder}')
@@ -596,17 +1015,52 @@ def update_query(
     return f"UPDATE {table_name} SET {query} {where}"
 
 
+def _database_keys(model: type[BaseModel]) -> tuple[str, ...]:
+    """The keys `model_to_dict` returns for every instance of `model`"""
+    return tuple(
+        name
+        for name, field in model.__fields__.items()
+        if not field.field_info.extra.get("no_database", False)
+    )
+
+
+@lru_cache(maxsize=None)
+def _cached_insert_query(table_name: str, model: type[BaseModel]) -> str:
+    return _insert_query(table_name, model, _database_keys(model))
+
+
+@lru_cache(maxsize=None)
+def _cached_update_query(table_name: str, model: type[BaseModel], where: str) -> str:
+    return _update_query(table_name, model, _database_keys(model), where)
+
+
+# html tags and entities, stripped from user provided text before it is written
+html_clean_regex = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
+
+
+def strip_html(value: str) -> str:
+    """Removes html tags and entities from `value`."""
+    if "<" not in value and "&" not in value:
+        return value
+    return html_clean_regex.sub("", value)
+
+
 def model_to_dict(model: BaseModel) -> dict:
     """
     Convert a Pydantic model to a dictionary with JSON-encoded nested models
-    private fields starting with _ are ignored
+    private fields starting with _ are ignored, html is stripped from string
+    fields declared with `Field(sanitize=True)`
     :param model: Pydantic model
     """
     _dict: dict = {}
     for key, value in model.dict().items():
         type_ = model.__fields__[key].type_
         outertype_ = model.__fields__[key].outer_type_
-        if model.__fields__[key].field_info.extra.get("no_database", False):
+        field_info = model.__fields__[key].field_info
+        if field_info.extra.get("no_database", False):
+            continue
+        if isinstance(value, str) and field_info.extra.get("sanitize", False):
+            _dict[key] = strip_html(value)
             continue
         if isinstance(value, datetime):
             _dict[key] = value.timestamp()
@@ -642,42 +1096,91 @@ def dict_to_model(_row: dict, model: type[TModel]) -> TModel:
     :param _dict: Dictionary from database
     :param model: Pydantic model
     """
-    _dict: dict = {}
-    for key, value in _row.items():
-        if value is None:
-            continue
-        if key not in model.__fields__:
-            # Somethimes an SQL JOIN will create additional column
-            continue
-        type_ = model.__fields__[key].type_
-        outertype_ = model.__fields__[key].outer_type_
-        if get_origin(outertype_) is list:
-            _items = json.loads(value) if isinstance(value, str) else value
-            _dict[key] = [
-                dict_to_submodel(type_, v) if issubclass(type_, BaseModel) else v
-                for v in _items
-            ]
-            continue
-        if issubclass(type_, bool):
-            _dict[key] = bool(value)
-            continue
-        if issubclass(type_, datetime):
+    decoder = _row_decoders.get(model)
+    if not decoder:
+        decoder = _row_decoders[model] = RowDecoder(model)
+    return decoder.decode(_row)
+
+
+class RowDecoder(Generic[TModel]):
+    """
+    Decodes database rows into a model. How every column is converted is worked
+    out once per model, instead of inspecting the fields again for every row.
+
+    Models without a custom `__init__`, without validators and with only plain
+    field types are built with `construct()`, the converted database values
+    already have the right types. All other models are validated once.
+    """
+
+    _trusted_types = (str, int, float, bool, datetime, dict)
+
+    def __init__(self, model: type[TModel]):
+        self.model = model
+        self.converters: dict[str, Optional[Callable[[Any], Any]]] = {}
+        self.trusted = (
+            model.__init__ is BaseModel.__init__
+            and not model.__validators__
+            and not model.__pre_root_validators__
+            and not model.__post_root_validators__
+        )
+        self.required = {
+            name for name, field in model.__fields__.items() if field.required
+        }
+        for name, field in model.__fields__.items():
+            self.converters[name] = self._converter(field)
+
+    def _converter(self, field: ModelField) -> Optional[Callable[[Any], Any]]:
+        if field.alias != field.name:
+            self.trusted = False
+        type_ = field.type_
+        is_model = isinstance(type_, type) and issubclass(type_, BaseModel)
+        if get_origin(field.outer_type_) is list:
+            if not (is_model or type_ in self._trusted_types or type_ is Any):
+                self.trusted = False
+
+            def _list(value):
+                items = json.loads(value) if isinstance(value, str) else value
+                if is_model:
+                    return [dict_to_submodel(type_, v) for v in items]
+                return items
+
+            return _list
+
+        if field.shape != SHAPE_SINGLETON and type_ is not dict:
+            self.trusted = False
+            return None
+        if type_ is bool:
+            return bool
+        if type_ is datetime:
             if DB_TYPE == SQLITE:
-                _dict[key] = datetime.fromtimestamp(value, timezone.utc)
-            else:
-                _dict[key] = value
-            continue
-        if issubclass(type_, BaseModel):
-            _dict[key] = dict_to_submodel(type_, value)
-            continue
+                return lambda value: datetime.fromtimestamp(value, timezone.utc)
+            return None
+        if is_model:
+            return lambda value: dict_to_submodel(type_, value)
         # TODO: remove this when all sub models are migrated to Pydantic
         # NOTE: this is for type dict on BaseModel, (used in Payment class)
-        if type_ is dict and value:
-            _dict[key] = json.loads(value)
-            continue
-        _dict[key] = value
-        continue
-    _model = model.construct(**_dict)
-    if isinstance(_model, BaseModel):
-        _model.__init__(**_dict)  # type: ignore
-    return _model
+        if type_ is dict:
+            return lambda value: json.loads(value) if isinstance(value, str) else value
+        if type_ in (str, int, float):
+            # e.g. postgres returns `Decimal` for `SUM()`, sqlite does not enforce
+            # column types, do the coercion `__init__` would have done
+            return type_
+        if type_ is not Any:
+            self.trusted = False
+        return None
+
+    def decode(self, row: dict) -> TModel:
+        values: dict = {}
+        converters = self.converters
+        for key, value in row.items():
+            if value is None or key not in converters:
+                # Somethimes an SQL JOIN will create additional column
+                continue
+            converter = converters[key]
+            values[key] = converter(value) if converter else value
+        if self.trusted and self.required.issubset(values):
+            return self.model.construct(**values)
+        return self.model(**values)
+
+
+_row_decoders: dict[type, RowDecoder] = {}
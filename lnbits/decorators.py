@@ -10,13 +10,15 @@ from fastapi.security.base import SecurityBase
 from loguru import logger
 from pydantic.types import UUID4
 
+from lnbits.core.auth_cache import auth_cache
 from lnbits.core.crud import (
     get_account,
     get_account_by_email,
     get_account_by_username,
+    get_cached_wallet_for_key,
     get_user_active_extensions_ids,
     get_user_from_account,
-    get_wallet_for_key,
+    get_wallet_balance,
 )
 from lnbits.core.models import (
     AccessTokenPayload,
@@ -82,7 +84,7 @@ class KeyChecker(SecurityBase):
                 detail="No Api Key provided.",
             )
 
-        wallet = await get_wallet_for_key(key_value)
+        wallet = await get_cached_wallet_for_key(key_value)
 
         if not wallet:
             raise HTTPException(
@@ -100,6 +102,10 @@ class KeyChecker(SecurityBase):
         await _check_user_extension_access(wallet.user, request["path"])
 
         key_type = KeyType.admin if wallet.adminkey == key_value else KeyType.invoice
+        # the cached wallet has no balance, it is read from the ledger by its
+        # primary key which is much cheaper than looking up the key.
+        # Extensions use `wallet.balance_msat` of the key info.
+        wallet.balance_msat = await get_wallet_balance(wallet.id)
         return WalletTypeInfo(key_type, wallet)
 
 
@@ -213,6 +219,10 @@ def parse_filters(model: Type[TFilterModel]):
         sortby: Optional[str] = None,
         direction: Optional[Literal["asc", "desc"]] = None,
         search: Optional[str] = Query(None, description="Text based search"),
+        after: Optional[str] = Query(
+            None, description="Cursor (`next_cursor` of the previous page)"
+        ),
+        include_total: bool = Query(True, description="Count the total results"),
     ):
         params = request.query_params
         filters = []
@@ -229,6 +239,8 @@ def parse_filters(model: Type[TFilterModel]):
             sortby=sortby,
             direction=direction,
             search=search,
+            after=after,
+            include_total=include_total,
             model=model,
         )
 
@@ -248,7 +260,10 @@ async def check_user_extension_access(
         )
 
     if settings.is_extension_id(ext_id):
-        ext_ids = await get_user_active_extensions_ids(user_id, conn=conn)
+        ext_ids = auth_cache.get_extensions(user_id) if not conn else None
+        if ext_ids is None:
+            ext_ids = await get_user_active_extensions_ids(user_id, conn=conn)
+            auth_cache.set_extensions(user_id, ext_ids)
         if ext_id not in ext_ids:
             return SimpleStatus(
                 success=False, message=f"User extension '{ext_id}' not enabled."
@@ -0,0 +1,158 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional
+
+from loguru import logger
+
+from lnbits.db import DB_TYPE, POSTGRES
+from lnbits.settings import settings
+from lnbits.tasks import create_permanent_task
+
+# keys of the postgres advisory locks, "lnbits" in ascii
+ADVISORY_LOCK_KEY = 0x6C6E62697473
+STARTUP_LOCK_KEY = ADVISORY_LOCK_KEY + 1
+
+
+class LeaderElection:
+    """
+    With several LNbits processes (`lnbits --workers N`) some background tasks
+    (e.g. the invoice listener of the funding source) must run in only one of
+    them. The process which holds the leader lock runs them, a postgres
+    advisory lock or, for SQLite, a file lock. The other processes keep trying
+    to get the lock and take over when the leader dies.
+    """
+
+    check_interval = 5
+
+    def __init__(self, lock_path: Optional[str] = None) -> None:
+        self.backend = "postgres" if DB_TYPE == POSTGRES and not lock_path else "file"
+        self.lock_path = lock_path or str(
+            Path(settings.lnbits_data_folder, "leader.lock")
+        )
+        self.is_leader = False
+        self.elections = 0
+        self._tasks: list[Callable[[], Coroutine]] = []
+        self._running: list[asyncio.Task] = []
+        self._lock_fd: Optional[int] = None
+        self._connection: Optional[Any] = None
+
+    @asynccontextmanager
+    async def startup_lock(self) -> AsyncIterator[None]:
+        """
+        Lets the processes start one after the other, so only one of them runs
+        the migrations and initializes the settings.
+        """
+        if self.backend == "postgres":
+            import asyncpg
+
+            connection = await asyncpg.connect(settings.lnbits_database_url)
+            try:
+                await connection.execute(
+                    "SELECT pg_advisory_lock($1)", STARTUP_LOCK_KEY
+                )
+                yield
+            finally:
+                # closing the session releases the lock
+                await connection.close()
+            return
+
+        import fcntl
+
+        fd = os.open(f"{self.lock_path}.startup", os.O_RDWR | os.O_CREAT)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def register(self, func: Callable[[], Coroutine]) -> None:
+        """Runs `func` as a permanent task while this process is the leader."""
+        self._tasks.append(func)
+
+    async def run_forever(self) -> None:
+        while settings.lnbits_running:
+            try:
+                if not self.is_leader and await self._acquire():
+                    self._start()
+                elif self.is_leader and not await self._holds_lock():
+                    logger.warning("leader: lost the leader lock")
+                    self._stop()
+            except Exception as exc:
+                logger.warning(f"leader: election failed: {exc!s}")
+            await asyncio.sleep(self.check_interval)
+
+    async def close(self) -> None:
+        self._stop()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        await self._close_connection()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "leader": self.is_leader,
+            "elections": self.elections,
+            "pid": os.getpid(),
+        }
+
+    def _start(self) -> None:
+        logger.info(f"leader: process {os.getpid()} runs the singleton tasks")
+        self.is_leader = True
+        self.elections += 1
+        self._running = [create_permanent_task(func) for func in self._tasks]
+
+    def _stop(self) -> None:
+        self.is_leader = False
+        for task in self._running:
+            task.cancel()
+        self._running = []
+
+    async def _acquire(self) -> bool:
+        if self.backend == "postgres":
+            return await self._acquire_advisory_lock()
+        return self._acquire_file_lock()
+
+    async def _holds_lock(self) -> bool:
+        if self.backend == "file":
+            # released only when the process exits
+            return True
+        try:
+            assert self._connection, "no leader connection"
+            await asyncio.wait_for(self._connection.fetchval("SELECT 1"), 10)
+            return True
+        except Exception as exc:
+            # the lock ends with the session of the connection
+            logger.warning(f"leader: connection lost: {exc!s}")
+            await self._close_connection()
+            return False
+
+    def _acquire_file_lock(self) -> bool:
+        import fcntl
+
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    async def _acquire_advisory_lock(self) -> bool:
+        import asyncpg
+
+        if not self._connection or self._connection.is_closed():
+            self._connection = await asyncpg.connect(settings.lnbits_database_url)
+        return await self._connection.fetchval(
+            "SELECT pg_try_advisory_lock($1)", ADVISORY_LOCK_KEY
+        )
+
+    async def _close_connection(self) -> None:
+        if self._connection and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+
+leader_election = LeaderElection()
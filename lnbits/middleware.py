@@ -1,4 +1,3 @@
-import asyncio
 import json
 from datetime import datetime, timezone
 from http import HTTPStatus
@@ -16,6 +15,7 @@ from starlette.types import ASGIApp, Receive, Scope, Send
 
 from lnbits.core.db import core_app_extra
 from lnbits.core.models import AuditEntry
+from lnbits.core.tasks import AuditWriter
 from lnbits.helpers import template_renderer
 from lnbits.settings import settings
 
@@ -128,9 +128,9 @@ class ExtensionsRedirectMiddleware:
 
 class AuditMiddleware(BaseHTTPMiddleware):
 
-    def __init__(self, app: ASGIApp, audit_queue: asyncio.Queue) -> None:
+    def __init__(self, app: ASGIApp, audit_writer: AuditWriter) -> None:
         super().__init__(app)
-        self.audit_queue = audit_queue
+        self.audit_writer = audit_writer
         # delete_time purge after X days
         # time, # include pats, exclude paths (regex)
 
@@ -183,7 +183,7 @@ class AuditMiddleware(BaseHTTPMiddleware):
                 response_code=response_code,
                 duration=duration,
             )
-            await self.audit_queue.put(data)
+            self.audit_writer.put(data)
         except Exception as ex:
             logger.warning(ex)
 
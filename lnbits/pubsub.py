@@ -0,0 +1,274 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Coroutine, Optional
+
+from loguru import logger
+
+from lnbits.settings import settings
+
+MessageHandler = Callable[[str], Coroutine]
+
+
+class PubSub:
+    """
+    Publishes messages to the subscribers of a channel. The default backend
+    only reaches the subscribers of this process, the others reach the
+    subscribers of every LNbits process, so events of one worker (paid
+    invoices, websocket messages, ...) get to the clients of all workers.
+    """
+
+    name = "local"
+
+    def __init__(self) -> None:
+        self.handlers: dict[str, list[MessageHandler]] = {}
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        self.handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, message: str) -> None:
+        self.published += 1
+        await self._deliver(channel, message)
+
+    def fits(self, channel: str, message: str) -> bool:
+        """
+        Whether the message reaches the other processes, larger messages
+        only reach the subscribers of this process.
+        """
+        return True
+
+    async def run_forever(self) -> None:
+        """Keeps the connection to the other processes, if there is one."""
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "channels": list(self.handlers.keys()),
+            "published": self.published,
+            "received": self.received,
+        }
+
+    async def _deliver(self, channel: str, message: str) -> None:
+        self.received += 1
+        for handler in self.handlers.get(channel, []):
+            try:
+                await handler(message)
+            except Exception as exc:
+                logger.warning(f"pubsub: handler of `{channel}` failed: {exc!s}")
+
+
+class PostgresPubSub(PubSub):
+    """
+    Uses Postgres LISTEN/NOTIFY, every process listens on its own connection.
+    The payload of a NOTIFY is limited to 8000 bytes, larger messages only
+    reach the subscribers of this process.
+    """
+
+    name = "postgres"
+    max_payload = 7999
+    channel_prefix = "lnbits_"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._connection: Optional[Any] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def publish(self, channel: str, message: str) -> None:
+        from lnbits.core.db import db
+
+        self.published += 1
+        if not self.fits(channel, message):
+            logger.warning(f"pubsub: message for `{channel}` too large for NOTIFY")
+            await self._deliver(channel, message)
+            return
+        await db.execute(
+            "SELECT pg_notify(:channel, :message)",
+            {"channel": self.channel_prefix + channel, "message": message},
+        )
+
+    def fits(self, channel: str, message: str) -> bool:
+        return len(message.encode()) <= self.max_payload
+
+    async def run_forever(self) -> None:
+        import asyncpg
+
+        while settings.lnbits_running:
+            closed = asyncio.Event()
+            try:
+                connection = await asyncpg.connect(settings.lnbits_database_url)
+                self._connection = connection
+                connection.add_termination_listener(lambda _, c=closed: c.set())
+                for channel in self.handlers:
+                    await connection.add_listener(
+                        self.channel_prefix + channel, self._on_notification
+                    )
+                logger.debug("pubsub: listening for postgres notifications")
+                await closed.wait()
+                logger.warning("pubsub: postgres connection lost")
+            except Exception as exc:
+                logger.warning(f"pubsub: postgres listener failed: {exc!s}")
+            finally:
+                await self.close()
+            await asyncio.sleep(1)
+
+    async def close(self) -> None:
+        if self._connection and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+    def _on_notification(self, _, __, channel: str, payload: str) -> None:
+        channel = channel[len(self.channel_prefix) :]
+        task = asyncio.create_task(self._deliver(channel, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class UnixSocketPubSub(PubSub):
+    """
+    For SQLite instances, the processes connect to a broker on a unix socket
+    which forwards every message to all of them. The first process which
+    gets the lock of the socket becomes the broker, if it exits another one
+    takes over.
+    """
+
+    name = "unix"
+    max_line = 2**20
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        super().__init__()
+        self.path = (
+            path
+            or settings.pubsub_socket_path
+            or str(Path(settings.lnbits_data_folder, "pubsub.sock"))
+        )
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._warned = False
+
+    @property
+    def is_broker(self) -> bool:
+        return self._server is not None
+
+    async def publish(self, channel: str, message: str) -> None:
+        self.published += 1
+        if not self._writer:
+            if not self._warned:
+                self._warned = True
+                logger.warning("pubsub: not connected to the broker, publish locally")
+            await self._deliver(channel, message)
+            return
+        if not self.fits(channel, message):
+            logger.warning(f"pubsub: message for `{channel}` too large for the broker")
+            await self._deliver(channel, message)
+            return
+        self._writer.write(self._line(channel, message))
+        await self._writer.drain()
+
+    def fits(self, channel: str, message: str) -> bool:
+        return len(self._line(channel, message)) <= self.max_line
+
+    async def run_forever(self) -> None:
+        while settings.lnbits_running:
+            try:
+                await self._start_broker()
+                reader, self._writer = await asyncio.open_unix_connection(
+                    self.path, limit=self.max_line
+                )
+                self._warned = False
+                logger.debug(f"pubsub: connected to broker at {self.path}")
+                while line := await reader.readline():
+                    data = json.loads(line)
+                    await self._deliver(data["channel"], data["message"])
+                logger.warning("pubsub: broker connection lost")
+            except Exception as exc:
+                logger.warning(f"pubsub: broker connection failed: {exc!s}")
+            finally:
+                if self._writer:
+                    self._writer.close()
+                self._writer = None
+            await asyncio.sleep(1)
+
+    async def close(self) -> None:
+        if self._writer:
+            self._writer.close()
+        if self._server:
+            self._server.close()
+            self._server = None
+        for client in list(self._clients):
+            client.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "broker": self.is_broker,
+            "connected": self._writer is not None,
+        }
+
+    def _line(self, channel: str, message: str) -> bytes:
+        return (json.dumps({"channel": channel, "message": message}) + "\n").encode()
+
+    async def _start_broker(self) -> None:
+        import fcntl
+
+        if self._server:
+            return
+        if self._lock_fd is None:
+            self._lock_fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # another process is the broker
+            return
+        # left over from a broker which did not exit cleanly
+        Path(self.path).unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(
+            self._serve, self.path, limit=self.max_line
+        )
+        logger.info(f"pubsub: broker listening at {self.path}")
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                for client in list(self._clients):
+                    client.write(line)
+                await asyncio.gather(
+                    *[self._drain(client) for client in list(self._clients)]
+                )
+        except Exception as exc:
+            logger.debug(f"pubsub: broker client failed: {exc!s}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _drain(self, client: asyncio.StreamWriter) -> None:
+        try:
+            await asyncio.wait_for(client.drain(), 5)
+        except Exception:
+            # a process which does not read its messages is disconnected
+            self._clients.discard(client)
+            client.close()
+
+
+def _create_pubsub() -> PubSub:
+    if settings.pubsub_backend == "postgres":
+        return PostgresPubSub()
+    if settings.pubsub_backend == "unix":
+        return UnixSocketPubSub()
+    return PubSub()
+
+
+pubsub = _create_pubsub()
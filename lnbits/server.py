@@ -1,11 +1,15 @@
 import multiprocessing as mp
+import os
+import signal
 import time
+from functools import partial
 from pathlib import Path
 
 import click
 import uvicorn
-from uvicorn.supervisors import ChangeReload
+from uvicorn.supervisors import ChangeReload, Multiprocess
 
+from lnbits.db import DB_TYPE, POSTGRES
 from lnbits.settings import set_cli_settings, settings
 
 
@@ -27,6 +31,7 @@ from lnbits.settings import set_cli_settings, settings
 @click.option(
     "--reload", is_flag=True, default=False, help="Enable auto-reload for development"
 )
+@click.option("--workers", default=settings.workers, help="Number of server processes")
 def main(
     port: int,
     host: str,
@@ -34,6 +39,7 @@ def main(
     ssl_keyfile: str,
     ssl_certfile: str,
     reload: bool,
+    workers: int,
 ):
     """Launched with `poetry run lnbits` at root level"""
 
@@ -46,7 +52,19 @@ def main(
         parents=True, exist_ok=True
     )
 
-    set_cli_settings(host=host, port=port, forwarded_allow_ips=forwarded_allow_ips)
+    if reload and workers > 1:
+        raise click.UsageError("--reload can not be used with --workers")
+
+    set_cli_settings(
+        host=host, port=port, forwarded_allow_ips=forwarded_allow_ips, workers=workers
+    )
+    if workers > 1:
+        # the workers are spawned and read their settings from the environment
+        os.environ["WORKERS"] = str(workers)
+        if settings.pubsub_backend == "local":
+            # LISTEN/NOTIFY is only used on PostgreSQL, like the leader lock
+            postgres = DB_TYPE == POSTGRES
+            os.environ["PUBSUB_BACKEND"] = "postgres" if postgres else "unix"
 
     while True:
         config = uvicorn.Config(
@@ -58,6 +76,7 @@ def main(
             ssl_keyfile=ssl_keyfile,
             ssl_certfile=ssl_certfile,
             reload=reload or False,
+            workers=workers,
         )
 
         server = uvicorn.Server(config=config)
@@ -65,6 +84,8 @@ def main(
         if config.should_reload:
             sock = config.bind_socket()
             run = ChangeReload(config, target=server.run, sockets=[sock]).run
+        elif config.workers > 1:
+            run = partial(run_workers, config, server)
         else:
             run = server.run
 
@@ -80,7 +101,22 @@ def main(
         time.sleep(1)
 
 
+def run_workers(config: uvicorn.Config, server: uvicorn.Server) -> None:
+    # the supervisor handles the signals, it must not run in the main process
+    sock = config.bind_socket()
+    Multiprocess(config, target=server.run, sockets=[sock]).run()
+
+
 server_restart = mp.Event()
 
+
+def restart_server() -> None:
+    if settings.workers > 1:
+        # the workers are restarted by their supervisor, `uvicorn.Multiprocess`
+        os.kill(os.getppid(), signal.SIGHUP)
+    else:
+        server_restart.set()
+
+
 if __name__ == "__main__":
     main()
@@ -9,7 +9,7 @@ from enum import Enum
 from hashlib import sha256
 from os import path
 from time import time
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 import httpx
 from loguru import logger
@@ -261,6 +261,10 @@ class SecuritySettings(LNbitsSettings):
     lnbits_wallet_limit_max_balance: int = Field(default=0)
     lnbits_wallet_limit_daily_max_withdraw: int = Field(default=0)
     lnbits_wallet_limit_secs_between_trans: int = Field(default=0)
+    # batch payments and invoices: invoices per request and the number of
+    # funding source calls made at the same time
+    lnbits_batch_payments_max: int = Field(default=100)
+    lnbits_batch_payments_concurrency: int = Field(default=10)
     lnbits_watchdog: bool = Field(default=False)
     lnbits_watchdog_interval: int = Field(default=60)
     lnbits_watchdog_delta: int = Field(default=1_000_000)
@@ -402,6 +406,12 @@ class BoltzFundingSource(LNbitsSettings):
 
 class LightningSettings(LNbitsSettings):
     lightning_invoice_expiry: int = Field(default=3600)
+    # pending payments: checks at the same time and the check interval bounds
+    lnbits_pending_check_concurrency: int = Field(default=10)
+    lnbits_pending_check_min_interval: int = Field(default=5)
+    lnbits_pending_check_max_interval: int = Field(default=60 * 30)
+    # seconds before the payments list checks the pending payments of a wallet again
+    lnbits_pending_refresh_interval: int = Field(default=30)
 
 
 class FundingSourcesSettings(
@@ -643,6 +653,8 @@ class EnvSettings(LNbitsSettings):
     host: str = Field(default="127.0.0.1")
     port: int = Field(default=5000)
     forwarded_allow_ips: str = Field(default="*")
+    # number of server processes, see `lnbits --workers`
+    workers: int = Field(default=1)
     lnbits_title: str = Field(default="LNbits API")
     lnbits_path: str = Field(default=".")
     lnbits_extensions_path: str = Field(default="lnbits")
@@ -656,6 +668,45 @@ class EnvSettings(LNbitsSettings):
     server_startup_time: int = Field(default=time())
     cleanup_wallets_days: int = Field(default=90)
     funding_source_max_retries: int = Field(default=4)
+    # paid invoice events: what happens to new events when the queue of a
+    # listener is full
+    invoice_listener_overflow: Literal["drop_oldest", "spill", "disconnect"] = Field(
+        default="spill"
+    )
+    # workers for each side effect of paid invoices (websocket, webhook, ...)
+    paid_invoice_workers: int = Field(default=4)
+    # webhook outbox: attempts and the delay before the first retry, which doubles
+    # with every attempt, concurrent deliveries per host and the failures in a row
+    # after which a host is not tried for `webhook_circuit_cooldown` seconds
+    webhook_timeout: float = Field(default=40)
+    webhook_max_attempts: int = Field(default=8)
+    webhook_retry_delay: int = Field(default=10)
+    webhook_host_concurrency: int = Field(default=4)
+    webhook_circuit_failures: int = Field(default=5)
+    webhook_circuit_cooldown: int = Field(default=60)
+    webhook_batch_size: int = Field(default=100)
+    # web push notifications sent at the same time
+    webpush_concurrency: int = Field(default=10)
+    # how events reach the clients of other LNbits processes, `local` for a
+    # single process, `postgres` (LISTEN/NOTIFY) or `unix` (socket broker)
+    pubsub_backend: Literal["local", "postgres", "unix"] = Field(default="local")
+    # socket of the `unix` backend, default: `<data folder>/pubsub.sock`
+    pubsub_socket_path: Optional[str] = Field(default=None)
+    # seconds a websocket can take to receive a message before it is closed
+    websocket_send_timeout: float = Field(default=5)
+    # open connections of the payments SSE endpoint, more are refused
+    sse_max_connections: int = Field(default=10000)
+    # payments waiting to be sent to one SSE connection
+    sse_queue_size: int = Field(default=100)
+    # audit entries waiting to be saved, more are dropped
+    audit_queue_size: int = Field(default=10000)
+    # audit entries are saved after this many entries or milliseconds
+    audit_batch_size: int = Field(default=100)
+    audit_batch_interval_ms: int = Field(default=500)
+    # api keys (and the extensions of their users) kept in memory and for how
+    # many seconds, 0 disables the cache
+    auth_cache_size: int = Field(default=10000)
+    auth_cache_ttl: float = Field(default=60)
 
     @property
     def has_default_extension_path(self) -> bool:
@@ -671,6 +722,18 @@ class SaaSSettings(LNbitsSettings):
 class PersistenceSettings(LNbitsSettings):
     lnbits_data_folder: str = Field(default="./data")
     lnbits_database_url: str = Field(default=None)
+    # connection pool used for PostgreSQL and CockroachDB
+    lnbits_database_pool_size: int = Field(default=10)
+    lnbits_database_max_overflow: int = Field(default=20)
+    # seconds to wait for a free connection before giving up
+    lnbits_database_pool_timeout: float = Field(default=30)
+    # SQLite in WAL mode: reads use a pool of read only connections
+    # and all writes go through a single writer connection
+    lnbits_database_sqlite_wal: bool = Field(default=False)
+    lnbits_database_sqlite_readers: int = Field(default=4)
+    lnbits_database_sqlite_mmap_size: int = Field(default=268_435_456)
+    # negative values are in KiB, positive values in pages
+    lnbits_database_sqlite_cache_size: int = Field(default=-64_000)
 
 
 class SuperUserSettings(LNbitsSettings):
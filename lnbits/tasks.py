@@ -1,28 +1,29 @@
 import asyncio
-import json
+import math
+import os
+import re
 import time
 import traceback
 import uuid
-from http import HTTPStatus
+from pathlib import Path
 from typing import (
     Callable,
     Coroutine,
     Dict,
     List,
+    Literal,
     Optional,
 )
 
 from loguru import logger
-from py_vapid import Vapid
-from pywebpush import WebPushException, webpush
 
 from lnbits.core.crud import (
-    delete_webpush_subscriptions,
-    get_payments,
+    get_payments_paginated,
     get_standalone_payment,
     update_payment,
 )
-from lnbits.core.models import Payment, PaymentState
+from lnbits.core.models import Payment, PaymentFilters, PaymentState
+from lnbits.db import Filters
 from lnbits.settings import settings
 from lnbits.wallets import get_funding_source
 
@@ -87,15 +88,176 @@ async def catch_everything_and_restart(
         return await catch_everything_and_restart(func, name)
 
 
-invoice_listeners: Dict[str, asyncio.Queue] = {}
+InvoiceListenerOverflow = Literal["drop_oldest", "spill", "disconnect"]
+
+
+class InvoiceListener:
+    """
+    A subscriber of paid invoice events. Events are put on its queue without
+    waiting, when the queue is full the `overflow` policy decides:
+    `drop_oldest` removes the oldest event from the queue, `spill` writes the
+    events to a file in the data folder and puts them on the queue as soon as
+    there is space again and `disconnect` stops sending events to it.
+    Unbounded queues are never full, unless the listener sets a `max_size`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        queue: asyncio.Queue,
+        overflow: Optional[InvoiceListenerOverflow] = None,
+        max_size: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.queue = queue
+        self.overflow = overflow or settings.invoice_listener_overflow
+        self.max_size = queue.maxsize or max_size or 0
+        self.spill_dir = Path(settings.lnbits_data_folder, "invoice_spill")
+        self._spill_name = re.sub(r"[^\w.-]", "_", name)
+        # with `lnbits --workers` every process registers the same listeners,
+        # so each of them spills to its own file
+        self.spill_path = self.spill_dir / f"{self._spill_name}.{os.getpid()}.jsonl"
+        self.delivered = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.connected = True
+        self._drain_task: Optional[asyncio.Task] = None
+
+    @property
+    def spill_pending(self) -> bool:
+        return self.spill_path.is_file()
+
+    def send(self, payment: Payment) -> None:
+        if not self.connected:
+            self.dropped += 1
+            return
+        # spilled events go first, to keep the order
+        if self.spill_pending:
+            self._spill(payment)
+            return
+        if self.max_size and self.queue.qsize() >= self.max_size:
+            if self.overflow == "spill":
+                self._spill(payment)
+                return
+            if self.overflow == "disconnect":
+                logger.warning(f"invoice listener `{self.name}` is full, disconnecting")
+                self.connected = False
+                self.dropped += 1
+                return
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(payment)
+        self.delivered += 1
+
+    def adopt_spilled(self) -> bool:
+        """
+        Takes over the spill file of a process which exited, e.g. before a
+        restart. Returns `True` if there are spilled events to drain.
+        """
+        if self.spill_pending:
+            return True
+        for path in sorted(self.spill_dir.glob(f"{self._spill_name}.*.jsonl")):
+            pid = path.name[len(self._spill_name) + 1 : -len(".jsonl")]
+            if not pid.isdigit() or _process_exists(int(pid)):
+                continue
+            try:
+                path.rename(self.spill_path)
+            except FileNotFoundError:
+                # taken over by another process
+                continue
+            # keep the position of the drain that stopped with the process
+            offset_path = _offset_path(path)
+            if offset_path.is_file():
+                offset_path.rename(_offset_path(self.spill_path))
+            return True
+        return False
+
+    def start_draining(self) -> None:
+        if self._drain_task and not self._drain_task.done():
+            return
+        self._drain_task = asyncio.create_task(self._drain())
+
+    def stop(self) -> None:
+        if self._drain_task:
+            self._drain_task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "overflow": self.overflow,
+            "connected": self.connected,
+            "lag": self.queue.qsize(),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "spill_pending": self.spill_pending,
+        }
+
+    def _spill(self, payment: Payment) -> None:
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.spill_pending:
+            # left over from a drain that stopped before removing it
+            _offset_path(self.spill_path).unlink(missing_ok=True)
+        with open(self.spill_path, "a") as file:
+            file.write(payment.json() + "\n")
+        self.spilled += 1
+        self.start_draining()
+
+    async def _drain(self) -> None:
+        offset_path = _offset_path(self.spill_path)
+        while True:
+            with open(self.spill_path, "rb") as file:
+                file.seek(_read_offset(offset_path))
+                while line := file.readline():
+                    await self.queue.put(Payment.parse_raw(line))
+                    self.delivered += 1
+                    # if the process dies, the next drain of this file
+                    # starts after the events that were already delivered
+                    offset_path.write_text(str(file.tell()))
+            # `_spill` does not await, no event is added before the unlink
+            self.spill_path.unlink()
+            offset_path.unlink(missing_ok=True)
+            if not self.adopt_spilled():
+                return
+
+
+def _offset_path(spill_path: Path) -> Path:
+    return spill_path.with_name(f"{spill_path.name}.offset")
+
+
+def _read_offset(offset_path: Path) -> int:
+    try:
+        return int(offset_path.read_text())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+invoice_listeners: Dict[str, InvoiceListener] = {}
 
 
 # TODO: name should not be optional
 # some extensions still dont use a name, but they should
-def register_invoice_listener(send_chan: asyncio.Queue, name: Optional[str] = None):
+def register_invoice_listener(
+    send_chan: asyncio.Queue,
+    name: Optional[str] = None,
+    overflow: Optional[InvoiceListenerOverflow] = None,
+    max_size: Optional[int] = None,
+):
     """
     A method intended for extensions (and core/tasks.py) to call when they want to be
     notified about new invoice payments incoming. Will emit all incoming payments.
+    `overflow` overrides the `invoice_listener_overflow` setting for this listener,
+    `max_size` applies it to an unbounded `send_chan` after that many events.
     """
     if not name:
         # fallback to a random name if extension didn't provide one
@@ -103,9 +265,14 @@ def register_invoice_listener(send_chan: asyncio.Queue, name: Optional[str] = No
 
     if invoice_listeners.get(name):
         logger.warning(f"invoice listener `{name}` already exists, replacing it")
+        invoice_listeners[name].stop()
 
     logger.trace(f"registering invoice listener `{name}`")
-    invoice_listeners[name] = send_chan
+    listener = InvoiceListener(name, send_chan, overflow, max_size)
+    invoice_listeners[name] = listener
+    # events which were spilled before a restart
+    if listener.adopt_spilled():
+        listener.start_draining()
 
 
 internal_invoice_queue: asyncio.Queue = asyncio.Queue(0)
@@ -152,51 +319,204 @@ def wait_for_paid_invoices(
     return wrapper
 
 
-async def check_pending_payments():
+class PendingPaymentsReconciler:
     """
-    check_pending_payments is called during startup to check for pending payments with
-    the backend and also to delete expired invoices. Incoming payments will be
-    checked only once, outgoing pending payments will be checked regularly.
+    Checks the pending payments of the last 15 days with the funding source.
+    New payments are checked every `lnbits_pending_check_min_interval` seconds,
+    the interval doubles as the payments get older, up to
+    `lnbits_pending_check_max_interval`. The newest payments are checked first
+    and at most `lnbits_pending_check_concurrency` checks run at the same time.
+    The payments are loaded page by page, while none of them is due a pass only
+    loads the payments created since the previous pass.
     """
-    sleep_time = 60 * 30  # 30 minutes
 
-    while settings.lnbits_running:
-        funding_source = get_funding_source()
-        if funding_source.__class__.__name__ == "VoidWallet":
-            logger.warning("Task: skipping pending check for VoidWallet")
-            await asyncio.sleep(sleep_time)
-            continue
-        start_time = time.time()
-        pending_payments = await get_payments(
-            since=(int(time.time()) - 60 * 60 * 24 * 15),  # 15 days ago
-            complete=False,
-            pending=True,
-            exclude_uncheckable=True,
-        )
-        count = len(pending_payments)
-        if count > 0:
-            logger.info(f"Task: checking {count} pending payments of last 15 days...")
-            for i, payment in enumerate(pending_payments):
-                status = await payment.check_status()
-                prefix = f"payment ({i+1} / {count})"
-                if status.failed:
-                    payment.status = PaymentState.FAILED
-                    await update_payment(payment)
-                    logger.debug(f"{prefix} failed {payment.checking_id}")
-                elif status.success:
-                    payment.fee = status.fee_msat or 0
-                    payment.preimage = status.preimage
-                    payment.status = PaymentState.SUCCESS
-                    await update_payment(payment)
-                    logger.debug(f"{prefix} success {payment.checking_id}")
-                else:
-                    logger.debug(f"{prefix} pending {payment.checking_id}")
-                await asyncio.sleep(0.01)  # to avoid complete blocking
-            logger.info(
-                f"Task: pending check finished for {count} payments"
-                f" (took {time.time() - start_time:0.3f} s)"
+    lookback = 60 * 60 * 24 * 15  # 15 days
+    # limits the checks of one pass, so new payments do not wait for old ones
+    checks_per_worker = 20
+    # pending payments loaded from the database at a time, newest first
+    page_size = 500
+
+    def __init__(self) -> None:
+        self.last_checked: Dict[str, float] = {}
+        self.passes = 0
+        self.last_pass: dict = {}
+        self._force = False
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        # none of the known payments is due before `_next_due`, until then a
+        # pass only loads the payments created since the previous one
+        self._next_due = 0.0
+        self._scanned_at = 0.0
+
+    def check_interval(self, age: float) -> float:
+        max_interval = settings.lnbits_pending_check_max_interval
+        interval = max(1, settings.lnbits_pending_check_min_interval)
+        while interval * 4 < age and interval < max_interval:
+            interval *= 2
+        return min(interval, max_interval)
+
+    def due_at(self, payment: Payment, now: float) -> float:
+        last_checked = self.last_checked.get(payment.checking_id)
+        if last_checked is None:
+            return now
+        age = now - payment.time.timestamp()
+        return last_checked + self.check_interval(age)
+
+    def is_due(self, payment: Payment, now: float) -> bool:
+        return self.due_at(payment, now) <= now
+
+    def trigger(self) -> None:
+        """Checks all pending payments in the next pass, regardless of their age."""
+        self._force = True
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "passes": self.passes,
+            "tracked": len(self.last_checked),
+            "last_pass": self.last_pass,
+        }
+
+    async def run_forever(self) -> None:
+        while settings.lnbits_running:
+            funding_source = get_funding_source()
+            if funding_source.__class__.__name__ == "VoidWallet":
+                logger.warning("Task: skipping pending check for VoidWallet")
+                await self._wait(settings.lnbits_pending_check_max_interval)
+                continue
+            force, self._force = self._force, False
+            await self.run_pass(force=force)
+            await self._wait(settings.lnbits_pending_check_min_interval)
+
+    async def run_pass(self, force: bool = False) -> dict:
+        async with self._lock:
+            start_time = time.time()
+            full_scan = force or start_time >= self._next_due
+            # one second of overlap, the time of a payment has second precision
+            since = start_time - self.lookback if full_scan else self._scanned_at - 1
+            concurrency = max(1, settings.lnbits_pending_check_concurrency)
+            max_checks = None if force else concurrency * self.checks_per_worker
+
+            due: list[Payment] = []
+            next_due = math.inf
+            loaded = 0
+            pending_ids: set[str] = set()
+            filters: Filters[PaymentFilters] = Filters(
+                limit=self.page_size,
+                sortby="time",
+                direction="desc",
+                include_total=False,
             )
-        await asyncio.sleep(sleep_time)
+            while True:
+                page = await get_payments_paginated(
+                    since=int(since),
+                    pending=True,
+                    exclude_uncheckable=True,
+                    filters=filters,
+                )
+                loaded += len(page.data)
+                for payment in page.data:
+                    pending_ids.add(payment.checking_id)
+                    if force or self.is_due(payment, start_time):
+                        due.append(payment)
+                    else:
+                        next_due = min(next_due, self.due_at(payment, start_time))
+                if not page.next_cursor or (max_checks and len(due) >= max_checks):
+                    break
+                filters.after = page.next_cursor
+            complete = not page.next_cursor
+            if max_checks and len(due) > max_checks:
+                due = due[:max_checks]
+                complete = False
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def _check(payment: Payment) -> str:
+                async with semaphore:
+                    return await self._check_payment(payment)
+
+            results = await asyncio.gather(*[_check(payment) for payment in due])
+            now = time.time()
+            for payment, result in zip(due, results):
+                if result in ("pending", "error"):
+                    next_due = min(next_due, self.due_at(payment, now))
+
+            if not complete:
+                # more payments are due, the next pass loads all of them again
+                self._next_due = start_time
+            elif full_scan:
+                self._next_due = next_due
+                self.last_checked = {
+                    checking_id: checked
+                    for checking_id, checked in self.last_checked.items()
+                    if checking_id in pending_ids
+                }
+            else:
+                self._next_due = min(self._next_due, next_due)
+            self._scanned_at = start_time
+
+            stats = {
+                "started_at": int(start_time),
+                "duration": round(now - start_time, 3),
+                "forced": force,
+                "full_scan": full_scan,
+                "since": int(since),
+                "pending": loaded,
+                "checked": len(due),
+                "success": results.count("success"),
+                "failed": results.count("failed"),
+                "still_pending": results.count("pending"),
+                "errors": results.count("error"),
+            }
+            self.passes += 1
+            self.last_pass = stats
+            if due:
+                logger.info(
+                    f"Task: pending check finished for {len(due)} of "
+                    f"{loaded} payments (took {stats['duration']} s)"
+                )
+            return stats
+
+    async def _check_payment(self, payment: Payment) -> str:
+        try:
+            status = await payment.check_status()
+            if status.failed:
+                payment.status = PaymentState.FAILED
+                await update_payment(payment)
+                logger.debug(f"payment failed {payment.checking_id}")
+                result = "failed"
+            elif status.success:
+                payment.fee = status.fee_msat or 0
+                payment.preimage = status.preimage
+                payment.status = PaymentState.SUCCESS
+                await update_payment(payment)
+                logger.debug(f"payment success {payment.checking_id}")
+                result = "success"
+            else:
+                result = "pending"
+        except Exception as exc:
+            logger.warning(f"pending check of {payment.checking_id} failed: {exc!s}")
+            result = "error"
+        self.last_checked[payment.checking_id] = time.time()
+        return result
+
+    async def _wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+
+pending_payments_reconciler = PendingPaymentsReconciler()
+
+
+async def check_pending_payments():
+    """
+    check_pending_payments is called during startup and keeps checking the
+    pending payments with the backend, see `PendingPaymentsReconciler`.
+    """
+    await pending_payments_reconciler.run_forever()
 
 
 async def invoice_callback_dispatcher(checking_id: str, is_internal: bool = False):
@@ -213,31 +533,12 @@ async def invoice_callback_dispatcher(checking_id: str, is_internal: bool = Fals
         await update_payment(payment)
         internal = "internal" if is_internal else ""
         logger.success(f"{internal} invoice {checking_id} settled")
-        for name, send_chan in invoice_listeners.items():
+        for name, listener in invoice_listeners.items():
             logger.trace(f"invoice listeners: sending to `{name}`")
-            await send_chan.put(payment)
+            listener.send(payment)
 
 
 async def send_push_notification(subscription, title, body, url=""):
-    vapid = Vapid()
-    try:
-        logger.debug("sending push notification")
-        webpush(
-            json.loads(subscription.data),
-            json.dumps({"title": title, "body": body, "url": url}),
-            (
-                vapid.from_pem(bytes(settings.lnbits_webpush_privkey, "utf-8"))
-                if settings.lnbits_webpush_privkey
-                else None
-            ),
-            {"aud": "", "sub": "mailto:alan@lnbits.com"},
-        )
-    except WebPushException as e:
-        if e.response and e.response.status_code == HTTPStatus.GONE:
-            # cleanup unsubscribed or expired push subscriptions
-            await delete_webpush_subscriptions(subscription.endpoint)
-        else:
-            logger.error(
-                f"failed sending push notification: "
-                f"{e.response.text if e.response else e}"
-            )
+    from lnbits.core.services import PushNotification, webpush_sender
+
+    await webpush_sender.send_all([PushNotification(subscription, title, body, url)])
@@ -7,7 +7,7 @@ from typing import Callable
 
 from loguru import logger
 
-from lnbits.core.services import websocket_updater
+from lnbits.core.services import websocket_manager
 from lnbits.helpers import get_db_vendor_name
 from lnbits.settings import settings
 
@@ -36,7 +36,9 @@ def initialize_server_websocket_logger() -> Callable:
     async def update_websocket_serverlog():
         while settings.lnbits_running:
             msg = await serverlog_queue.get()
-            await websocket_updater(super_user_hash, msg)
+            # only the logs of this process, publishing them to the other
+            # processes would log again (`--workers`)
+            await websocket_manager.send_local(msg, super_user_hash)
 
     logger.add(
         lambda msg: serverlog_queue.put_nowait(msg),
@@ -39,3 +39,34 @@ async def test_admin_update_noneditable_settings(client, superuser):
         json={"super_user": "UPDATED"},
     )
     assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_admin_monitor_database_stats(client, superuser):
+    response = await client.get(f"/admin/api/v1/monitor?usr={superuser.id}")
+    assert response.status_code == 200
+    assert "database" not in response.json()
+    databases = {stats["name"]: stats for stats in response.json()["databases"]}
+    database = databases["database"]
+    assert database["checkouts"] > 0
+    assert "wait_time_max" in database
+    assert "pending_payments" in response.json()
+    assert response.json()["sse_listeners"]["connections"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_admin_check_pending_payments(client, superuser):
+    response = await client.post(
+        f"/admin/api/v1/pending-payments/check?usr={superuser.id}"
+    )
+    assert response.status_code == 202
+    assert "passes" in response.json()
+
+
+@pytest.mark.asyncio
+async def test_admin_stuck_webhooks(client, superuser):
+    response = await client.get(f"/admin/api/v1/webhooks/stuck?usr={superuser.id}")
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+    response = await client.get(f"/admin/api/v1/monitor?usr={superuser.id}")
+    assert "in_flight" in response.json()["webhooks"]
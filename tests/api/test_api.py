@@ -1,4 +1,5 @@
 import hashlib
+import json
 from http import HTTPStatus
 from unittest.mock import AsyncMock, Mock
 
@@ -6,9 +7,13 @@ import pytest
 from pytest_mock.plugin import MockerFixture
 
 from lnbits import bolt11
+from lnbits.core.crud import get_wallet
 from lnbits.core.models import CreateInvoice, Payment
+from lnbits.core.services import create_invoice
 from lnbits.core.views.payment_api import api_payment
 from lnbits.settings import Settings
+from lnbits.wallets.base import InvoiceResponse
+from lnbits.wallets.fake import FakeWallet
 
 from ..helpers import (
     get_random_invoice_data,
@@ -99,6 +104,11 @@ async def test_get_wallet_adminkey(client, adminkey_headers_to):
     assert "name" in result
     assert "balance" in result
     assert "id" in result
+    wallet = await get_wallet(result["id"])
+    assert wallet
+    # the balance of the key info, which extensions use as well
+    assert result["balance"] > 0
+    assert result["balance"] == wallet.balance_msat
 
 
 # check PUT /api/v1/wallet/newwallet: empty request where admin key is needed
@@ -313,6 +323,94 @@ async def test_pay_invoice_adminkey(client, invoice, adminkey_headers_from):
     assert response.status_code > 300  # should fail
 
 
+# check POST /api/v1/payments/batch: pay several invoices at once
+@pytest.mark.asyncio
+async def test_pay_invoices_batch(client, to_wallet, adminkey_headers_from):
+    invoices = [
+        await create_invoice(wallet_id=to_wallet.id, amount=21 + i, memo="batch")
+        for i in range(3)
+    ]
+    payment_requests = [invoice.bolt11 for invoice in invoices]
+    data = {"payment_requests": [*payment_requests, payment_requests[0], "lnbc1"]}
+    response = await client.post(
+        "/api/v1/payments/batch", json=data, headers=adminkey_headers_from
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert len(results) == 5
+
+    paid = {r["payment_hash"] for r in results if r["status"] == "success"}
+    assert paid == {invoice.payment_hash for invoice in invoices}
+    errors = sorted(r["error"] for r in results if r["status"] == "failed")
+    assert errors == ["Bolt11 decoding failed.", "Duplicate invoice in batch."]
+
+
+@pytest.mark.asyncio
+async def test_pay_invoices_batch_too_many(
+    client, adminkey_headers_from, settings: Settings
+):
+    data = {"payment_requests": ["lnbc1"] * (settings.lnbits_batch_payments_max + 1)}
+    response = await client.post(
+        "/api/v1/payments/batch", json=data, headers=adminkey_headers_from
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_create_invoices_batch(client, inkey_headers_to):
+    data = {"amounts": [100, 200], "memo": "batch", "internal": True}
+    response = await client.post(
+        "/api/v1/payments/invoices/batch", json=data, headers=inkey_headers_to
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json()["error"] is None
+    payments = [Payment(**payment) for payment in response.json()["invoices"]]
+    assert [payment.sat for payment in payments] == [100, 200]
+    for payment in payments:
+        response = await client.get(
+            f"/api/v1/payments/{payment.payment_hash}", headers=inkey_headers_to
+        )
+        assert response.status_code == 200
+        assert response.json()["paid"] is False
+
+
+@pytest.mark.asyncio
+async def test_create_invoices_batch_partial_failure(
+    client, inkey_headers_to, mocker: MockerFixture
+):
+    create_invoice = FakeWallet.create_invoice
+    calls = 0
+
+    async def _create_invoice(self, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            return InvoiceResponse(ok=False, error_message="backend down")
+        return await create_invoice(self, *args, **kwargs)
+
+    mocker.patch.object(FakeWallet, "create_invoice", _create_invoice)
+    data = {"amounts": [100, 200], "memo": "batch", "internal": True}
+    response = await client.post(
+        "/api/v1/payments/invoices/batch", json=data, headers=inkey_headers_to
+    )
+    assert response.status_code == 520
+    assert response.json()["error"] == "backend down"
+    # the created invoice is returned, so it is not requested again
+    assert len(response.json()["invoices"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_create_invoices_batch_too_many(
+    client, inkey_headers_to, settings: Settings
+):
+    data = {"amounts": [1] * (settings.lnbits_batch_payments_max + 1)}
+    response = await client.post(
+        "/api/v1/payments/invoices/batch", json=data, headers=inkey_headers_to
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
 @pytest.mark.asyncio
 async def test_get_payments(client, inkey_fresh_headers_to, fake_payments):
     fake_data, filters = fake_payments
@@ -363,6 +461,70 @@ async def test_get_payments_paginated(client, inkey_fresh_headers_to, fake_payme
     assert paginated["total"] == len(fake_data)
 
 
+@pytest.mark.asyncio
+async def test_get_payments_paginated_cursor(
+    client, inkey_fresh_headers_to, fake_payments
+):
+    fake_data, filters = fake_payments
+    params = filters | {"limit": 2, "sortby": "time", "direction": "desc"}
+
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params=params | {"include_total": False},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 200
+    first = response.json()
+    assert len(first["data"]) == 2
+    assert first["total"] is None
+    assert first["next_cursor"]
+
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params=params | {"after": first["next_cursor"]},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 200
+    second = response.json()
+    assert second["total"] == len(fake_data)
+    assert second["next_cursor"] is None
+
+    checking_ids = [p["checking_id"] for p in first["data"] + second["data"]]
+    assert len(set(checking_ids)) == len(fake_data)
+
+
+@pytest.mark.asyncio
+async def test_get_payments_paginated_cursor_nullable_sortby(
+    client, inkey_fresh_headers_to, fake_payments
+):
+    _, filters = fake_payments
+    params = filters | {"limit": 2, "direction": "desc"}
+
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params=params | {"sortby": "time"},
+        headers=inkey_fresh_headers_to,
+    )
+    cursor = response.json()["next_cursor"]
+    assert cursor
+
+    # `memo` can be null, cursors would skip the payments without memo
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params=params | {"sortby": "memo"},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 200
+    assert response.json()["next_cursor"] is None
+
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params=params | {"sortby": "memo", "after": cursor},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_get_payments_history(client, inkey_fresh_headers_to, fake_payments):
     fake_data, filters = fake_payments
@@ -684,3 +846,12 @@ async def test_api_payment_pay_with_nfc(
 
     assert response.status_code == HTTPStatus.OK
     assert response.json() == expected_response
+
+
+@pytest.mark.asyncio
+async def test_payments_sse_connection_limit(
+    client, inkey_headers_to, settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "sse_max_connections", 0)
+    response = await client.get("/api/v1/payments/sse", headers=inkey_headers_to)
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
@@ -30,6 +30,7 @@ from lnbits.core.crud import (
 from lnbits.core.models import Account, CreateInvoice, PaymentState, User
 from lnbits.core.services import create_user_account, update_wallet_balance
 from lnbits.db import DB_TYPE, SQLITE, Database
+from lnbits.leader import leader_election
 from lnbits.settings import AuthMethods, Settings
 from lnbits.settings import settings as lnbits_settings
 from tests.helpers import (
@@ -66,7 +67,9 @@ def event_loop():
 
 # use session scope to run once before and once after all tests
 @pytest_asyncio.fixture(scope="session")
-async def app(settings: Settings):
+async def app(settings: Settings, tmp_path_factory: pytest.TempPathFactory):
+    # the lock files of the leader election stay out of the data folder
+    leader_election.lock_path = str(tmp_path_factory.mktemp("leader") / "leader.lock")
     app = create_app()
     async with LifespanManager(app) as manager:
         settings.first_install = False
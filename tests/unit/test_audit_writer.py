@@ -0,0 +1,95 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.crud import create_audit_entries
+from lnbits.core.db import db
+from lnbits.core.models import AuditEntry
+from lnbits.core.tasks import AuditWriter
+from lnbits.settings import Settings
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_drops_entries_when_full():
+    writer = AuditWriter(max_size=2)
+    for _ in range(3):
+        writer.put(AuditEntry(duration=0.1))
+
+    assert writer.stats()["queued"] == 2
+    assert writer.stats()["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_saves_in_batches(
+    app, mocker: MockerFixture, settings: Settings
+):
+    mocker.patch.object(settings, "audit_batch_size", 2)
+    spy = mocker.spy(AuditWriter, "write")
+    path = f"/api/v1/audit-test/{uuid4().hex}"
+    writer = AuditWriter(max_size=10)
+    for _ in range(5):
+        writer.put(AuditEntry(path=path, duration=0.1))
+
+    await writer.flush()
+
+    assert spy.call_count == 3
+    assert writer.stats() == {"queued": 0, "written": 5, "dropped": 0, "errors": 0}
+    row: dict = await db.fetchone(
+        "SELECT COUNT(*) AS count FROM audit WHERE path = :path", {"path": path}
+    )
+    assert row["count"] == 5
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_flushes_after_interval(
+    app, mocker: MockerFixture, settings: Settings
+):
+    mocker.patch.object(settings, "audit_batch_size", 100)
+    mocker.patch.object(settings, "audit_batch_interval_ms", 50)
+    writer = AuditWriter(max_size=10)
+    task = asyncio.create_task(writer.run_forever())
+    try:
+        writer.put(AuditEntry(duration=0.1))
+        writer.put(AuditEntry(duration=0.1))
+        for _ in range(50):
+            if writer.written:
+                break
+            await asyncio.sleep(0.02)
+        assert writer.written == 2
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_drops_entries_which_keep_failing(
+    app, mocker: MockerFixture, settings: Settings
+):
+    mocker.patch.object(settings, "audit_batch_size", 10)
+    mocker.patch.object(AuditWriter, "retry_delay", 0)
+    path = f"/api/v1/audit-test/{uuid4().hex}"
+
+    async def _create(entries: list[AuditEntry], conn=None):
+        if any(entry.path == "/poison" for entry in entries):
+            raise ValueError("value too long")
+        await create_audit_entries(entries, conn)
+
+    create = mocker.patch("lnbits.core.tasks.create_audit_entries", side_effect=_create)
+    writer = AuditWriter(max_size=10)
+    writer.put(AuditEntry(path=path, duration=0.1))
+    writer.put(AuditEntry(path="/poison", duration=0.1))
+    writer.put(AuditEntry(path=path, duration=0.1))
+    writer._drain(10)
+
+    assert not await writer.write()
+    assert not await writer.write()
+    assert await writer.write()
+
+    # 3 attempts of the batch, then one insert per entry
+    assert create.call_count == 6
+    assert writer.stats() == {"queued": 0, "written": 2, "dropped": 1, "errors": 3}
+    row: dict = await db.fetchone(
+        "SELECT COUNT(*) AS count FROM audit WHERE path = :path", {"path": path}
+    )
+    assert row["count"] == 2
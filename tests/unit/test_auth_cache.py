@@ -0,0 +1,98 @@
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.auth_cache import AuthCache
+from lnbits.core.crud import (
+    create_wallet,
+    delete_wallet,
+    get_cached_wallet_for_key,
+    update_wallet,
+)
+from lnbits.core.db import db
+from lnbits.core.models import Wallet
+
+
+def _wallet(wallet_id: str) -> Wallet:
+    return Wallet(
+        id=wallet_id, user="user", name="name", adminkey="admin", inkey="invoice"
+    )
+
+
+@pytest.mark.asyncio
+async def test_auth_cache_evicts_least_recently_used():
+    cache = AuthCache(max_size=2, ttl=60)
+    cache.set_wallet("a", _wallet("a"))
+    cache.set_wallet("b", _wallet("b"))
+    assert cache.get_wallet("a")
+    cache.set_wallet("c", _wallet("c"))
+
+    assert cache.get_wallet("b") is None
+    assert cache.get_wallet("a")
+    assert cache.get_wallet("c")
+
+
+@pytest.mark.asyncio
+async def test_auth_cache_expires_entries(mocker: MockerFixture):
+    cache = AuthCache(max_size=10, ttl=60)
+    cache.set_wallet("a", _wallet("a"))
+    cache.set_extensions("user", ["ext"])
+    now = mocker.patch("lnbits.core.auth_cache.time")
+    now.return_value = 10**10
+
+    assert cache.get_wallet("a") is None
+    assert cache.get_extensions("user") is None
+
+
+@pytest.mark.asyncio
+async def test_cached_wallet_for_key_is_invalidated(
+    app, to_user, mocker: MockerFixture
+):
+    cache = AuthCache(max_size=10, ttl=60)
+    mocker.patch("lnbits.core.crud.wallets.auth_cache", cache)
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="auth_cache")
+    spy = mocker.spy(db, "fetchone")
+
+    assert await get_cached_wallet_for_key(wallet.adminkey)
+    cached = await get_cached_wallet_for_key(wallet.adminkey)
+    assert cached and cached.name == "auth_cache"
+    assert spy.call_count == 1
+
+    wallet.name = "auth_cache_renamed"
+    await update_wallet(wallet)
+    cached = await get_cached_wallet_for_key(wallet.adminkey)
+    assert cached and cached.name == "auth_cache_renamed"
+
+    await delete_wallet(user_id=to_user.id, wallet_id=wallet.id)
+    assert await get_cached_wallet_for_key(wallet.adminkey) is None
+    assert await get_cached_wallet_for_key(wallet.adminkey) is None
+    assert cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_auth_cache_is_invalidated_after_commit(
+    app, to_user, mocker: MockerFixture
+):
+    cache = AuthCache(max_size=10, ttl=60)
+    mocker.patch("lnbits.core.crud.wallets.auth_cache", cache)
+    publish = mocker.patch("lnbits.core.auth_cache.pubsub.publish")
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="auth_cache")
+    assert await get_cached_wallet_for_key(wallet.adminkey)
+
+    async with db.connect() as conn:
+        with pytest.raises(ValueError):
+            async with conn.transaction():
+                wallet.name = "auth_cache_rolled_back"
+                await update_wallet(wallet, conn=conn)
+                raise ValueError("rollback")
+        assert cache.get_wallet(wallet.adminkey)
+
+        async with conn.transaction():
+            wallet.name = "auth_cache_committed"
+            await update_wallet(wallet, conn=conn)
+            # the other processes are told only once the new name is committed
+            assert cache.get_wallet(wallet.adminkey)
+            publish.assert_not_called()
+        publish.assert_called_once()
+
+    cached = await get_cached_wallet_for_key(wallet.adminkey)
+    assert cached and cached.name == "auth_cache_committed"
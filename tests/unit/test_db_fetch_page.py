@@ -1,6 +1,7 @@
 import pytest
 import pytest_asyncio
 
+from lnbits.db import Filters
 from tests.helpers import DbTestModel
 
 
@@ -72,3 +73,101 @@ async def test_db_fetch_page_group_by_evil(fetch_page, db):
             model=DbTestModel,
             group_by=["name;"],
         )
+
+
+@pytest.mark.asyncio
+async def test_db_fetch_page_cursor(fetch_page, db):
+    filters = Filters(limit=2, sortby="name", direction="desc")
+    ids = []
+    while True:
+        page = await db.fetch_page(
+            query="select * from test_db_fetch_page",
+            filters=filters,
+            model=DbTestModel,
+            cursor_key="id",
+        )
+        assert page.total == 5
+        ids += [row.id for row in page.data]
+        if not page.next_cursor:
+            break
+        filters.after = page.next_cursor
+
+    # ties on `name` (Dave) are ordered by the cursor key
+    assert ids == [5, 4, 3, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_db_fetch_page_cursor_without_total(fetch_page, db):
+    page = await db.fetch_page(
+        query="select * from test_db_fetch_page",
+        filters=Filters(limit=3, include_total=False),
+        model=DbTestModel,
+        cursor_key="id",
+    )
+    assert page.total is None
+    assert [row.id for row in page.data] == [1, 2, 3]
+    assert page.next_cursor
+
+    page = await db.fetch_page(
+        query="select * from test_db_fetch_page",
+        filters=Filters(limit=3, after=page.next_cursor, include_total=False),
+        model=DbTestModel,
+        cursor_key="id",
+    )
+    assert page.total is None
+    assert [row.id for row in page.data] == [4, 5]
+    assert page.next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_db_fetch_page_cursor_invalid(fetch_page, db):
+    with pytest.raises(ValueError, match="Invalid pagination cursor."):
+        await db.fetch_page(
+            query="select * from test_db_fetch_page",
+            filters=Filters(limit=2, after="invalid"),
+            cursor_key="id",
+        )
+    with pytest.raises(ValueError, match="Cursor pagination is not supported"):
+        await db.fetch_page(
+            query="select * from test_db_fetch_page",
+            filters=Filters(limit=2, after="invalid"),
+        )
+
+
+@pytest.mark.asyncio
+async def test_db_fetch_page_cursor_nullable_sort_field(db):
+    await db.execute("DROP TABLE IF EXISTS test_db_fetch_page_null")
+    await db.execute(
+        """
+        CREATE TABLE test_db_fetch_page_null (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            value TEXT
+        )
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO test_db_fetch_page_null (id, name, value) VALUES
+            ('1', 'Alice', 'foo'), ('2', 'Bob', NULL), ('3', 'Carol', NULL)
+        """
+    )
+    # null values can not be compared, no cursor is returned for the page
+    page = await db.fetch_page(
+        query="select * from test_db_fetch_page_null",
+        filters=Filters(limit=1, sortby="value", direction="desc"),
+        model=DbTestModel,
+        cursor_key="id",
+    )
+    assert page.total == 3
+    assert page.next_cursor is None
+
+    cursor = Filters(sortby="value").next_cursor({"id": 1, "value": "foo"}, "id")
+    with pytest.raises(ValueError, match="it can be null"):
+        await db.fetch_page(
+            query="select * from test_db_fetch_page_null",
+            filters=Filters(limit=1, sortby="value", after=cursor),
+            model=DbTestModel,
+            cursor_key="id",
+        )
+    await db.execute("DROP TABLE test_db_fetch_page_null")
@@ -0,0 +1,125 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from lnbits.core.crud import (
+    check_internal,
+    delete_expired_invoices,
+    get_account,
+    get_account_by_email,
+    get_account_by_pubkey,
+    get_account_by_username,
+    get_payment,
+    get_payments,
+    get_standalone_payment,
+    get_wallet,
+    get_wallet_for_key,
+    get_wallet_payment,
+    get_wallets,
+    is_internal_status_success,
+)
+from lnbits.core.crud.audit import delete_expired_audit_entries
+from lnbits.core.db import db as core_db
+from lnbits.db import SQLITE
+
+# tables which must never be read with a full table scan by the queries below
+indexed_tables = ["apipayments", "wallets", "accounts", "audit"]
+
+
+@contextmanager
+def capture_statements():
+    """Records every statement (with its parameters) sent to the core database."""
+    statements: list[tuple[str, tuple]] = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engines = [core_db.engine.sync_engine]
+    if core_db.reader_engine:
+        engines.append(core_db.reader_engine.sync_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", _capture)
+
+
+async def explain(statement: str, parameters: tuple) -> list[str]:
+    async with core_db.engine.connect() as conn:
+        if core_db.type == SQLITE:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            plan = [row[-1] for row in result.fetchall()]
+        else:
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+            result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            plan = [row[0] for row in result.fetchall()]
+        await conn.rollback()
+    return plan
+
+
+def full_table_scans(plan: list[str]) -> list[str]:
+    tables = "|".join(indexed_tables)
+    if core_db.type == SQLITE:
+        # `SCAN table USING INDEX ...` walks an index and is fine
+        pattern = re.compile(rf"^SCAN ({tables})\b(?! USING)")
+    else:
+        pattern = re.compile(rf"Seq Scan on ({tables})\b")
+    return [line for line in plan if pattern.search(line.strip())]
+
+
+async def assert_uses_indexes(statements: list[tuple[str, tuple]]):
+    assert statements, "no statement was captured"
+    for statement, parameters in statements:
+        if statement.lstrip().upper().startswith(("SET", "ATTACH", "PRAGMA")):
+            continue
+        plan = await explain(statement, parameters)
+        assert not full_table_scans(plan), f"full table scan in: {statement}\n{plan}"
+
+
+@pytest.mark.asyncio
+async def test_payment_queries_use_indexes(app, from_wallet, invoice):
+    payment = await get_standalone_payment(invoice.payment_hash)
+    assert payment
+
+    with capture_statements() as statements:
+        await get_payment(payment.checking_id)
+        await get_standalone_payment(payment.checking_id)
+        await get_wallet_payment(payment.wallet_id, payment.payment_hash)
+        await check_internal(payment.payment_hash)
+        await is_internal_status_success(payment.payment_hash)
+        await get_payments(wallet_id=from_wallet.id, limit=10, offset=0)
+        await get_payments(
+            since=0, pending=True, exclude_uncheckable=True, limit=10, offset=0
+        )
+        await delete_expired_invoices()
+
+    await assert_uses_indexes(statements)
+
+
+@pytest.mark.asyncio
+async def test_wallet_queries_use_indexes(app, from_user, from_wallet):
+    with capture_statements() as statements:
+        await get_wallet(from_wallet.id)
+        await get_wallets(from_user.id)
+        await get_wallet_for_key(from_wallet.inkey)
+        await get_wallet_for_key(from_wallet.adminkey)
+
+    await assert_uses_indexes(statements)
+
+
+@pytest.mark.asyncio
+async def test_account_queries_use_indexes(app, user_alan):
+    with capture_statements() as statements:
+        await get_account(user_alan.id)
+        await get_account_by_username("alan")
+        await get_account_by_email("alan@lnbits.com")
+        await get_account_by_pubkey("pubkey")
+        await delete_expired_audit_entries()
+
+    await assert_uses_indexes(statements)
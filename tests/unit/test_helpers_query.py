@@ -1,11 +1,16 @@
 import json
+from decimal import Decimal
 
 import pytest
+from pydantic import ValidationError
 
+from lnbits.core.models import Account, AuditEntry, Payment, Wallet
 from lnbits.db import (
+    RowDecoder,
     dict_to_model,
     insert_query,
     model_to_dict,
+    strip_html,
     update_query,
 )
 from tests.helpers import DbTestModel, DbTestModel2, DbTestModel3
@@ -83,3 +88,79 @@ async def test_helpers_dict_to_model():
     assert m.active is True
     assert type(m.child) is DbTestModel2
     assert type(m.child.child) is DbTestModel
+
+
+@pytest.mark.asyncio
+async def test_helpers_row_decoder_trusted():
+    assert RowDecoder(DbTestModel3).trusted is True
+    assert RowDecoder(Payment).trusted is True
+    assert RowDecoder(Wallet).trusted is True
+    # custom `__init__` must run
+    assert RowDecoder(Account).trusted is False
+    assert RowDecoder(AuditEntry).trusted is False
+
+
+@pytest.mark.asyncio
+async def test_helpers_dict_to_model_coerces_values():
+    row = {
+        "checking_id": "checking_id",
+        "payment_hash": "payment_hash",
+        "wallet_id": "wallet_id",
+        "amount": Decimal(1000),
+        "fee": 0,
+        "bolt11": "bolt11",
+        "webhook_status": "200",
+        "extra": '{"tag": "test"}',
+        "unknown_column": "ignored",
+    }
+    payment = dict_to_model(row, Payment)
+    validated = Payment(**{**row, "extra": {"tag": "test"}})
+    timestamps = {"time", "created_at", "updated_at"}
+    assert payment.dict(exclude=timestamps) == validated.dict(exclude=timestamps)
+    assert type(payment.amount) is int
+    assert payment.webhook_status == 200
+    assert payment.extra == {"tag": "test"}
+
+
+@pytest.mark.asyncio
+async def test_helpers_dict_to_model_missing_required():
+    with pytest.raises(ValidationError):
+        dict_to_model({"id": 1, "name": None}, DbTestModel)
+
+
+@pytest.mark.asyncio
+async def test_helpers_query_templates_are_cached():
+    other = test_data.copy(update={"id": 2, "user": "other"})
+    assert insert_query("test_helpers_query", test_data) is insert_query(
+        "test_helpers_query", other
+    )
+    assert update_query("test_helpers_query", test_data) is update_query(
+        "test_helpers_query", other
+    )
+    assert update_query("test_helpers_query", test_data) != update_query(
+        "test_helpers_query", test_data, "WHERE user = :user"
+    )
+
+
+@pytest.mark.asyncio
+async def test_helpers_model_to_dict_sanitize():
+    assert strip_html("plain text") == "plain text"
+    assert strip_html("<b>bold</b> &amp; <i>x</i>") == "bold  x"
+
+    wallet = Wallet(
+        id="id", user="user", name="<script>x</script>", adminkey="a", inkey="i"
+    )
+    assert model_to_dict(wallet)["name"] == "x"
+    # only fields declared with `sanitize=True` are cleaned
+    payment = Payment(
+        checking_id="<b>",
+        payment_hash="hash",
+        wallet_id="wallet",
+        amount=1,
+        fee=0,
+        bolt11="bolt11",
+        memo="<b>memo</b>",
+    )
+    _dict = model_to_dict(payment)
+    assert _dict["memo"] == "memo"
+    assert _dict["checking_id"] == "<b>"
@@ -0,0 +1,234 @@
+import asyncio
+import os
+from uuid import uuid4
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.models import Payment
+from lnbits.core.tasks import (
+    PaidInvoiceStage,
+    WalletInvoiceListeners,
+    dispatch_api_invoice_listeners,
+)
+from lnbits.pubsub import pubsub
+from lnbits.settings import Settings
+from lnbits.tasks import InvoiceListener, invoice_listeners, register_invoice_listener
+
+
+def _payment(amount: int, wallet_id: str = "wallet") -> Payment:
+    return Payment(
+        checking_id=uuid4().hex,
+        payment_hash=uuid4().hex,
+        wallet_id=wallet_id,
+        amount=amount,
+        fee=0,
+        bolt11="lnbc1",
+    )
+
+
+@pytest.mark.asyncio
+async def test_invoice_listener_drop_oldest():
+    queue: asyncio.Queue = asyncio.Queue(2)
+    listener = InvoiceListener("test_drop_oldest", queue, "drop_oldest")
+    for amount in range(1, 5):
+        listener.send(_payment(amount))
+    assert [queue.get_nowait().amount for _ in range(2)] == [3, 4]
+    stats = listener.stats()
+    assert stats["delivered"] == 4
+    assert stats["dropped"] == 2
+    assert stats["lag"] == 0
+
+
+@pytest.mark.asyncio
+async def test_invoice_listener_disconnect():
+    queue: asyncio.Queue = asyncio.Queue(1)
+    listener = InvoiceListener("test_disconnect", queue, "disconnect")
+    for amount in range(1, 4):
+        listener.send(_payment(amount))
+    assert queue.get_nowait().amount == 1
+    assert queue.empty()
+    assert listener.connected is False
+    assert listener.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_invoice_listener_spill(tmp_path, mocker: MockerFixture):
+    mocker.patch("lnbits.tasks.settings.lnbits_data_folder", str(tmp_path))
+    queue: asyncio.Queue = asyncio.Queue(2)
+    listener = InvoiceListener("test/spill", queue, "spill")
+    assert listener.spill_path.parent == tmp_path / "invoice_spill"
+
+    for amount in range(1, 6):
+        listener.send(_payment(amount))
+    assert listener.spilled == 3
+    assert listener.spill_pending
+
+    received = []
+    for _ in range(5):
+        payment = await asyncio.wait_for(queue.get(), timeout=1)
+        received.append(payment.amount)
+    assert received == [1, 2, 3, 4, 5]
+    await asyncio.sleep(0)
+    assert not listener.spill_pending
+    assert listener.delivered == 5
+    assert listener.dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_unbounded_listener_stays_unbounded():
+    queue: asyncio.Queue = asyncio.Queue()
+    register_invoice_listener(queue, "test_unbounded", "drop_oldest")
+    listener = invoice_listeners.pop("test_unbounded")
+    for amount in range(1, 2001):
+        listener.send(_payment(amount))
+    assert queue.qsize() == 2000
+    assert listener.dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_unbounded_listener_with_max_size():
+    queue: asyncio.Queue = asyncio.Queue()
+    register_invoice_listener(queue, "test_max_size", "drop_oldest", max_size=3)
+    listener = invoice_listeners.pop("test_max_size")
+    for amount in range(1, 6):
+        listener.send(_payment(amount))
+    assert queue.qsize() == 3
+    assert listener.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_listener_takes_over_spill_file_of_exited_process(
+    tmp_path, mocker: MockerFixture
+):
+    mocker.patch("lnbits.tasks.settings.lnbits_data_folder", str(tmp_path))
+    spill_dir = tmp_path / "invoice_spill"
+    spill_dir.mkdir()
+    # pids above the kernel limit never belong to a running process
+    orphan = spill_dir / "test_adopt.99999999.jsonl"
+    orphan.write_text("".join(_payment(n).json() + "\n" for n in (1, 2)))
+    running = spill_dir / f"test_adopt.{os.getppid()}.jsonl"
+    running.write_text(_payment(3).json() + "\n")
+
+    queue: asyncio.Queue = asyncio.Queue(10)
+    register_invoice_listener(queue, "test_adopt", "spill")
+    listener = invoice_listeners.pop("test_adopt")
+    assert listener.spill_path.name == f"test_adopt.{os.getpid()}.jsonl"
+
+    received = [(await asyncio.wait_for(queue.get(), 1)).amount for _ in range(2)]
+    assert received == [1, 2]
+    await asyncio.sleep(0)
+    assert not orphan.exists()
+    assert not listener.spill_pending
+    # the file of a running process is left alone
+    assert running.exists()
+    assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_listener_resumes_spill_file_after_delivered_events(
+    tmp_path, mocker: MockerFixture
+):
+    mocker.patch("lnbits.tasks.settings.lnbits_data_folder", str(tmp_path))
+    spill_dir = tmp_path / "invoice_spill"
+    spill_dir.mkdir()
+    # the process died after delivering the first event
+    orphan = spill_dir / "test_resume.99999999.jsonl"
+    first = _payment(1).json() + "\n"
+    orphan.write_text(first + "".join(_payment(n).json() + "\n" for n in (2, 3)))
+    offset = spill_dir / "test_resume.99999999.jsonl.offset"
+    offset.write_text(str(len(first.encode())))
+
+    queue: asyncio.Queue = asyncio.Queue(10)
+    register_invoice_listener(queue, "test_resume", "spill")
+    listener = invoice_listeners.pop("test_resume")
+
+    received = [(await asyncio.wait_for(queue.get(), 1)).amount for _ in range(2)]
+    assert received == [2, 3]
+    await asyncio.sleep(0)
+    assert queue.empty()
+    assert not listener.spill_pending
+    assert not offset.exists()
+    assert list(spill_dir.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_paid_invoice_stage_workers():
+    handled: list[int] = []
+
+    async def _slow_handler(payment: Payment):
+        await asyncio.sleep(0.2)
+        if payment.amount == 2:
+            raise ValueError("webhook down")
+        handled.append(payment.amount)
+
+    stage = PaidInvoiceStage("test_stage", _slow_handler)
+    stage.start(3)
+    stage.start(3)
+    assert len(stage.workers) == 3
+
+    for amount in range(1, 4):
+        stage.put(_payment(amount))
+    # the three payments are handled at the same time
+    await asyncio.sleep(0.35)
+    assert sorted(handled) == [1, 3]
+    stats = stage.stats()
+    assert stats["processed"] == 3
+    assert stats["errors"] == 1
+    assert stats["queued"] == 0
+    assert 0.2 <= stats["latency_max"] < 0.35
+
+    # a failing payment does not stop the workers
+    stage.put(_payment(4))
+    await asyncio.sleep(0.3)
+    assert 4 in handled
+    for worker in stage.workers:
+        worker.cancel()
+
+
+@pytest.mark.asyncio
+async def test_wallet_invoice_listeners(settings: Settings, mocker: MockerFixture):
+    mocker.patch.object(settings, "sse_queue_size", 2)
+    mocker.patch.object(settings, "sse_max_connections", 3)
+    listeners = WalletInvoiceListeners()
+    uid_a, queue_a = listeners.add("wallet_a")
+    uid_b, queue_b = listeners.add("wallet_b")
+    assert not listeners.full
+
+    listeners.send(_payment(1, "wallet_a"))
+    assert queue_a.qsize() == 1
+    assert queue_b.empty()
+
+    # a connection which does not keep up is removed
+    for amount in range(2, 4):
+        listeners.send(_payment(amount, "wallet_a"))
+    assert not listeners.has("wallet_a", uid_a)
+    assert listeners.stats() == {"connections": 1, "wallets": 1, "dropped": 1}
+
+    listeners.add("wallet_b")
+    listeners.add("wallet_b")
+    assert listeners.full
+    listeners.remove("wallet_b", uid_b)
+    listeners.remove("wallet_b", uid_b)
+    assert listeners.connections == 2
+
+
+@pytest.mark.asyncio
+async def test_api_invoice_listeners_get_payment_by_checking_id(
+    mocker: MockerFixture,
+):
+    payment = _payment(1)
+    # larger than the payload of a postgres NOTIFY
+    payment.extra = {"comment": "x" * 10_000}
+    get_payment = mocker.patch(
+        "lnbits.core.tasks.get_standalone_payment", return_value=payment
+    )
+    publish = mocker.spy(pubsub, "publish")
+    queue: asyncio.Queue = asyncio.Queue()
+    mocker.patch.dict("lnbits.core.tasks.api_invoice_listeners", {"test": queue})
+
+    await dispatch_api_invoice_listeners(payment)
+
+    publish.assert_called_once_with("paid_invoice", payment.checking_id)
+    get_payment.assert_called_once_with(payment.checking_id, incoming=True)
+    assert queue.get_nowait() == payment
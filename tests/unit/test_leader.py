@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.leader import LeaderElection
+
+
+@pytest.mark.asyncio
+async def test_leader_election_file_lock(tmp_path, mocker: MockerFixture):
+    mocker.patch.object(LeaderElection, "check_interval", 0.05)
+    lock_path = str(tmp_path / "leader.lock")
+    started: list[str] = []
+
+    def _task(name: str):
+        async def _run():
+            started.append(name)
+            await asyncio.Event().wait()
+
+        return _run
+
+    first, second = LeaderElection(lock_path), LeaderElection(lock_path)
+    first.register(_task("first"))
+    second.register(_task("second"))
+    first_task = asyncio.create_task(first.run_forever())
+    await asyncio.sleep(0.1)
+    second_task = asyncio.create_task(second.run_forever())
+    try:
+        await asyncio.sleep(0.2)
+        assert first.is_leader
+        assert not second.is_leader
+        assert started == ["first"]
+
+        # the leader exits, the other process takes over
+        first_task.cancel()
+        await first.close()
+        await asyncio.sleep(0.2)
+        assert second.is_leader
+        assert started == ["first", "second"]
+        assert second.stats()["elections"] == 1
+    finally:
+        first_task.cancel()
+        second_task.cancel()
+        await first.close()
+        await second.close()
@@ -8,9 +8,20 @@ from bolt11 import encode as bolt11_encode
 from bolt11.types import MilliSatoshi
 from pytest_mock.plugin import MockerFixture
 
-from lnbits.core.crud import get_standalone_payment, get_wallet
-from lnbits.core.models import Payment, PaymentState, Wallet
-from lnbits.core.services import create_invoice, pay_invoice
+from lnbits.core.crud import (
+    create_wallet,
+    get_standalone_payment,
+    get_wallet,
+    get_wallet_balance,
+    get_wallet_balance_mismatches,
+)
+from lnbits.core.models import Payment, PaymentState, User, Wallet
+from lnbits.core.services import (
+    create_invoice,
+    pay_invoice,
+    pay_invoices,
+    update_wallet_balance,
+)
 from lnbits.exceptions import PaymentError
 from lnbits.settings import Settings
 from lnbits.tasks import (
@@ -560,3 +571,147 @@ async def test_service_fee(
     assert service_fee_payment.amount == 422_400
     assert service_fee_payment.bolt11 == external_invoice.payment_request
     assert service_fee_payment.preimage is None
+
+
+@pytest.mark.asyncio
+async def test_pay_invoices_internal_and_external(
+    from_user: User, to_wallet: Wallet, external_funding_source: FakeWallet
+):
+    payer = await create_wallet(user_id=from_user.id, wallet_name="batch_payer")
+    await update_wallet_balance(payer.id, 10_000)
+    internal = await create_invoice(wallet_id=to_wallet.id, amount=5, memo="")
+    external = await external_funding_source.create_invoice(7)
+    assert external.payment_request
+
+    results = await pay_invoices(
+        wallet_id=payer.id,
+        payment_requests=[internal.bolt11, external.payment_request],
+    )
+    by_request = {result.payment_request: result async for result in results}
+
+    assert by_request[internal.bolt11].status == PaymentState.SUCCESS
+    failed = by_request[external.payment_request]
+    assert failed.status == PaymentState.FAILED
+    assert failed.error == "Payment failed: Only internal invoices can be used!"
+
+    # the failed external payment gives its reservation back
+    wallet = await get_wallet(payer.id)
+    assert wallet and wallet.balance_msat == 10_000_000 - 5_000
+
+
+@pytest.mark.asyncio
+async def test_pay_invoices_rejects_batch_over_balance(
+    from_user: User, to_wallet: Wallet
+):
+    payer = await create_wallet(user_id=from_user.id, wallet_name="batch_poor")
+    await update_wallet_balance(payer.id, 10)
+    invoices = [
+        await create_invoice(wallet_id=to_wallet.id, amount=6, memo="")
+        for _ in range(2)
+    ]
+    with pytest.raises(PaymentError, match="Insufficient balance."):
+        await pay_invoices(
+            wallet_id=payer.id,
+            payment_requests=[invoice.bolt11 for invoice in invoices],
+        )
+    wallet = await get_wallet(payer.id)
+    assert wallet and wallet.balance_msat == 10_000
+
+
+@pytest.mark.asyncio
+async def test_concurrent_payments_do_not_overdraw(from_user: User):
+    # every payer can afford `affordable` of the `attempts` payments it sends
+    affordable, attempts = 50, 200
+    payers = [
+        await create_wallet(user_id=from_user.id, wallet_name=f"payer_{i}")
+        for i in range(2)
+    ]
+    receiver = await create_wallet(user_id=from_user.id, wallet_name="receiver")
+    for payer in payers:
+        await update_wallet_balance(payer.id, affordable)
+
+    invoices = [
+        await create_invoice(wallet_id=receiver.id, amount=1, memo="stress")
+        for _ in range(len(payers) * attempts)
+    ]
+    results = await asyncio.gather(
+        *[
+            pay_invoice(
+                wallet_id=payers[i % len(payers)].id,
+                payment_request=invoice.bolt11,
+            )
+            for i, invoice in enumerate(invoices)
+        ],
+        return_exceptions=True,
+    )
+
+    for i, payer in enumerate(payers):
+        payer_results = results[i :: len(payers)]
+        paid = [r for r in payer_results if isinstance(r, Payment)]
+        failed = [r for r in payer_results if isinstance(r, PaymentError)]
+        assert len(paid) == affordable
+        assert len(failed) == attempts - affordable
+        assert all(str(r) == "Insufficient balance." for r in failed)
+        wallet = await get_wallet(payer.id)
+        assert wallet and wallet.balance_msat == 0
+
+    wallet = await get_wallet(receiver.id)
+    assert wallet and wallet.balance_msat == len(payers) * affordable * 1000
+    mismatches = await get_wallet_balance_mismatches()
+    assert not {payer.id for payer in payers} & mismatches.keys()
+    assert receiver.id not in mismatches
+
+
+@pytest.mark.asyncio
+async def test_concurrent_payers_of_one_invoice(from_user: User):
+    payers = [
+        await create_wallet(user_id=from_user.id, wallet_name=f"same_payer_{i}")
+        for i in range(2)
+    ]
+    receiver = await create_wallet(user_id=from_user.id, wallet_name="same_receiver")
+    invoices = [
+        await create_invoice(wallet_id=receiver.id, amount=1, memo="same invoice")
+        for _ in range(20)
+    ]
+    for payer in payers:
+        await update_wallet_balance(payer.id, len(invoices))
+
+    # both payers pay every invoice at the same time
+    results = await asyncio.gather(
+        *[
+            pay_invoice(wallet_id=payer.id, payment_request=invoice.bolt11)
+            for invoice in invoices
+            for payer in payers
+        ],
+        return_exceptions=True,
+    )
+    paid = [r for r in results if isinstance(r, Payment)]
+    failed = [r for r in results if isinstance(r, PaymentError)]
+    assert len(paid) == len(invoices)
+    assert len(failed) == len(invoices)
+    assert all(str(r) == "Internal invoice already paid." for r in failed)
+
+    wallet = await get_wallet(receiver.id)
+    assert wallet and wallet.balance_msat == len(invoices) * 1000
+    balances = [await get_wallet_balance(payer.id) for payer in payers]
+    assert sum(balances) == len(invoices) * 1000
+
+    # payments in both directions at once
+    for payer in payers:
+        await update_wallet_balance(payer.id, 5)
+    pairs = [(payers[0], payers[1]), (payers[1], payers[0])] * 5
+    back = [
+        await create_invoice(wallet_id=other.id, amount=1, memo="back")
+        for _, other in pairs
+    ]
+    results = await asyncio.gather(
+        *[
+            pay_invoice(wallet_id=payer.id, payment_request=invoice.bolt11)
+            for (payer, _), invoice in zip(pairs, back)
+        ],
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, Payment) for r in results)
+    mismatches = await get_wallet_balance_mismatches()
+    assert not {payer.id for payer in payers} & mismatches.keys()
+    assert receiver.id not in mismatches
@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits import tasks
+from lnbits.core.crud import create_payment, create_wallet, get_standalone_payment
+from lnbits.core.models import CreatePayment, Payment, User, Wallet
+from lnbits.core.services import payments as payments_service
+from lnbits.core.services import update_pending_payments_in_background
+from lnbits.core.services.payments import websocket_manager
+from lnbits.settings import Settings
+from lnbits.tasks import PendingPaymentsReconciler
+from lnbits.wallets.base import PaymentPendingStatus, PaymentSuccessStatus
+
+
+async def _create_pending_payment(wallet: Wallet, age: float = 0) -> Payment:
+    payment = await create_payment(
+        checking_id=uuid4().hex,
+        data=CreatePayment(
+            wallet_id=wallet.id,
+            payment_hash=uuid4().hex,
+            bolt11="lnbc1pending",
+            amount_msat=-1000,
+            memo="pending",
+        ),
+    )
+    payment.time = datetime.now(timezone.utc) - timedelta(seconds=age)
+    return payment
+
+
+def test_check_interval_backs_off_with_age(settings: Settings):
+    reconciler = PendingPaymentsReconciler()
+    min_interval = settings.lnbits_pending_check_min_interval
+    max_interval = settings.lnbits_pending_check_max_interval
+    assert reconciler.check_interval(0) == min_interval
+    assert reconciler.check_interval(min_interval * 4) == min_interval
+    assert reconciler.check_interval(min_interval * 8) == min_interval * 2
+    assert reconciler.check_interval(60 * 60 * 24) == max_interval
+
+
+@pytest.mark.asyncio
+async def test_reconciler_checks_concurrently_and_backs_off(
+    app, to_wallet: Wallet, mocker: MockerFixture, settings: Settings
+):
+    payments = [await _create_pending_payment(to_wallet) for _ in range(6)]
+    ids = {payment.checking_id for payment in payments}
+    settled = payments[0].checking_id
+    checked: list[str] = []
+    running = 0
+    max_running = 0
+
+    async def _check_status(self: Payment):
+        await asyncio.sleep(0.01)
+        if self.checking_id == settled:
+            return PaymentSuccessStatus(fee_msat=0, preimage="00" * 32)
+        return PaymentPendingStatus()
+
+    mocker.patch.object(Payment, "check_status", _check_status)
+    mocker.patch.object(settings, "lnbits_pending_check_concurrency", 2)
+    reconciler = PendingPaymentsReconciler()
+    check_payment = reconciler._check_payment
+
+    # counted on this reconciler only, the app runs its own in the background
+    async def _check_payment(payment: Payment) -> str:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        result = await check_payment(payment)
+        running -= 1
+        checked.append(payment.checking_id)
+        return result
+
+    mocker.patch.object(reconciler, "_check_payment", _check_payment)
+
+    stats = await reconciler.run_pass()
+    assert ids.issubset(checked)
+    assert max_running == 2
+    payment = await get_standalone_payment(settled)
+    assert payment
+    assert payment.success
+
+    # checked just now, so not due again
+    checked.clear()
+    stats = await reconciler.run_pass()
+    assert not ids.intersection(checked)
+    assert reconciler.passes == 2
+
+    # a forced pass checks everything which is still pending
+    checked.clear()
+    reconciler.trigger()
+    stats = await reconciler.run_pass(force=True)
+    assert stats["forced"] is True
+    assert ids - {settled} <= set(checked)
+    assert settled not in checked
+
+
+@pytest.mark.asyncio
+async def test_reconciler_loads_only_new_payments_when_nothing_is_due(
+    app, to_wallet: Wallet, mocker: MockerFixture, settings: Settings
+):
+    async def _check_status(self: Payment):
+        return PaymentPendingStatus()
+
+    mocker.patch.object(Payment, "check_status", _check_status)
+    mocker.patch.object(PendingPaymentsReconciler, "page_size", 2)
+    # all pending payments of the test database are checked in one pass
+    mocker.patch.object(PendingPaymentsReconciler, "checks_per_worker", 10_000)
+    # nothing checked in the first pass is due again in the second one
+    mocker.patch.object(settings, "lnbits_pending_check_min_interval", 600)
+    payments = [await _create_pending_payment(to_wallet) for _ in range(3)]
+    reconciler = PendingPaymentsReconciler()
+    load = mocker.spy(tasks, "get_payments_paginated")
+
+    stats = await reconciler.run_pass()
+    assert stats["full_scan"] is True
+    assert stats["checked"] >= len(payments)
+    assert load.call_count >= 2
+
+    new = await _create_pending_payment(to_wallet)
+    stats = await reconciler.run_pass()
+    assert stats["full_scan"] is False
+    assert new.checking_id in reconciler.last_checked
+    # from the stats, the reconciler of the app can load payments meanwhile
+    assert stats["since"] >= stats["started_at"] - 120
+
+
+@pytest.mark.asyncio
+async def test_reconciler_backs_off_old_payments(app, to_wallet: Wallet):
+    reconciler = PendingPaymentsReconciler()
+    now = datetime.now(timezone.utc).timestamp()
+    old = await _create_pending_payment(to_wallet, age=60 * 60)
+    new = await _create_pending_payment(to_wallet)
+    reconciler.last_checked[old.checking_id] = now - 60
+    reconciler.last_checked[new.checking_id] = now - 60
+    # the new payment is due again, the old one backed off
+    assert reconciler.is_due(new, now)
+    assert not reconciler.is_due(old, now)
+
+
+@pytest.mark.asyncio
+async def test_update_pending_payments_in_background(
+    app, to_user: User, mocker: MockerFixture
+):
+    # a wallet of its own, the check settles every pending payment of the wallet
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="pending_update")
+    payment = await _create_pending_payment(wallet)
+    mocker.patch.dict(payments_service._pending_updated, {"expired": 0})
+    mocker.patch.dict(payments_service._pending_update_tasks)
+
+    async def _check_status(self: Payment):
+        return PaymentSuccessStatus(fee_msat=0, preimage="00" * 32)
+
+    mocker.patch.object(Payment, "check_status", _check_status)
+    send_data = mocker.spy(websocket_manager, "send_data")
+
+    task = update_pending_payments_in_background(wallet.id)
+    assert task
+    assert "expired" not in payments_service._pending_updated
+    # deduplicated while running and while the result is fresh
+    assert update_pending_payments_in_background(wallet.id) is None
+    await task
+    assert update_pending_payments_in_background(wallet.id) is None
+
+    updated = await get_standalone_payment(payment.checking_id)
+    assert updated
+    assert updated.success
+    sent_to = [call.args[1] for call in send_data.call_args_list]
+    assert wallet.inkey in sent_to
+    assert payment.payment_hash in sent_to
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from lnbits.pubsub import PostgresPubSub, PubSub, UnixSocketPubSub
+
+
+async def _wait_for(condition, timeout: float = 5):
+    for _ in range(int(timeout / 0.02)):
+        if condition():
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError("condition not met")
+
+
+@pytest.mark.asyncio
+async def test_local_pubsub():
+    pubsub = PubSub()
+    received: list[str] = []
+
+    async def _handler(message: str):
+        received.append(message)
+
+    pubsub.subscribe("test", _handler)
+    await pubsub.publish("test", "hello")
+    await pubsub.publish("other", "ignored")
+    assert received == ["hello"]
+
+
+@pytest.mark.asyncio
+async def test_pubsub_message_size_limits(tmp_path):
+    assert PubSub().fits("test", "x" * 10_000)
+    assert PostgresPubSub().fits("test", "x" * 7999)
+    assert not PostgresPubSub().fits("test", "x" * 8000)
+
+    pubsub = UnixSocketPubSub(str(tmp_path / "pubsub.sock"))
+    assert pubsub.fits("test", "x" * 1000)
+    assert not pubsub.fits("test", "x" * pubsub.max_line)
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_pubsub(tmp_path):
+    path = str(tmp_path / "pubsub.sock")
+    first, second = UnixSocketPubSub(path), UnixSocketPubSub(path)
+    received: dict[str, list[str]] = {"first": [], "second": []}
+
+    def _handler(name: str):
+        async def _receive(message: str):
+            received[name].append(message)
+
+        return _receive
+
+    first.subscribe("test", _handler("first"))
+    second.subscribe("test", _handler("second"))
+    first_task = asyncio.create_task(first.run_forever())
+    await _wait_for(lambda: first.stats()["connected"])
+    second_task = asyncio.create_task(second.run_forever())
+    await _wait_for(lambda: second.stats()["connected"])
+    try:
+        assert first.is_broker
+        assert not second.is_broker
+
+        await second.publish("test", "hello")
+        await _wait_for(lambda: received["first"] and received["second"])
+        assert received == {"first": ["hello"], "second": ["hello"]}
+
+        # the other process takes over when the broker exits
+        first_task.cancel()
+        await first.close()
+        await _wait_for(lambda: second.is_broker and second.stats()["connected"])
+        await second.publish("test", "again")
+        await _wait_for(lambda: len(received["second"]) == 2)
+    finally:
+        first_task.cancel()
+        second_task.cancel()
+        await first.close()
+        await second.close()
@@ -0,0 +1,74 @@
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.crud import get_standalone_payment, get_wallet
+from lnbits.core.models import Wallet
+from lnbits.core.services import create_invoices
+from lnbits.db import Connection
+from lnbits.exceptions import InvoiceError
+from lnbits.settings import Settings
+from lnbits.wallets.base import InvoiceResponse
+from lnbits.wallets.fake import FakeWallet
+
+
+@pytest.mark.asyncio
+async def test_create_invoices(app, to_wallet: Wallet, mocker: MockerFixture):
+    before = await get_wallet(to_wallet.id)
+    assert before
+    insert_many = mocker.spy(Connection, "insert_many")
+    result = await create_invoices(
+        wallet_id=to_wallet.id, amounts=[10, 20, 30], memo="batch", internal=True
+    )
+    payments = result.invoices
+
+    assert result.error is None
+    assert insert_many.call_count == 1
+    assert [payment.sat for payment in payments] == [10, 20, 30]
+    assert len({payment.payment_hash for payment in payments}) == 3
+    for payment in payments:
+        saved = await get_standalone_payment(payment.checking_id)
+        assert saved
+        assert saved.pending
+        assert saved.bolt11 == payment.bolt11
+        assert saved.memo == "batch"
+
+    wallet = await get_wallet(to_wallet.id)
+    assert wallet
+    assert wallet.balance_msat == before.balance_msat
+
+
+@pytest.mark.asyncio
+async def test_create_invoices_stops_after_failure(
+    app, to_wallet: Wallet, mocker: MockerFixture, settings: Settings
+):
+    mocker.patch.object(settings, "lnbits_batch_payments_concurrency", 1)
+    create_invoice = FakeWallet.create_invoice
+    calls = 0
+
+    async def _create_invoice(self, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            return InvoiceResponse(ok=False, error_message="backend down")
+        return await create_invoice(self, *args, **kwargs)
+
+    mocker.patch.object(FakeWallet, "create_invoice", _create_invoice)
+    insert_many = mocker.spy(Connection, "insert_many")
+    result = await create_invoices(
+        wallet_id=to_wallet.id, amounts=[10, 20, 30], memo="batch", internal=True
+    )
+    assert result.error == "backend down"
+    # the third invoice is not requested, the first one is saved and returned
+    assert calls == 2
+    assert insert_many.call_count == 1
+    saved = insert_many.call_args.args[2]
+    assert [payment.sat for payment in saved] == [10]
+    assert [payment.checking_id for payment in result.invoices] == [
+        saved[0].checking_id
+    ]
+    assert await get_standalone_payment(saved[0].checking_id)
+
+    with pytest.raises(InvoiceError, match="Amountless invoices not supported."):
+        await create_invoices(
+            wallet_id=to_wallet.id, amounts=[10, 0], memo="batch", internal=True
+        )
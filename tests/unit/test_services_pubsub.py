@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.db import core_app_extra
+from lnbits.core.models.extensions import Extension
+from lnbits.core.services.extensions import _on_extensions_message
+from lnbits.core.services.funding_source import (
+    _on_funding_source_message,
+    switch_to_voidwallet,
+)
+from lnbits.core.services.settings import _on_settings_message
+from lnbits.pubsub import pubsub
+from lnbits.settings import Settings
+
+# messages of another LNbits process
+OTHER_PID = os.getpid() + 1
+
+
+@pytest.mark.asyncio
+async def test_settings_update_of_other_process(
+    app, settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "lnbits_site_title", "not saved")
+    mocker.patch.object(settings, "first_install", True)
+    ratelimiter = mocker.patch.object(core_app_extra, "register_new_ratelimiter")
+
+    own = {"pid": os.getpid(), "values": {"first_install": False}}
+    await _on_settings_message(json.dumps(own))
+    assert settings.lnbits_site_title == "not saved"
+    assert settings.first_install
+
+    other = {"pid": OTHER_PID, "values": {"first_install": False}}
+    await _on_settings_message(json.dumps(other))
+    # loaded from the database again
+    assert settings.lnbits_site_title != "not saved"
+    assert not settings.first_install
+    ratelimiter.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_switch_to_voidwallet_in_all_processes(
+    settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "lnbits_backend_wallet_class", "FakeWallet")
+    set_funding_source = mocker.patch(
+        "lnbits.core.services.funding_source.set_funding_source"
+    )
+    publish = mocker.spy(pubsub, "publish")
+
+    await switch_to_voidwallet()
+    set_funding_source.assert_called_once_with("VoidWallet")
+    assert settings.lnbits_backend_wallet_class == "VoidWallet"
+    message = json.loads(publish.call_args.args[1])
+    assert message == {"pid": os.getpid(), "class_name": "VoidWallet"}
+
+    settings.lnbits_backend_wallet_class = "FakeWallet"
+    set_funding_source.reset_mock()
+    other = {"pid": OTHER_PID, "class_name": "VoidWallet"}
+    await _on_funding_source_message(json.dumps(other))
+    set_funding_source.assert_called_once_with("VoidWallet")
+    assert settings.lnbits_backend_wallet_class == "VoidWallet"
+
+
+@pytest.mark.asyncio
+async def test_extension_changes_of_other_process(
+    app, settings: Settings, mocker: MockerFixture
+):
+    register = mocker.patch.object(core_app_extra, "register_new_ext_routes")
+    stop = mocker.patch(
+        "lnbits.core.services.extensions.stop_extension_background_work"
+    )
+    mocker.patch.object(settings, "lnbits_deactivated_extensions", set())
+    ext = Extension(code="test_ext", is_valid=True)
+
+    def _message(action: str) -> str:
+        return json.dumps(
+            {
+                "pid": OTHER_PID,
+                "action": action,
+                "ext_id": ext.code,
+                "extension": ext.dict() if action == "activate" else None,
+            }
+        )
+
+    await _on_extensions_message(_message("activate"))
+    register.assert_called_once_with(ext)
+
+    await _on_extensions_message(_message("deactivate"))
+    assert "test_ext" in settings.lnbits_deactivated_extensions
+    stop.assert_not_called()
+
+    await _on_extensions_message(_message("uninstall"))
+    stop.assert_called_once_with("test_ext")
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import httpx
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.crud import (
+    claim_due_webhook_deliveries,
+    create_payment,
+    get_standalone_payment,
+    get_stuck_webhook_deliveries,
+)
+from lnbits.core.models import CreatePayment, Payment, Wallet, WebhookStatus
+from lnbits.core.services.webhooks import WebhookOutbox, webhook_outbox
+from lnbits.settings import Settings
+
+
+async def _create_payment(wallet: Wallet, webhook: str) -> Payment:
+    return await create_payment(
+        checking_id=uuid4().hex,
+        data=CreatePayment(
+            wallet_id=wallet.id,
+            payment_hash=uuid4().hex,
+            bolt11="lnbc1webhook",
+            amount_msat=1000,
+            memo="webhook",
+            webhook=webhook,
+        ),
+    )
+
+
+def _outbox(
+    mocker: MockerFixture, responses: dict[str, list[int]], requests: list[str]
+) -> WebhookOutbox:
+    # the outbox of the app must not deliver the test webhooks
+    mocker.patch.object(webhook_outbox, "process", AsyncMock(return_value=0))
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.host)
+        codes = responses[request.url.host]
+        code = codes.pop(0) if len(codes) > 1 else codes[0]
+        if code == 0:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(code)
+
+    return WebhookOutbox(httpx.AsyncClient(transport=httpx.MockTransport(_handler)))
+
+
+@pytest.mark.asyncio
+async def test_webhook_outbox_delivers_and_retries(
+    app, to_wallet: Wallet, mocker: MockerFixture, settings: Settings
+):
+    mocker.patch.object(settings, "webhook_retry_delay", 0)
+    mocker.patch.object(settings, "webhook_max_attempts", 3)
+    requests: list[str] = []
+    outbox = _outbox(
+        mocker,
+        {"ok.example": [200], "flaky.example": [500, 200], "gone.example": [404]},
+        requests,
+    )
+    ok = await _create_payment(to_wallet, "https://ok.example/hook")
+    flaky = await _create_payment(to_wallet, "https://flaky.example/hook")
+    gone = await _create_payment(to_wallet, "https://gone.example/hook")
+    deliveries = {}
+    for payment in [ok, flaky, gone]:
+        delivery = await outbox.enqueue(payment)
+        assert delivery
+        assert delivery.payload["payment_hash"] == payment.payment_hash
+        deliveries[payment.payment_hash] = delivery
+
+    for _ in range(3):
+        await outbox.process()
+        await outbox.wait_idle()
+
+    assert requests.count("ok.example") == 1
+    assert requests.count("flaky.example") == 2
+    # client errors are not retried
+    assert requests.count("gone.example") == 1
+
+    for payment, status in [(ok, 200), (flaky, 200), (gone, 404)]:
+        saved = await get_standalone_payment(payment.checking_id)
+        assert saved
+        assert saved.webhook_status == status
+
+    stuck = {
+        delivery.payment_hash: delivery
+        for delivery in await get_stuck_webhook_deliveries(limit=1000)
+    }
+    assert stuck[gone.payment_hash].status == WebhookStatus.FAILED.value
+    assert stuck[gone.payment_hash].attempts == 1
+    assert flaky.payment_hash not in stuck
+    assert ok.payment_hash not in stuck
+    await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_webhook_outbox_circuit_breaker(
+    app, to_wallet: Wallet, mocker: MockerFixture, settings: Settings
+):
+    mocker.patch.object(settings, "webhook_retry_delay", 0)
+    mocker.patch.object(settings, "webhook_circuit_failures", 2)
+    mocker.patch.object(settings, "webhook_circuit_cooldown", 60)
+    requests: list[str] = []
+    outbox = _outbox(mocker, {"down.example": [0]}, requests)
+    for _ in range(4):
+        payment = await _create_payment(to_wallet, "https://down.example/hook")
+        await outbox.enqueue(payment)
+
+    mocker.patch.object(settings, "webhook_host_concurrency", 1)
+    for _ in range(3):
+        await outbox.process()
+        await outbox.wait_idle()
+
+    # after two failures in a row the host is not tried anymore
+    assert requests.count("down.example") == 2
+    assert "down.example" in outbox.stats()["open_circuits"]
+    await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_webhook_outbox_deliveries_are_claimed_once(
+    app, to_wallet: Wallet, mocker: MockerFixture
+):
+    requests: list[str] = []
+    first = _outbox(mocker, {"once.example": [200]}, requests)
+    second = _outbox(mocker, {"once.example": [200]}, requests)
+    for _ in range(3):
+        payment = await _create_payment(to_wallet, "https://once.example/hook")
+        await first.enqueue(payment)
+
+    claimed = await asyncio.gather(first.process(), second.process())
+    assert sum(claimed) == 3
+    await asyncio.gather(first.wait_idle(), second.wait_idle())
+    assert requests.count("once.example") == 3
+
+    # a claimed delivery is not due again until its lease runs out
+    payment = await _create_payment(to_wallet, "https://once.example/hook")
+    await first.enqueue(payment)
+    lease_until = datetime.now(timezone.utc) + timedelta(minutes=5)
+    assert len(await claim_due_webhook_deliveries(1000, lease_until)) == 1
+    assert await claim_due_webhook_deliveries(1000, lease_until) == []
+    await first.close()
+    await second.close()
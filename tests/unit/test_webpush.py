@@ -0,0 +1,69 @@
+import base64
+import json
+import os
+from uuid import uuid4
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from lnbits.core.crud import (
+    create_webpush_subscription,
+    get_webpush_subscriptions_for_user,
+)
+from lnbits.core.models import User, WebPushSubscription
+from lnbits.core.services.webpush import PushNotification, WebPushSender
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().strip("=")
+
+
+async def _create_subscription(user: User, host: str) -> WebPushSubscription:
+    public_key = ec.generate_private_key(ec.SECP256R1()).public_key()
+    endpoint = f"https://{host}/push/{uuid4().hex}"
+    data = {
+        "endpoint": endpoint,
+        "keys": {
+            "p256dh": _b64(
+                public_key.public_bytes(
+                    serialization.Encoding.X962,
+                    serialization.PublicFormat.UncompressedPoint,
+                )
+            ),
+            "auth": _b64(os.urandom(16)),
+        },
+    }
+    return await create_webpush_subscription(
+        endpoint, user.id, json.dumps(data), "lnbits.test"
+    )
+
+
+@pytest.mark.asyncio
+async def test_webpush_sender_deletes_gone_subscriptions(from_user: User):
+    requests: list[httpx.Request] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(410 if request.url.host == "gone.test" else 201)
+
+    sender = WebPushSender(httpx.AsyncClient(transport=httpx.MockTransport(_handler)))
+    subscriptions = [
+        await _create_subscription(from_user, "push.test"),
+        await _create_subscription(from_user, "gone.test"),
+        await _create_subscription(from_user, "gone.test"),
+    ]
+
+    await sender.send_all([PushNotification(s, "title", "body") for s in subscriptions])
+
+    assert len(requests) == 3
+    for request in requests:
+        assert request.headers["content-encoding"] == "aes128gcm"
+        assert request.headers["authorization"].startswith("vapid t=")
+        assert request.content
+    remaining = await get_webpush_subscriptions_for_user(from_user.id)
+    endpoints = [s.endpoint for s in remaining]
+    assert subscriptions[0].endpoint in endpoints
+    assert subscriptions[1].endpoint not in endpoints
+    assert subscriptions[2].endpoint not in endpoints
@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.models import Payment
+from lnbits.core.services.payments import send_payment_notification
+from lnbits.core.services.websockets import WebsocketConnectionManager
+from lnbits.pubsub import pubsub
+from lnbits.settings import Settings
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.messages: list[str] = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        self.messages.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_websocket_manager_sends_to_item_only():
+    manager = WebsocketConnectionManager()
+    first, second, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await manager.connect(first, "item")  # type: ignore
+    await manager.connect(second, "item")  # type: ignore
+    await manager.connect(other, "other")  # type: ignore
+
+    await manager.send_local("hello", "item")
+
+    assert first.messages == ["hello"]
+    assert second.messages == ["hello"]
+    assert other.messages == []
+
+    manager.disconnect(first)  # type: ignore
+    manager.disconnect(first)  # type: ignore
+    manager.disconnect(other)  # type: ignore
+    await manager.send_local("again", "item")
+    assert first.messages == ["hello"]
+    assert manager.stats() == {
+        "connections": 1,
+        "items": 1,
+        "messages_sent": 3,
+        "evicted": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_websocket_manager_evicts_slow_socket(
+    settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "websocket_send_timeout", 0.05)
+    manager = WebsocketConnectionManager()
+    slow, fast = FakeWebSocket(delay=10), FakeWebSocket()
+    await manager.connect(slow, "item")  # type: ignore
+    await manager.connect(fast, "item")  # type: ignore
+
+    await asyncio.wait_for(manager.send_local("hello", "item"), 1)
+
+    assert fast.messages == ["hello"]
+    assert slow.closed
+    assert manager.active_connections["item"] == {fast}
+    assert manager.stats()["evicted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_payment_notification_fits_pubsub(mocker: MockerFixture):
+    mocker.patch.object(
+        pubsub, "fits", side_effect=lambda _, message: len(message) < 2000
+    )
+    publish = mocker.spy(pubsub, "publish")
+    wallet = mocker.Mock(balance=21, inkey="inkey")
+    payment = Payment(
+        checking_id="checking_id",
+        payment_hash="payment_hash",
+        wallet_id="wallet",
+        amount=1000,
+        fee=0,
+        bolt11="lnbc1",
+        extra={"comment": "x" * 10_000},
+    )
+
+    await send_payment_notification(wallet, payment)
+
+    channel, data = publish.call_args_list[0].args
+    assert channel == "websocket"
+    message = json.loads(json.loads(data)["message"])
+    assert message["wallet_balance"] == 21
+    assert message["payment"]["checking_id"] == "checking_id"
+    assert "extra" not in message["payment"]
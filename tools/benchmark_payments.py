@@ -0,0 +1,65 @@
+# Benchmark of internal payments per second, compares the payment service with
+# deferred commits (`db.transaction()`) and with a commit after every statement.
+#
+# usage: LNBITS_DATA_FOLDER=/tmp/lnbits-benchmark \
+#     poetry run python tools/benchmark_payments.py [payments]
+#
+# run it against an empty data folder or database, it creates users and wallets.
+
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from loguru import logger
+
+from lnbits.core.crud import create_wallet
+from lnbits.core.helpers import migrate_databases
+from lnbits.core.services import (
+    create_invoice,
+    create_user_account,
+    pay_invoice,
+    update_wallet_balance,
+)
+from lnbits.db import Connection
+
+payments_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+
+@asynccontextmanager
+async def commit_per_statement(self: Connection):
+    # the behaviour before `transaction()`, every statement commits on its own
+    yield self
+
+
+async def run_payments(from_wallet_id: str, to_wallet_id: str) -> float:
+    elapsed = 0.0
+    for i in range(payments_count):
+        invoice = await create_invoice(
+            wallet_id=to_wallet_id, amount=10, memo=f"benchmark {i}", internal=True
+        )
+        start = time.perf_counter()
+        await pay_invoice(wallet_id=from_wallet_id, payment_request=invoice.bolt11)
+        elapsed += time.perf_counter() - start
+    return payments_count / elapsed
+
+
+async def main():
+    logger.remove()
+    await migrate_databases()
+    user = await create_user_account()
+    from_wallet = await create_wallet(user_id=user.id, wallet_name="benchmark from")
+    to_wallet = await create_wallet(user_id=user.id, wallet_name="benchmark to")
+    await update_wallet_balance(from_wallet.id, payments_count * 100)
+
+    transaction = Connection.transaction
+    Connection.transaction = commit_per_statement  # type: ignore
+    before = await run_payments(from_wallet.id, to_wallet.id)
+    Connection.transaction = transaction  # type: ignore
+    after = await run_payments(from_wallet.id, to_wallet.id)
+
+    print(f"commit per statement: {before:8.1f} payments/s")
+    print(f"         transaction: {after:8.1f} payments/s")
+
+
+asyncio.run(main())
@@ -0,0 +1,91 @@
+# Micro-benchmark of decoding database rows into models,
+# compares `lnbits.db.dict_to_model` with the previous implementation.
+#
+# usage: poetry run python tools/benchmark_row_decoding.py [rows] [rounds]
+
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from lnbits.core.models import Payment
+from lnbits.db import DB_TYPE, SQLITE, dict_to_model
+
+rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+def legacy_dict_to_model(_row: dict, model: type[BaseModel]) -> BaseModel:
+    # the previous `dict_to_model`, only the parts needed for `Payment`
+    _dict: dict = {}
+    for key, value in _row.items():
+        if value is None:
+            continue
+        if key not in model.__fields__:
+            continue
+        type_ = model.__fields__[key].type_
+        if issubclass(type_, bool):
+            _dict[key] = bool(value)
+            continue
+        if issubclass(type_, datetime):
+            if DB_TYPE == SQLITE:
+                _dict[key] = datetime.fromtimestamp(value, timezone.utc)
+            else:
+                _dict[key] = value
+            continue
+        if type_ is dict and value:
+            _dict[key] = json.loads(value)
+            continue
+        _dict[key] = value
+    _model = model.construct(**_dict)
+    _model.__init__(**_dict)  # type: ignore
+    return _model
+
+
+now = datetime.now(timezone.utc).timestamp()
+rows: list[dict] = [
+    {
+        "checking_id": uuid4().hex,
+        "payment_hash": uuid4().hex,
+        "wallet_id": uuid4().hex,
+        "amount": 1000 * i,
+        "fee": -i,
+        "bolt11": "lnbc1" + "x" * 300,
+        "status": "success",
+        "memo": f"payment {i}",
+        "expiry": now + 3600,
+        "webhook": None,
+        "webhook_status": None,
+        "preimage": uuid4().hex,
+        "tag": "lnurlp",
+        "extension": "lnurlp",
+        "time": now,
+        "created_at": now,
+        "updated_at": now,
+        "extra": json.dumps({"tag": "lnurlp", "comment": "thanks"}),
+    }
+    for i in range(rows_count)
+]
+
+if DB_TYPE != SQLITE:
+    for row in rows:
+        for key in ("expiry", "time", "created_at", "updated_at"):
+            row[key] = datetime.fromtimestamp(row[key], timezone.utc)
+
+assert [legacy_dict_to_model(row, Payment) for row in rows] == [
+    dict_to_model(row, Payment) for row in rows
+]
+
+for name, decode in (
+    ("legacy", legacy_dict_to_model),
+    ("dict_to_model", dict_to_model),
+):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for row in rows:
+            decode(row, Payment)
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{name:>14}: {elapsed * 1000:8.2f} ms per {rows_count} payments")
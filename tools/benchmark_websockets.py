@@ -0,0 +1,89 @@
+# Benchmark of sending websocket messages with simulated sockets, compares
+# `WebsocketConnectionManager` with the previous implementation which scanned
+# all connections and sent the messages one after the other.
+#
+# usage: poetry run python tools/benchmark_websockets.py [sockets] [subscribers]
+
+import asyncio
+import sys
+import time
+
+from loguru import logger
+
+from lnbits.core.services.websockets import WebsocketConnectionManager
+from lnbits.settings import settings
+
+sockets_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+subscribers = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+# every socket takes this long to receive a message
+send_delay = 0.001
+# one subscriber is stalled
+stalled_delay = 1
+
+
+class FakeWebSocket:
+    def __init__(self, item_id: str, delay: float = send_delay) -> None:
+        self.path_params = {"item_id": item_id}
+        self.delay = delay
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, _: str):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+class LegacyConnectionManager:
+    # the previous `WebsocketConnectionManager`
+    def __init__(self) -> None:
+        self.active_connections: list = []
+
+    async def connect(self, websocket, item_id: str):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+
+    async def send_data(self, message: str, item_id: str):
+        for connection in self.active_connections:
+            if connection.path_params["item_id"] == item_id:
+                await connection.send_text(message)
+
+
+async def run(manager) -> None:
+    for i in range(sockets_count - subscribers):
+        await manager.connect(FakeWebSocket(f"item_{i}"), f"item_{i}")
+    for i in range(subscribers):
+        delay = stalled_delay if i == 0 else send_delay
+        await manager.connect(FakeWebSocket("hot", delay), "hot")
+
+    # the current manager publishes `send_data` to all processes
+    send = getattr(manager, "send_local", manager.send_data)
+    start = time.perf_counter()
+    await send("paid", "hot")
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(100):
+        await send("paid", "hot")
+    rest = (time.perf_counter() - start) / 100
+
+    name = manager.__class__.__name__
+    print(
+        f"{name:>28}: first message {first * 1000:8.2f} ms, "
+        f"then {rest * 1000:8.2f} ms per message"
+    )
+
+
+async def main() -> None:
+    logger.remove()
+    settings.websocket_send_timeout = 0.1
+    print(f"{sockets_count} sockets, {subscribers} subscribers, one stalled")
+    await run(LegacyConnectionManager())
+    await run(WebsocketConnectionManager())
+
+
+asyncio.run(main())